@@ -0,0 +1,175 @@
+"""
+Archivo de mensajes viejos.
+
+``archivar`` saca de ``Mensaje`` los mensajes de cada chat anteriores a
+``DIAS`` días y los guarda en filas ``BloqueMensajes``: hasta
+``TAMANO_BLOQUE`` mensajes consecutivos como JSON por línea comprimido con
+zlib. Los ``RETENER`` más nuevos de cada chat nunca se archivan, así que la
+primera página del chat y el polling siguen saliendo de la tabla caliente,
+que queda chica junto con su índice (chat_id, id).
+
+Lo archivado es siempre un prefijo de la historia de cada chat: todos sus
+ids son menores que los de la tabla caliente. Por eso hacia atrás
+``completar`` solo mira el archivo cuando la página de la tabla caliente
+quedó corta, y hacia adelante cuando ``since_id`` cae en lo archivado. Los
+bloques se descomprimen al pedirlos y quedan en la caché de ``cache`` por
+id (son inmutables). La lista de bloques de un chat no se cachea: la
+cambia ``archivar_mensajes`` desde otro proceso, y la caché por defecto
+es de cada proceso; es una consulta por el índice (chat_id, desde_id).
+
+``zlib`` y no zstd: está en la biblioteca estándar y con JSON de mensajes
+cortos la diferencia de tamaño es chica.
+"""
+
+import json
+import zlib
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import cache
+from .models import BloqueMensajes, Mensaje
+
+
+def _config():
+    return {
+        'DIAS': 90,
+        'RETENER': 200,
+        'TAMANO_BLOQUE': 500,
+        **getattr(settings, 'SWAPPLACE_ARCHIVO', {}),
+    }
+
+
+def comprimir(filas):
+    lineas = (json.dumps({**f, 'fecha': f['fecha'].isoformat()}, ensure_ascii=False) for f in filas)
+    return zlib.compress('\n'.join(lineas).encode('utf-8'))
+
+
+def descomprimir(datos):
+    return [json.loads(linea) for linea in zlib.decompress(bytes(datos)).decode('utf-8').splitlines()]
+
+
+# ---------- ARCHIVAR ----------
+def _corte(chat_id, antes_de, retener):
+    """Primer id que queda en caliente: todo lo anterior se puede archivar."""
+    ids = list(Mensaje.objects.filter(chat_id=chat_id).order_by('-id').values_list('id', flat=True)[retener - 1:retener])
+    if not ids:
+        return 0
+    nuevo = (Mensaje.objects.filter(chat_id=chat_id, fecha__gte=antes_de)
+             .order_by('id').values_list('id', flat=True).first())
+    return min(ids[0], nuevo) if nuevo else ids[0]
+
+
+def archivar_chat(chat_id, antes_de, retener=None, tamano=None):
+    """Archiva un chat por bloques, cada uno en su transacción. Devuelve ``(bloques, mensajes)``."""
+    conf = _config()
+    retener = max(1, conf['RETENER'] if retener is None else retener)
+    tamano = tamano or conf['TAMANO_BLOQUE']
+    corte = _corte(chat_id, antes_de, retener)
+    bloques = movidos = 0
+    while corte:
+        with transaction.atomic():
+            filas = list(Mensaje.objects.filter(chat_id=chat_id, id__lt=corte).order_by('id')
+                         .values('id', 'autor_id', 'contenido', 'fecha')[:tamano])
+            # un resto chico espera a juntar más: así no se llena de bloques mínimos
+            if not filas or (len(filas) < tamano // 5 and not bloques):
+                break
+            BloqueMensajes.objects.create(
+                chat_id=chat_id, desde_id=filas[0]['id'], hasta_id=filas[-1]['id'],
+                cantidad=len(filas), datos=comprimir(filas),
+            )
+            # sin señales de borrado ni filas que dependan de los mensajes:
+            # Django lo resuelve con un solo DELETE
+            Mensaje.objects.filter(id__in=[f['id'] for f in filas]).delete()
+        bloques += 1
+        movidos += len(filas)
+        if len(filas) < tamano:
+            break
+    return bloques, movidos
+
+
+def archivar(antes_de, retener=None, tamano=None, max_chats=None):
+    """Archiva todos los chats con mensajes anteriores a ``antes_de``. Devuelve ``(chats, bloques, mensajes)``."""
+    chats = (Mensaje.objects.filter(fecha__lt=antes_de).order_by('chat_id')
+             .values_list('chat_id', flat=True).distinct())
+    if max_chats:
+        chats = chats[:max_chats]
+    totales = [0, 0, 0]
+    for chat_id in list(chats):
+        bloques, mensajes = archivar_chat(chat_id, antes_de, retener, tamano)
+        if bloques:
+            totales[0] += 1
+            totales[1] += bloques
+            totales[2] += mensajes
+    return tuple(totales)
+
+
+# ---------- LEER ----------
+def _bloques(chat_id):
+    # [(id, desde_id, hasta_id)] en orden
+    return list(BloqueMensajes.objects.filter(chat_id=chat_id).order_by('desde_id')
+                .values_list('id', 'desde_id', 'hasta_id'))
+
+
+def _filas(bloque_id):
+    return cache.cacheado(['archivo'], f'bloque:{bloque_id}', lambda: descomprimir(
+        BloqueMensajes.objects.filter(id=bloque_id).values_list('datos', flat=True).get()))
+
+
+def hasta(chat_id, bloques=None):
+    """Id del último mensaje archivado del chat (0 si no hay)."""
+    bloques = _bloques(chat_id) if bloques is None else bloques
+    return bloques[-1][2] if bloques else 0
+
+
+def leer(chat_id, since_id=0, before_id=0, limite=50, bloques=None):
+    """Mensajes archivados, en el mismo orden que la consulta de la tabla caliente."""
+    bloques = _bloques(chat_id) if bloques is None else bloques
+    filas = []
+    if since_id:
+        for bloque_id, _, hasta_id in bloques:
+            if hasta_id > since_id:
+                filas += [f for f in _filas(bloque_id) if f['id'] > since_id]
+                if len(filas) >= limite:
+                    break
+    else:
+        for bloque_id, desde_id, _ in reversed(bloques):
+            if not before_id or desde_id < before_id:
+                filas += [f for f in reversed(_filas(bloque_id)) if not before_id or f['id'] < before_id]
+                if len(filas) >= limite:
+                    break
+    filas = filas[:limite]
+    autores = User.objects.only('id', 'username').in_bulk({f['autor_id'] for f in filas}) if filas else {}
+    # los mensajes de usuarios borrados se van con ellos, como en la tabla caliente
+    return [Mensaje(id=f['id'], chat_id=chat_id, autor=autores[f['autor_id']], contenido=f['contenido'],
+                    fecha=datetime.fromisoformat(f['fecha']))
+            for f in filas if f['autor_id'] in autores]
+
+
+def puede_faltar(msgs, since_id, limite):
+    """Si a una página de la tabla caliente (``limite + 1`` filas pedidas) le puede faltar algo del archivo."""
+    if since_id:
+        # lo archivado va antes que todo lo caliente: si no llegó nada nuevo,
+        # tampoco hay nada archivado después de since_id. Si llegó, aunque la
+        # página esté llena, lo archivado posterior a since_id va primero.
+        return bool(msgs)
+    # hacia atrás la página llena solo tiene ids calientes, mayores que
+    # cualquiera archivado: el archivo no entra en ella
+    return len(msgs) <= limite
+
+
+def completar(chat_id, msgs, since_id=0, before_id=0, limite=50):
+    """Mezcla el archivo con una página de la tabla caliente y la recorta a ``limite + 1``."""
+    if not puede_faltar(msgs, since_id, limite):
+        return msgs
+    bloques = _bloques(chat_id)
+    if since_id:
+        if since_id >= hasta(chat_id, bloques):
+            return msgs
+        return (leer(chat_id, since_id=since_id, limite=limite + 1, bloques=bloques) + msgs)[:limite + 1]
+    if not bloques:
+        return msgs
+    tope = msgs[-1].id if msgs else before_id
+    return msgs + leer(chat_id, before_id=tope, limite=limite + 1 - len(msgs), bloques=bloques)
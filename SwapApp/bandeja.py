@@ -0,0 +1,119 @@
+"""
+Bandeja de chats.
+
+Cada ``Chat`` guarda el id, la fecha y un extracto de su último mensaje, y
+cada participante tiene una fila ``ParticipanteChat`` con su cursor de
+lectura (``ultimo_leido_id``), su contador ``no_leidos`` y la actividad del
+chat copiada, para que la barra lateral salga de una sola consulta por el
+índice ``(usuario, -ultima_actividad)``.
+
+Todo se mantiene al crear cada ``Mensaje`` (señal ``post_save``, ver
+``signals.py``) con dos UPDATE, dentro de la transacción del mensaje. Las
+filas de participante siguen a ``Chat.usuarios`` vía ``m2m_changed``. Lo que
+se carga con ``bulk_create`` (``sembrado.py``) no emite señales: hay que
+llamar a ``reconstruir``.
+"""
+
+from django.db import transaction
+from django.db.models import Case, Count, F, PositiveBigIntegerField, PositiveIntegerField, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Chat, Mensaje, ParticipanteChat
+
+LARGO_VISTA_PREVIA = 120
+
+
+def _vista_previa(texto):
+    texto = ' '.join(texto.split())
+    if len(texto) <= LARGO_VISTA_PREVIA:
+        return texto
+    return texto[:LARGO_VISTA_PREVIA - 1] + '…'
+
+
+def es_participante(chat_id, usuario_id):
+    return ParticipanteChat.objects.filter(chat_id=chat_id, usuario_id=usuario_id).exists()
+
+
+async def aes_participante(chat_id, usuario_id):
+    return await ParticipanteChat.objects.filter(chat_id=chat_id, usuario_id=usuario_id).aexists()
+
+
+def chats_de(usuario_id):
+    """Chats del usuario por actividad reciente, con ``no_leidos`` en cada uno."""
+    participaciones = (ParticipanteChat.objects.filter(usuario_id=usuario_id)
+                       .select_related('chat__trueque__producto').order_by('-ultima_actividad'))
+    chats = []
+    for p in participaciones:
+        p.chat.no_leidos = p.no_leidos
+        chats.append(p.chat)
+    return chats
+
+
+def crear_mensaje(chat_id, autor, contenido):
+    # el mensaje y la bandeja se confirman juntos
+    with transaction.atomic():
+        return Mensaje.objects.create(chat_id=chat_id, autor=autor, contenido=contenido)
+
+
+def registrar_mensaje(mensaje):
+    Chat.objects.filter(id=mensaje.chat_id).update(
+        ultimo_mensaje_id=mensaje.id,
+        ultima_actividad=mensaje.fecha,
+        vista_previa=_vista_previa(mensaje.contenido),
+    )
+    # el autor queda al día; el resto suma uno
+    ParticipanteChat.objects.filter(chat_id=mensaje.chat_id).update(
+        ultima_actividad=mensaje.fecha,
+        no_leidos=Case(When(usuario_id=mensaje.autor_id, then=Value(0)),
+                       default=F('no_leidos') + 1, output_field=PositiveIntegerField()),
+        ultimo_leido_id=Case(When(usuario_id=mensaje.autor_id, then=Value(mensaje.id)),
+                             default=F('ultimo_leido_id'), output_field=PositiveBigIntegerField()),
+    )
+
+
+def marcar_leido(chat_id, usuario_id, hasta_id):
+    """Avanza el cursor de lectura hasta ``hasta_id`` (nunca retrocede).
+
+    Un solo UPDATE que además recalcula ``no_leidos`` con los mensajes
+    ajenos posteriores al cursor (normalmente ninguno). Si el cursor ya
+    estaba ahí no escribe nada, así el polling sin novedades no genera
+    escrituras. Devuelve si cambió.
+    """
+    quedan = (Mensaje.objects.filter(chat_id=chat_id, id__gt=hasta_id).exclude(autor_id=usuario_id)
+              .order_by().values('chat_id').annotate(n=Count('id')).values('n'))
+    return bool(ParticipanteChat.objects
+                .filter(chat_id=chat_id, usuario_id=usuario_id, ultimo_leido_id__lt=hasta_id)
+                .update(ultimo_leido_id=hasta_id, no_leidos=Coalesce(Subquery(quedan), 0)))
+
+
+def agregar_participantes(chat, usuario_ids):
+    ParticipanteChat.objects.bulk_create([
+        ParticipanteChat(chat=chat, usuario_id=uid, ultimo_leido_id=chat.ultimo_mensaje_id or 0,
+                         ultima_actividad=chat.ultima_actividad or chat.creado)
+        for uid in usuario_ids
+    ], ignore_conflicts=True)
+
+
+def reconstruir(chats=None):
+    """Recalcula resumen de último mensaje y participantes desde las tablas.
+
+    Los cursores de lectura que ya existían se conservan; los participantes
+    nuevos arrancan con todo leído.
+    """
+    qs = Chat.objects.prefetch_related('usuarios').order_by('id')
+    if chats is not None:
+        qs = qs.filter(id__in=[getattr(c, 'pk', c) for c in chats])
+    for chat in qs:
+        ultimo = chat.mensajes.order_by('-id').first()
+        if ultimo is not None:
+            chat.ultimo_mensaje_id = ultimo.id
+            chat.ultima_actividad = ultimo.fecha
+            chat.vista_previa = _vista_previa(ultimo.contenido)
+            chat.save(update_fields=['ultimo_mensaje_id', 'ultima_actividad', 'vista_previa'])
+        usuarios = {u.id for u in chat.usuarios.all()}
+        chat.participantes.exclude(usuario_id__in=usuarios).delete()
+        agregar_participantes(chat, usuarios)
+        for p in chat.participantes.all():
+            p.ultima_actividad = chat.ultima_actividad or chat.creado
+            p.no_leidos = chat.mensajes.filter(id__gt=p.ultimo_leido_id).exclude(autor_id=p.usuario_id).count()
+            p.save(update_fields=['ultima_actividad', 'no_leidos'])
@@ -0,0 +1,272 @@
+"""
+Benchmark de las vistas de SwapApp.
+
+Recorre cada URL de ``SwapApp/urls.py`` con el cliente de pruebas sobre un
+marketplace sintético (ver ``sembrado.py``) y mide por vista: número de
+consultas, tiempo en la base de datos, tiempo de render de plantillas,
+tiempo total y tamaño de la respuesta. La primera pasada se hace con la
+caché vacía (``frio``) y las siguientes con la caché caliente.
+
+``UMBRALES`` fija el máximo de consultas en frío por vista: si una vista
+los supera (típicamente un N+1) el reporte la marca como regresión. Lo
+usan el comando ``benchmark_vistas`` y los tests.
+"""
+
+import json
+import statistics
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+from django.template.backends.django import Template as TemplateDjango
+from django.test import Client
+from django.urls import URLPattern, reverse
+
+from . import cache, limites
+from . import urls as swap_urls
+from .models import Notificacion, Producto, Trueque
+
+# Máximo de consultas en frío por vista. Ninguno depende del tamaño del
+# catálogo ni del largo de los historiales. Las vistas de polling no leen
+# sesión ni usuario de la base (ver identidad.py).
+UMBRALES = {
+    'home': 6,
+    'login': 2,
+    'registro': 2,
+    'logout': 4,
+    'crear_producto': 8,
+    'editar_producto': 10,
+    'eliminar_producto': 12,
+    'buscar_productos': 6,
+    'api_productos': 5,
+    'ofrecer_trueque': 9,  # incluye la búsqueda de la notificación a agrupar
+    'aceptar_trueque': 13,
+    'rechazar_trueque': 7,
+    'api_sugerencias': 4,  # arma el grafo (1ª vez) + pedidos vigentes + productos
+    'chat_list': 5,
+    'chat_detalle': 10,
+    'api_send_message': 6,  # mensaje + resumen del chat + contadores de participantes
+    'api_fetch_messages': 4,
+    'api_stream_chat': 1,
+    'api_notificaciones': 2,
+    'api_marcar_leida': 4,
+    'api_marcar_todas': 5,
+    # get_or_create de la fila única (con su savepoint) + reputación bloqueada,
+    # que la primera vez también se crea
+    'reportar_chat': 14,
+    'calificar_chat': 14,
+    'api_metricas': 3,
+}
+
+
+class _Medidor:
+    def __init__(self):
+        self.consultas = 0
+        self.db = 0.0
+        self.render = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - inicio
+            self.consultas += 1
+
+
+@contextmanager
+def _medir():
+    medidor = _Medidor()
+    render_original = TemplateDjango.render
+
+    def render(self, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return render_original(self, *args, **kwargs)
+        finally:
+            medidor.render += time.perf_counter() - inicio
+
+    TemplateDjango.render = render
+    try:
+        # todas las bases: con réplicas configuradas las lecturas van a otro alias
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(medidor))
+            yield medidor
+    finally:
+        TemplateDjango.render = render_original
+
+
+def nombres_de_urls():
+    return [p.name for p in swap_urls.urlpatterns if isinstance(p, URLPattern) and p.name]
+
+
+class Casos:
+    """Petición a hacer para cada nombre de URL, con datos del marketplace."""
+
+    def __init__(self, mercado):
+        self.m = mercado
+        self.user = mercado.protagonista
+        self.chat = mercado.chats[0]
+        self.otros_productos = [p for p in mercado.productos if p.usuario_id != self.user.id]
+
+    def _pendiente(self):
+        return Trueque.objects.filter(receptor=self.user, estado='pendiente').order_by('id').first()
+
+    def _propio(self):
+        return (Producto.objects.filter(usuario=self.user).order_by('-id').first()
+                or Producto.objects.create(usuario=self.user, nombre='Bench', descripcion='bench'))
+
+    def home(self, i):
+        return 'get', reverse('home'), {}
+
+    def login(self, i):
+        return 'get', reverse('login'), {}
+
+    def registro(self, i):
+        return 'get', reverse('registro'), {}
+
+    def logout(self, i):
+        return 'get', reverse('logout'), {}
+
+    def crear_producto(self, i):
+        return 'accion', reverse('crear_producto'), {'nombre': f'Bench {i}', 'descripcion': 'producto de benchmark'}
+
+    def editar_producto(self, i):
+        p = self._propio()
+        return 'accion', reverse('editar_producto', args=[p.id]), {'nombre': p.nombre, 'descripcion': f'editado {i}'}
+
+    def eliminar_producto(self, i):
+        return 'accion', reverse('eliminar_producto', args=[self._propio().id]), {}
+
+    def buscar_productos(self, i):
+        return 'get', reverse('buscar_productos'), {'q': ('bici', 'mesa roja', 'cel')[i % 3]}
+
+    def api_productos(self, i):
+        return 'get', reverse('api_productos'), {}
+
+    def ofrecer_trueque(self, i):
+        p = self.otros_productos[i % len(self.otros_productos)]
+        return 'accion', reverse('ofrecer_trueque', args=[p.id]), {}
+
+    def aceptar_trueque(self, i):
+        return 'accion', reverse('aceptar_trueque', args=[self._pendiente().id]), {}
+
+    def rechazar_trueque(self, i):
+        return 'accion', reverse('rechazar_trueque', args=[self._pendiente().id]), {}
+
+    def api_sugerencias(self, i):
+        return 'get', reverse('api_sugerencias'), {}
+
+    def chat_list(self, i):
+        return 'get', reverse('chat_list'), {}
+
+    def chat_detalle(self, i):
+        return 'get', reverse('chat_detalle', args=[self.chat.id]), {}
+
+    def api_send_message(self, i):
+        return 'json', reverse('api_send_message', args=[self.chat.id]), {'texto': f'mensaje {i}'}
+
+    def api_fetch_messages(self, i):
+        ultimo = self.chat.mensajes.order_by('-id').values_list('id', flat=True).first() or 0
+        return 'get', reverse('api_fetch_messages', args=[self.chat.id]), {'since_id': max(ultimo - 5, 0)}
+
+    def api_stream_chat(self, i):
+        return 'get', reverse('api_stream_chat', args=[self.chat.id]), {}
+
+    def api_notificaciones(self, i):
+        return 'get', reverse('api_notificaciones'), {}
+
+    def api_marcar_leida(self, i):
+        n = Notificacion.objects.filter(usuario=self.user, visible=True).order_by('id').first()
+        return 'post', reverse('api_marcar_leida'), {'id': n.id if n else 0}
+
+    def api_marcar_todas(self, i):
+        return 'post', reverse('api_marcar_todas'), {}
+
+    def reportar_chat(self, i):
+        return 'post', reverse('reportar_chat', args=[self.chat.id]), {'motivo': 'benchmark'}
+
+    def calificar_chat(self, i):
+        return 'post', reverse('calificar_chat', args=[self.chat.id]), {'rating': 1 + i % 5}
+
+    def api_metricas(self, i):
+        return 'get', reverse('api_metricas'), {}
+
+
+# Vistas que cierran la sesión o no requieren usuario: van con su propio cliente.
+ANONIMAS = {'login', 'registro'}
+CIERRAN_SESION = {'logout'}
+# El stream SSE responde 503 fuera de ASGI (el cliente de pruebas es WSGI).
+ESTADOS_ESPERADOS = {'api_stream_chat': 503}
+
+
+def _peticion(cliente, metodo, url, datos):
+    if metodo == 'json':
+        return cliente.post(url, json.dumps(datos), content_type='application/json')
+    if metodo == 'accion':
+        # acciones del home tal como las envía home.html (fetch, respuesta JSON)
+        return cliente.post(url, datos, headers={'Accept': 'application/json'})
+    return getattr(cliente, metodo)(url, datos)
+
+
+def medir_vista(casos, nombre, repeticiones=5):
+    cliente = Client()
+    if nombre not in ANONIMAS:
+        cliente.force_login(casos.user)
+    muestras = []
+    for i in range(repeticiones):
+        if i == 0:
+            cache.obtener_cache().clear()
+        if nombre in CIERRAN_SESION and i:
+            cliente.force_login(casos.user)
+        metodo, url, datos = getattr(casos, nombre)(i)
+        # cada petición arranca con los cubos de limites.py llenos
+        limites.reiniciar()
+        with _medir() as medidor:
+            inicio = time.perf_counter()
+            response = _peticion(cliente, metodo, url, datos)
+            total = time.perf_counter() - inicio
+        cuerpo = b'' if response.streaming else response.content
+        muestras.append({
+            'status': response.status_code,
+            'consultas': medidor.consultas,
+            'db_ms': medidor.db * 1000,
+            'render_ms': medidor.render * 1000,
+            'total_ms': total * 1000,
+            'bytes': len(cuerpo),
+        })
+    frio, calientes = muestras[0], muestras[1:] or muestras
+    mediana = lambda k: round(statistics.median(m[k] for m in calientes), 3)
+    return {
+        'status': frio['status'],
+        'consultas': frio['consultas'],
+        'consultas_caliente': max(m['consultas'] for m in calientes),
+        'db_ms': mediana('db_ms'),
+        'render_ms': mediana('render_ms'),
+        'total_ms': mediana('total_ms'),
+        'total_frio_ms': round(frio['total_ms'], 3),
+        'bytes': frio['bytes'],
+    }
+
+
+def ejecutar(mercado, repeticiones=5, umbrales=None, nombres=None):
+    umbrales = {**UMBRALES, **(umbrales or {})}
+    casos = Casos(mercado)
+    todos = nombres_de_urls()
+    sin_caso = [n for n in todos if not hasattr(casos, n)]
+    if sin_caso:
+        raise ValueError(f'URLs sin caso de benchmark: {", ".join(sin_caso)}')
+    resultados = {}
+    regresiones = []
+    # las vistas que cierran sesión van al final para no afectar al resto
+    orden = sorted(nombres or todos, key=lambda n: n in CIERRAN_SESION)
+    for nombre in orden:
+        r = medir_vista(casos, nombre, repeticiones)
+        resultados[nombre] = r
+        maximo = umbrales.get(nombre)
+        if maximo is not None and r['consultas'] > maximo:
+            regresiones.append({'vista': nombre, 'consultas': r['consultas'], 'maximo': maximo})
+        if r['status'] >= 500 and r['status'] != ESTADOS_ESPERADOS.get(nombre):
+            regresiones.append({'vista': nombre, 'status': r['status']})
+    return {'resultados': resultados, 'regresiones': regresiones}
@@ -0,0 +1,152 @@
+"""
+Búsqueda de productos.
+
+El texto de cada producto (nombre, descripción y usuario dueño) se
+normaliza (minúsculas, sin tildes) y se guarda en un índice que se
+actualiza al guardar el ``Producto``. Las consultas buscan por prefijo
+para que funcione mientras el usuario escribe, y ordenan por relevancia
+(pesa más el nombre que el usuario y este más que la descripción).
+
+Backends (``settings.SWAPPLACE_BUSQUEDA``):
+
+* ``IndiceInvertido``: tabla ``TerminoBusqueda`` (término, producto, peso);
+  funciona en cualquier base de datos, incluida SQLite en los tests.
+* ``FullTextMySQL``: índice FULLTEXT de MySQL sobre ``DocumentoBusqueda``.
+* ``'auto'`` (por defecto) elige FullTextMySQL si la conexión es MySQL.
+"""
+
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, FloatField, IntegerField, Max, Q, Sum, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+PESOS = {'nombre': 3, 'usuario': 2, 'descripcion': 1}
+LONGITUD_MINIMA = 2
+LONGITUD_MAXIMA = 40
+MAX_TERMINOS_CONSULTA = 6
+
+_PALABRA = re.compile(r'[a-z0-9]+')
+
+
+def normalizar(texto):
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return texto.lower()
+
+
+def tokenizar(texto):
+    return [t[:LONGITUD_MAXIMA] for t in _PALABRA.findall(normalizar(texto))
+            if len(t) >= LONGITUD_MINIMA]
+
+
+def terminos(nombre, descripcion, usuario):
+    pesos = {}
+    for campo, texto in (('nombre', nombre), ('descripcion', descripcion), ('usuario', usuario)):
+        for t in set(tokenizar(texto)):
+            pesos[t] = pesos.get(t, 0) + PESOS[campo]
+    return pesos
+
+
+def documento(nombre, descripcion, usuario):
+    # Para FULLTEXT el peso se expresa repitiendo los campos importantes.
+    partes = [nombre] * PESOS['nombre'] + [usuario] * PESOS['usuario'] + [descripcion]
+    return ' '.join(' '.join(tokenizar(p)) for p in partes)
+
+
+def _prefijo(t):
+    # Rango en vez de LIKE 'x%': SQLite no usa índices con LIKE (no distingue
+    # mayúsculas). Los términos solo tienen [a-z0-9], y 'z' es el mayor.
+    return Q(termino__gte=t, termino__lte=t + 'z' * (LONGITUD_MAXIMA - len(t)))
+
+
+def _ordenar(ids, productos_qs):
+    productos = productos_qs.select_related('usuario__reputacion').in_bulk(ids)
+    return [productos[i] for i in ids if i in productos]
+
+
+class IndiceInvertido:
+    def indexar(self, producto):
+        from .models import TerminoBusqueda
+        pesos = terminos(producto.nombre, producto.descripcion, producto.usuario.username)
+        with transaction.atomic():
+            TerminoBusqueda.objects.filter(producto=producto).delete()
+            TerminoBusqueda.objects.bulk_create([
+                TerminoBusqueda(producto=producto, termino=t, peso=p) for t, p in pesos.items()
+            ])
+
+    def buscar(self, consulta, limite):
+        from .models import Producto, TerminoBusqueda
+        tokens = list(dict.fromkeys(tokenizar(consulta)))[:MAX_TERMINOS_CONSULTA]
+        if not tokens:
+            return None
+        filtro = Q()
+        coincide = {}
+        for i, t in enumerate(tokens):
+            filtro |= _prefijo(t)
+            coincide[f'c{i}'] = Max(Case(When(_prefijo(t), then=1),
+                                         default=0, output_field=IntegerField()))
+        # Un producto entra si cada palabra de la consulta es prefijo de
+        # alguno de sus términos; la relevancia es la suma de los pesos.
+        filas = (TerminoBusqueda.objects.filter(filtro)
+                 .values('producto_id')
+                 .annotate(puntaje=Sum('peso'), **coincide)
+                 .filter(**{k: 1 for k in coincide})
+                 .order_by('-puntaje', '-producto_id')[:limite])
+        return _ordenar([f['producto_id'] for f in filas], Producto.objects.all())
+
+
+class FullTextMySQL:
+    def indexar(self, producto):
+        from .models import DocumentoBusqueda
+        DocumentoBusqueda.objects.update_or_create(
+            producto=producto,
+            defaults={'texto': documento(producto.nombre, producto.descripcion, producto.usuario.username)},
+        )
+
+    def buscar(self, consulta, limite):
+        from .models import Producto, DocumentoBusqueda
+        tokens = list(dict.fromkeys(tokenizar(consulta)))[:MAX_TERMINOS_CONSULTA]
+        if not tokens:
+            return None
+        booleana = ' '.join(f'+{t}*' for t in tokens)
+        puntaje = RawSQL('MATCH(texto) AGAINST (%s IN BOOLEAN MODE)', [booleana],
+                         output_field=FloatField())
+        ids = list(DocumentoBusqueda.objects
+                   .annotate(puntaje=puntaje)
+                   .filter(puntaje__gt=0)
+                   .order_by('-puntaje', '-producto_id')
+                   .values_list('producto_id', flat=True)[:limite])
+        return _ordenar(ids, Producto.objects.all())
+
+
+_backend = None
+
+
+def obtener_backend():
+    global _backend
+    if _backend is None:
+        ruta = getattr(settings, 'SWAPPLACE_BUSQUEDA', 'auto')
+        if ruta == 'auto':
+            ruta = ('SwapApp.busqueda.FullTextMySQL' if connection.vendor == 'mysql'
+                    else 'SwapApp.busqueda.IndiceInvertido')
+        _backend = import_string(ruta)()
+    return _backend
+
+
+def indexar(producto):
+    obtener_backend().indexar(producto)
+
+
+def buscar(consulta, limite=100):
+    """Productos ordenados por relevancia, o los más recientes si no hay nada que buscar."""
+    from .models import Producto
+    # None: la consulta no tiene ninguna palabra indexable (vacía o p.ej. una
+    # sola letra mientras se escribe): se sigue mostrando lo último
+    resultado = obtener_backend().buscar(consulta, limite) if (consulta or '').strip() else None
+    if resultado is None:
+        return list(Producto.objects.select_related('usuario__reputacion').order_by('-id')[:limite])
+    return resultado
@@ -0,0 +1,210 @@
+"""
+Caché de fragmentos y resultados de SwapApp.
+
+Las entradas se guardan bajo uno o más *espacios* (``'productos'``,
+``'usuario:<id>'``...). Cada espacio tiene un número de generación que
+forma parte de la clave; invalidar un espacio solo incrementa su
+generación, y las entradas viejas dejan de usarse y terminan saliendo por
+LRU o TTL. Las señales de ``Producto``, ``Trueque``, ``Chat`` y
+``Notificacion`` (ver ``signals.py``) invalidan los espacios afectados con
+``invalidar_al_confirmar``: si la generación subiera antes del commit, otro
+request podría volver a llenar la entrada nueva con los datos viejos.
+
+Backend configurable con ``settings.SWAPPLACE_CACHE``:
+
+* ``CacheLRU`` (por defecto): memoria del proceso, acotada por número de
+  entradas con expulsión LRU. Las generaciones también van en un LRU
+  acotado: un espacio expulsado vuelve con una generación nueva (basada en
+  el reloj), nunca con una ya usada.
+* ``CacheDjango``: delega en un alias de ``CACHES`` (memcached, redis...),
+  para compartir la caché entre procesos.
+
+Ambos llevan contadores de aciertos/fallos (``estadisticas()``).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+_FALTA = object()
+
+
+class CacheLRU:
+    def __init__(self, max_entradas=1000, ttl=300, max_generaciones=None):
+        self.max_entradas = max_entradas
+        # un espacio sin entradas vivas no necesita su generación
+        self.max_generaciones = max_generaciones or max_entradas
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._generaciones = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None and entrada[0] > time.monotonic():
+                self._datos.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[1]
+            if entrada is not None:
+                del self._datos[clave]
+            self.fallos += 1
+            return _FALTA
+
+    def set(self, clave, valor, ttl=None):
+        expira = time.monotonic() + (ttl or self.ttl)
+        with self._lock:
+            self._datos[clave] = (expira, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+                self.expulsiones += 1
+
+    def delete(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+            self._generaciones.clear()
+
+    def _generacion(self, espacio):
+        # con el lock tomado. Un espacio nuevo o expulsado arranca en el reloj:
+        # no coincide con ninguna generación que haya tenido antes
+        gen = self._generaciones.get(espacio)
+        if gen is None:
+            gen = self._generaciones[espacio] = time.time_ns()
+            while len(self._generaciones) > self.max_generaciones:
+                self._generaciones.popitem(last=False)
+        else:
+            self._generaciones.move_to_end(espacio)
+        return gen
+
+    def generacion(self, espacio):
+        with self._lock:
+            return self._generacion(espacio)
+
+    def incrementar_generacion(self, espacio):
+        with self._lock:
+            self._generaciones[espacio] = self._generacion(espacio) + 1
+
+    def estadisticas(self):
+        with self._lock:
+            entradas = len(self._datos)
+            generaciones = len(self._generaciones)
+        total = self.aciertos + self.fallos
+        return {
+            'backend': type(self).__name__,
+            'entradas': entradas,
+            'max_entradas': self.max_entradas,
+            'generaciones': generaciones,
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'expulsiones': self.expulsiones,
+            'tasa_aciertos': round(self.aciertos / total, 4) if total else None,
+        }
+
+
+class CacheDjango:
+    def __init__(self, alias='default', ttl=300, prefijo='swapapp'):
+        from django.core.cache import caches
+        self._cache = caches[alias]
+        self.ttl = ttl
+        self.prefijo = prefijo
+        self.aciertos = 0
+        self.fallos = 0
+
+    def get(self, clave):
+        valor = self._cache.get(f'{self.prefijo}:{clave}', _FALTA)
+        if valor is _FALTA:
+            self.fallos += 1
+        else:
+            self.aciertos += 1
+        return valor
+
+    def set(self, clave, valor, ttl=None):
+        self._cache.set(f'{self.prefijo}:{clave}', valor, ttl or self.ttl)
+
+    def delete(self, clave):
+        self._cache.delete(f'{self.prefijo}:{clave}')
+
+    def clear(self):
+        self._cache.clear()
+
+    def generacion(self, espacio):
+        clave = f'{self.prefijo}:gen:{espacio}'
+        gen = self._cache.get(clave)
+        if gen is None:
+            # arranca en un valor nuevo para no coincidir con generaciones expulsadas
+            self._cache.add(clave, time.time_ns(), None)
+            gen = self._cache.get(clave)
+        return gen
+
+    def incrementar_generacion(self, espacio):
+        clave = f'{self.prefijo}:gen:{espacio}'
+        try:
+            self._cache.incr(clave)
+        except ValueError:
+            self._cache.set(clave, time.time_ns(), None)
+
+    def estadisticas(self):
+        total = self.aciertos + self.fallos
+        return {
+            'backend': type(self).__name__,
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'tasa_aciertos': round(self.aciertos / total, 4) if total else None,
+        }
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def obtener_cache():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                conf = getattr(settings, 'SWAPPLACE_CACHE', {})
+                clase = import_string(conf.get('BACKEND', 'SwapApp.cache.CacheLRU'))
+                _backend = clase(**conf.get('OPCIONES', {}))
+    return _backend
+
+
+def cacheado(espacios, clave, calcular, ttl=None):
+    c = obtener_cache()
+    generaciones = '.'.join(str(c.generacion(e)) for e in espacios)
+    clave = f'{clave}@{generaciones}'
+    valor = c.get(clave)
+    if valor is _FALTA:
+        valor = calcular()
+        c.set(clave, valor, ttl)
+    return valor
+
+
+def invalidar(*espacios):
+    c = obtener_cache()
+    for e in set(espacios):
+        c.incrementar_generacion(e)
+
+
+def invalidar_al_confirmar(*espacios):
+    """``invalidar`` después del commit de la transacción en curso (o ya, si no hay)."""
+    transaction.on_commit(lambda: invalidar(*espacios))
+
+
+def espacio_usuario(usuario_id):
+    return f'usuario:{usuario_id}'
+
+
+def estadisticas():
+    return obtener_cache().estadisticas()
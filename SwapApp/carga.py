@@ -0,0 +1,320 @@
+"""
+Generador de carga de lazo cerrado.
+
+Levanta el proyecto en un servidor HTTP de verdad (``LiveServerThread`` con
+``hilos`` peticiones atendidas a la vez, como un worker WSGI) sobre una base
+de prueba sembrada con ``sembrado``, y lo recorre con usuarios virtuales.
+Cada usuario tiene abiertas a la vez las pestañas de la mezcla:
+
+* ``chat``: trae los mensajes nuevos cada 2 s, como el polling de chat.html,
+  y de vez en cuando envía uno.
+* ``home``: carga el home y baja por el feed (``api_productos``).
+* ``busqueda``: escribe palabras en el buscador; igual que home.html, solo
+  consulta cuando el usuario deja de teclear ``debounce`` segundos.
+
+Lazo cerrado: cada pestaña espera su respuesta antes de pensar y seguir, así
+que con el servidor saturado baja la tasa y sube la latencia en vez de
+acumular peticiones sin fin. Cada nivel de usuarios reporta req/s y
+p50/p95/p99 por vista; está *sostenido* si los errores no pasan de
+``ERRORES_MAX`` y el p95 global queda bajo ``p95_max``. Las 429 de
+``limites`` se cuentan aparte: son el límite funcionando, no un error.
+
+Los usuarios virtuales corren en un event loop del mismo proceso que el
+servidor: lo medido es la capacidad de un proceso, como un worker. Con la
+misma semilla, mezcla, escala y duración dos reportes se pueden comparar
+(``comparar``) para frenar un despliegue que empeora; el p95 de una vista
+solo cuenta con suficientes muestras. Lo usa el comando ``generar_carga``.
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.servers.basehttp import ThreadedWSGIServer
+from django.db import connection
+from django.test import Client
+from django.test.testcases import LiveServerThread
+from django.urls import reverse
+
+from . import limites, sembrado
+from .concurrencia import _percentil
+from .models import ParticipanteChat
+
+MEZCLA = {
+    'chat': {'intervalo': 2.0, 'envio': 0.05},
+    'home': {'intervalo': 20.0, 'paginas': 2},
+    'busqueda': {'intervalo': 10.0, 'tecleo': 0.18, 'debounce': 0.25},
+}
+ERRORES_MAX = 0.01
+
+
+# ---------- SERVIDOR ----------
+class _ServidorWSGI(ThreadedWSGIServer):
+    # la cola de conexiones es amplia: el límite lo ponen los cupos
+    request_queue_size = 1024
+    cupos = None
+
+    def process_request_thread(self, request, client_address):
+        with self.cupos:
+            super().process_request_thread(request, client_address)
+
+
+class Servidor(LiveServerThread):
+    server_class = _ServidorWSGI
+
+    def __init__(self, hilos=16):
+        self.hilos = hilos
+        super().__init__('127.0.0.1', lambda handler: handler)
+        self.daemon = True
+
+    def _create_server(self, connections_override=None):
+        servidor = super()._create_server(connections_override)
+        servidor.cupos = threading.BoundedSemaphore(self.hilos)
+        return servidor
+
+    def __enter__(self):
+        self.start()
+        self.is_ready.wait()
+        if self.error:
+            raise self.error
+        return self
+
+    def __exit__(self, *exc):
+        self.terminate()
+
+
+async def _http(puerto, metodo, ruta, cookie, cuerpo=None):
+    lector, escritor = await asyncio.open_connection('127.0.0.1', puerto)
+    try:
+        lineas = [f'{metodo} {ruta} HTTP/1.1', 'Host: testserver', f'Cookie: {cookie}', 'Connection: close']
+        if cuerpo is not None:
+            lineas += ['Content-Type: application/json', f'Content-Length: {len(cuerpo)}']
+        escritor.write('\r\n'.join(lineas).encode() + b'\r\n\r\n' + (cuerpo or b''))
+        await escritor.drain()
+        respuesta = await lector.read()
+    finally:
+        escritor.close()
+    cabecera, _, contenido = respuesta.partition(b'\r\n\r\n')
+    return int(cabecera.split(None, 2)[1]), contenido
+
+
+# ---------- USUARIOS VIRTUALES ----------
+class _Conteo:
+    def __init__(self):
+        self.desde = self.hasta = 0
+        self.latencias = defaultdict(list)
+        self.estados = defaultdict(Counter)
+
+    def anotar(self, vista, inicio, status):
+        # solo lo que empezó dentro de la ventana medida
+        if self.desde <= inicio < self.hasta:
+            self.latencias[vista].append(time.perf_counter() - inicio)
+            self.estados[vista][status] += 1
+
+
+class UsuarioVirtual:
+    def __init__(self, usuario_id, cookie, chat_id, puerto, conteo, timeout):
+        self.usuario_id = usuario_id
+        self.cookie = cookie
+        self.chat_id = chat_id
+        self.puerto = puerto
+        self.conteo = conteo
+        self.timeout = timeout
+
+    async def pedir(self, vista, ruta, datos=None, cuerpo=None):
+        if datos:
+            ruta = f'{ruta}?{urlencode(datos)}'
+        metodo = 'GET' if cuerpo is None else 'POST'
+        cuerpo = None if cuerpo is None else json.dumps(cuerpo).encode()
+        inicio = time.perf_counter()
+        try:
+            status, contenido = await asyncio.wait_for(
+                _http(self.puerto, metodo, ruta, self.cookie, cuerpo), self.timeout)
+        except (OSError, ValueError, IndexError, asyncio.TimeoutError):
+            status, contenido = 0, b''
+        self.conteo.anotar(vista, inicio, status)
+        return status, contenido
+
+
+async def _dormir(segundos, fin):
+    await asyncio.sleep(max(0, min(segundos, fin - time.perf_counter())))
+
+
+async def _chat(uv, rnd, conf, fin):
+    if uv.chat_id is None:
+        return
+    url = reverse('api_fetch_messages', args=[uv.chat_id])
+    envio = reverse('api_send_message', args=[uv.chat_id])
+    ultimo = 0
+    while time.perf_counter() < fin:
+        status, contenido = await uv.pedir('api_fetch_messages', url, {'since_id': ultimo} if ultimo else None)
+        if status == 200:
+            mensajes = json.loads(contenido)['mensajes']
+            if mensajes:
+                ultimo = mensajes[-1]['id']
+        if rnd.random() < conf['envio']:
+            await uv.pedir('api_send_message', envio, cuerpo={'texto': sembrado._texto(rnd, 6)})
+        await _dormir(conf['intervalo'], fin)
+
+
+async def _home(uv, rnd, conf, fin):
+    home, feed = reverse('home'), reverse('api_productos')
+    while time.perf_counter() < fin:
+        await uv.pedir('home', home)
+        cursor = None
+        for _ in range(conf['paginas']):
+            await _dormir(rnd.uniform(1, 3), fin)  # lo que tarda en llegar al final del feed
+            status, contenido = await uv.pedir('api_productos', feed, {'cursor': cursor} if cursor else None)
+            cursor = json.loads(contenido).get('siguiente') if status == 200 else None
+            if not cursor:
+                break
+        await _dormir(rnd.expovariate(1 / conf['intervalo']), fin)
+
+
+async def _busqueda(uv, rnd, conf, fin):
+    url = reverse('buscar_productos')
+    while time.perf_counter() < fin:
+        palabra = rnd.choice(sembrado.PALABRAS)
+        for i in range(1, len(palabra) + 1):
+            pausa = rnd.expovariate(1 / conf['tecleo'])
+            if pausa < conf['debounce'] and i < len(palabra):
+                await _dormir(pausa, fin)
+                continue
+            await _dormir(conf['debounce'], fin)
+            await uv.pedir('buscar_productos', url, {'q': palabra[:i]})
+            await _dormir(pausa - conf['debounce'], fin)
+        await _dormir(rnd.expovariate(1 / conf['intervalo']), fin)
+
+
+PESTANAS = {'chat': _chat, 'home': _home, 'busqueda': _busqueda}
+
+
+async def _pestana(nombre, uv, rnd, conf, fin):
+    # arranques repartidos para no empezar todas a la vez
+    await _dormir(rnd.uniform(0, conf['intervalo']), fin)
+    await PESTANAS[nombre](uv, rnd, conf, fin)
+
+
+async def _nivel(usuarios, mezcla, semilla, conteo, duracion, calentamiento):
+    inicio = time.perf_counter()
+    conteo.desde = inicio + calentamiento
+    conteo.hasta = fin = conteo.desde + duracion
+    await asyncio.gather(*(
+        _pestana(nombre, uv, random.Random(f'{semilla}:{uv.usuario_id}:{nombre}'), conf, fin)
+        for uv in usuarios for nombre, conf in mezcla.items()
+    ))
+
+
+# ---------- REPORTE ----------
+def _resumen(latencias, estados, duracion):
+    errores = sum(n for s, n in estados.items() if not 200 <= s < 400 and s != 429)
+    return {
+        'peticiones': len(latencias),
+        'req_por_segundo': round(len(latencias) / duracion, 1),
+        'p50_ms': _percentil(latencias, 0.5),
+        'p95_ms': _percentil(latencias, 0.95),
+        'p99_ms': _percentil(latencias, 0.99),
+        'errores': errores,
+        'limitadas': estados.get(429, 0),
+    }
+
+
+def _resultado(n, conteo, duracion, p95_max):
+    todas = [l for v in conteo.latencias.values() for l in v]
+    estados = sum(conteo.estados.values(), Counter())
+    r = {'usuarios': n, **_resumen(todas, estados, duracion)}
+    r['vistas'] = {v: _resumen(conteo.latencias[v], conteo.estados[v], duracion) for v in sorted(conteo.latencias)}
+    r['sostenido'] = (r['peticiones'] > 0 and r['errores'] <= ERRORES_MAX * r['peticiones']
+                      and r['p95_ms'] <= p95_max * 1000)
+    return r
+
+
+def _sesiones(usuarios):
+    cookies = {}
+    for u in usuarios:
+        c = Client()
+        c.force_login(u)
+        cookies[u.id] = f'{settings.SESSION_COOKIE_NAME}={c.cookies[settings.SESSION_COOKIE_NAME].value}'
+    return cookies
+
+
+def preparar(usuarios, productos_por_usuario=10, mensajes_por_chat=20, semilla=1):
+    """Siembra el marketplace y devuelve ``(usuarios, cookies, chat_por_usuario)``."""
+    escala = sembrado.Escala(usuarios=usuarios, productos=usuarios * productos_por_usuario,
+                             trueques=usuarios * 2, chats=20, mensajes_por_chat=mensajes_por_chat,
+                             notificaciones=usuarios * 4)
+    mercado = sembrado.sembrar(escala, semilla=semilla, prefijo='carga')
+    sembrado.chats_en_pareja(mercado, mensajes_por_chat=mensajes_por_chat, semilla=semilla)
+    chats = {}
+    for uid, chat_id in ParticipanteChat.objects.order_by('chat_id').values_list('usuario_id', 'chat_id'):
+        chats.setdefault(uid, chat_id)
+    return mercado.usuarios, _sesiones(mercado.usuarios), chats
+
+
+def ejecutar(niveles, duracion=30, calentamiento=5, hilos=16, mezcla=None, semilla=1, p95_max=0.5,
+             timeout=30, productos_por_usuario=10, mensajes_por_chat=20):
+    mezcla = mezcla or MEZCLA
+    niveles = sorted(niveles)
+    usuarios, cookies, chats = preparar(max(niveles), productos_por_usuario, mensajes_por_chat, semilla)
+    resultados = []
+    with Servidor(hilos) as servidor:
+        for n in niveles:
+            # cada nivel arranca con los cubos de limites.py llenos
+            limites.reiniciar()
+            conteo = _Conteo()
+            virtuales = [UsuarioVirtual(u.id, cookies[u.id], chats.get(u.id), servidor.port, conteo, timeout)
+                         for u in usuarios[:n]]
+            asyncio.run(_nivel(virtuales, mezcla, semilla, conteo, duracion, calentamiento))
+            resultados.append(_resultado(n, conteo, duracion, p95_max))
+
+    sostenidos = [r['usuarios'] for r in resultados if r['sostenido']]
+    saturados = [r['usuarios'] for r in resultados if not r['sostenido']]
+    return {
+        'config': {
+            'niveles': niveles, 'duracion': duracion, 'calentamiento': calentamiento, 'hilos': hilos,
+            'mezcla': mezcla, 'semilla': semilla, 'p95_max': p95_max,
+            'productos_por_usuario': productos_por_usuario, 'mensajes_por_chat': mensajes_por_chat,
+            'vendor': connection.vendor,
+        },
+        'resultados': resultados,
+        'max_usuarios_sostenidos': max(sostenidos, default=0),
+        'saturacion': min(saturados, default=None),
+    }
+
+
+def _p95_peor(actual, anterior, tolerancia, piso_ms, min_muestras):
+    # con pocas muestras el p95 es ruido; bajo piso_ms también
+    if min(actual['peticiones'], anterior['peticiones']) < min_muestras:
+        return False
+    if actual['p95_ms'] is None or anterior['p95_ms'] is None:
+        return False
+    return (actual['p95_ms'] > anterior['p95_ms'] * (1 + tolerancia)
+            and actual['p95_ms'] - anterior['p95_ms'] > piso_ms)
+
+
+def comparar(reporte, base, tolerancia=0.2, piso_ms=20, min_muestras=200):
+    """Regresiones de ``reporte`` respecto de ``base``: p95 o req/s peores que la tolerancia."""
+    if reporte['config'] != base['config']:
+        raise ValueError('Los reportes no son comparables: la configuración de la corrida es distinta.')
+    regresiones = []
+    anteriores = {r['usuarios']: r for r in base['resultados']}
+    for r in reporte['resultados']:
+        b = anteriores.get(r['usuarios'])
+        if b is None:
+            continue
+        if b['sostenido'] and not r['sostenido']:
+            regresiones.append(f"{r['usuarios']} usuarios: ya no se sostiene")
+        if r['req_por_segundo'] < b['req_por_segundo'] * (1 - tolerancia):
+            regresiones.append(f"{r['usuarios']} usuarios: {b['req_por_segundo']} → {r['req_por_segundo']} req/s")
+        if _p95_peor(r, b, tolerancia, piso_ms, min_muestras):
+            regresiones.append(f"{r['usuarios']} usuarios: p95 {b['p95_ms']} → {r['p95_ms']} ms")
+        for vista, v in r['vistas'].items():
+            bv = b['vistas'].get(vista)
+            if bv and _p95_peor(v, bv, tolerancia, piso_ms, min_muestras):
+                regresiones.append(f"{r['usuarios']} usuarios, {vista}: p95 {bv['p95_ms']} → {v['p95_ms']} ms")
+    return regresiones
@@ -0,0 +1,69 @@
+"""
+Compresión negociada de respuestas.
+
+``CompresionMiddleware`` comprime con gzip las páginas HTML y las
+respuestas JSON de al menos ``MIN_BYTES`` cuando el cliente lo acepta. Las
+respuestas en streaming pasan tal cual: el SSE del chat tiene que llegar
+evento por evento, y /media/ y /static/ ya salen comprimidos o son
+imágenes.
+
+Brotli queda para las variantes precomprimidas de los estáticos (ver
+estaticos.py): en respuestas dinámicas gzip con nivel medio comprime casi
+igual, está en la biblioteca estándar y admite el relleno aleatorio de
+Django contra BREACH, que importa porque las páginas llevan el token CSRF.
+"""
+
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+# mismo relleno que GZipMiddleware de Django
+RELLENO_MAX = 100
+_Q_CERO = re.compile(r'q\s*=\s*0(?:\.0*)?\s*$')
+
+
+def _config():
+    return {
+        'MIN_BYTES': 1024,
+        'TIPOS': ('text/html', 'application/json'),
+        **getattr(settings, 'SWAPPLACE_COMPRESION', {}),
+    }
+
+
+def aceptadas(request):
+    """Codificaciones de ``Accept-Encoding`` que el cliente no rechaza con q=0."""
+    codificaciones = set()
+    for parte in request.headers.get('Accept-Encoding', '').split(','):
+        nombre, _, parametros = parte.partition(';')
+        if nombre.strip() and not _Q_CERO.search(parametros):
+            codificaciones.add(nombre.strip().lower())
+    return codificaciones
+
+
+class CompresionMiddleware(MiddlewareMixin):
+    """Va arriba en ``MIDDLEWARE``: comprime lo que dejaron los demás."""
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        conf = _config()
+        if response.get('Content-Type', '').split(';')[0].strip() not in conf['TIPOS']:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < conf['MIN_BYTES'] or not {'gzip', '*'} & aceptadas(request):
+            return response
+
+        comprimido = compress_string(response.content, max_random_bytes=RELLENO_MAX)
+        if len(comprimido) >= len(response.content):
+            return response
+        response.content = comprimido
+        response['Content-Length'] = str(len(comprimido))
+        response['Content-Encoding'] = 'gzip'
+        # el cuerpo ya no es byte a byte el mismo
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
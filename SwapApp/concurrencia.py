@@ -0,0 +1,166 @@
+"""
+Benchmark de concurrencia del long-poll de notificaciones.
+
+Simula ``N`` pestañas abiertas, cada una haciendo long-poll a
+``api_notificaciones`` (``?since=<version>&wait=<espera>``), mientras un
+publicador genera notificaciones para usuarios al azar. Mide cuánto tarda
+cada aviso en llegar a su pestaña (``entrega``) y cuántas peticiones se
+completan.
+
+Dos modos, en el mismo proceso:
+
+* ``wsgi``: las peticiones pasan por un pool de ``hilos`` hilos, como un
+  worker WSGI; mientras una petición espera ocupa su hilo, así que con más
+  pestañas que hilos los avisos quedan en cola.
+* ``asgi``: las peticiones corren en el event loop (``AsyncClient``, la
+  misma pila async que ``SwapPlace/asgi.py``); esperar no ocupa hilos.
+
+Un nivel de pestañas se considera *sostenido* si no hubo errores y el p95
+de entrega quedó bajo ``latencia_max``. Lo usa el comando
+``benchmark_polling``.
+"""
+
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from . import notificaciones
+from .models import EstadoNotificaciones
+
+
+def crear_usuarios(n, prefijo='poll'):
+    existentes = User.objects.filter(username__startswith=prefijo).count()
+    User.objects.bulk_create([User(username=f'{prefijo}{i}') for i in range(existentes, n)])
+    usuarios = list(User.objects.filter(username__startswith=prefijo).order_by('id')[:n])
+    # con el contador ya creado la respuesta completa es de solo lectura
+    EstadoNotificaciones.objects.bulk_create(
+        [EstadoNotificaciones(usuario=u) for u in usuarios], ignore_conflicts=True)
+    return usuarios
+
+
+def _percentil(valores, p):
+    if not valores:
+        return None
+    valores = sorted(valores)
+    return round(valores[min(len(valores) - 1, int(p * len(valores)))] * 1000, 1)
+
+
+class _Corrida:
+    def __init__(self, usuarios, duracion, espera, intervalo_eventos):
+        self.usuarios = usuarios
+        self.duracion = duracion
+        self.espera = espera
+        self.intervalo = intervalo_eventos
+        self.publicados = {}
+        self.entregas = []
+        self.completadas = 0
+        self.errores = 0
+        self.url = reverse('api_notificaciones')
+
+    def recibido(self, usuario_id, status, datos, version):
+        if status != 200:
+            self.errores += 1
+            return version
+        self.completadas += 1
+        if datos.get('sin_cambios'):
+            return version
+        inicio = self.publicados.pop(usuario_id, None)
+        if inicio is not None:
+            self.entregas.append(time.perf_counter() - inicio)
+        return datos['version']
+
+    async def publicar(self, fin):
+        while time.perf_counter() < fin:
+            u = random.choice(self.usuarios)
+            self.publicados.setdefault(u.id, time.perf_counter())
+            notificaciones.marcar_cambio([u.id])
+            await asyncio.sleep(self.intervalo)
+
+    def resultado(self, modo, pestanas, **extra):
+        return {
+            'modo': modo,
+            'pestanas': pestanas,
+            **extra,
+            'completadas': self.completadas,
+            'req_por_segundo': round(self.completadas / self.duracion, 1),
+            'errores': self.errores,
+            'avisos': len(self.entregas),
+            'sin_entregar': len(self.publicados),
+            'entrega_p50_ms': _percentil(self.entregas, 0.5),
+            'entrega_p95_ms': _percentil(self.entregas, 0.95),
+            'entrega_max_ms': round(max(self.entregas) * 1000, 1) if self.entregas else None,
+        }
+
+
+def _clientes(usuarios, clase):
+    clientes = []
+    for u in usuarios:
+        c = clase()
+        c.force_login(u)
+        clientes.append(c)
+    return clientes
+
+
+async def _asgi(corrida, clientes, versiones):
+    fin = time.perf_counter() + corrida.duracion
+
+    async def pestana(u, cliente):
+        while time.perf_counter() < fin:
+            r = await cliente.get(corrida.url, {'since': versiones[u.id], 'wait': corrida.espera})
+            versiones[u.id] = corrida.recibido(u.id, r.status_code, r.json(), versiones[u.id])
+
+    await asyncio.gather(corrida.publicar(fin), *(pestana(u, c) for u, c in zip(corrida.usuarios, clientes)))
+
+
+async def _wsgi(corrida, clientes, versiones, hilos):
+    fin = time.perf_counter() + corrida.duracion
+    loop = asyncio.get_running_loop()
+
+    def pedir(cliente, datos):
+        # lo que quedó en cola al terminar la corrida ya no se atiende
+        if time.perf_counter() >= fin:
+            return None
+        return cliente.get(corrida.url, datos)
+
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        async def pestana(u, cliente):
+            while time.perf_counter() < fin:
+                datos = {'since': versiones[u.id], 'wait': corrida.espera}
+                r = await loop.run_in_executor(pool, pedir, cliente, datos)
+                if r is not None:
+                    versiones[u.id] = corrida.recibido(u.id, r.status_code, r.json(), versiones[u.id])
+
+        await asyncio.gather(corrida.publicar(fin), *(pestana(u, c) for u, c in zip(corrida.usuarios, clientes)))
+
+
+def medir(modo, usuarios, duracion=5, espera=2, intervalo_eventos=0.02, hilos=8):
+    corrida = _Corrida(usuarios, duracion, espera, intervalo_eventos)
+    # sesiones y versiones se preparan fuera del loop: usan el ORM síncrono
+    clientes = _clientes(usuarios, AsyncClient if modo == 'asgi' else Client)
+    versiones = {u.id: notificaciones.version(u.id) for u in usuarios}
+    if modo == 'asgi':
+        asyncio.run(_asgi(corrida, clientes, versiones))
+        return corrida.resultado(modo, len(usuarios))
+    asyncio.run(_wsgi(corrida, clientes, versiones, hilos))
+    return corrida.resultado(modo, len(usuarios), hilos=hilos)
+
+
+def ejecutar(niveles, modos=('wsgi', 'asgi'), latencia_max=1.0, **opciones):
+    usuarios = crear_usuarios(max(niveles))
+    resultados = []
+    sostenidas = {}
+    for modo in modos:
+        sostenidas[modo] = 0
+        for n in sorted(niveles):
+            r = medir(modo, usuarios[:n], **opciones)
+            r['sostenido'] = (not r['errores'] and r['entrega_p95_ms'] is not None
+                              and r['entrega_p95_ms'] <= latencia_max * 1000)
+            if r['sostenido']:
+                sostenidas[modo] = n
+            resultados.append(r)
+    return {'resultados': resultados, 'max_pestanas_sostenidas': sostenidas}
@@ -0,0 +1,11 @@
+from functools import partial
+
+from . import notificaciones as notif
+
+
+def notificaciones(request):
+    # badge del navbar: se evalúa solo si la plantilla lo usa (una lectura por PK)
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+    return {'notificaciones_no_leidas': partial(notif.no_leidas, user.id)}
@@ -0,0 +1,87 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+
+EN_CURSO = 'en-curso'
+
+
+def login_requerido_async(vista):
+    """``login_required`` para vistas async (el de Django 5.0 solo envuelve vistas síncronas)."""
+    @wraps(vista)
+    async def envoltura(request, *args, **kwargs):
+        user = await request.auser()
+        if user.is_authenticated:
+            return await vista(request, *args, **kwargs)
+        return redirect_to_login(request.get_full_path())
+    return envoltura
+
+
+# ---------- IDEMPOTENCIA ----------
+def _config_idempotencia():
+    return {
+        'CACHE': 'default',
+        'TTL': 24 * 3600,
+        'ESPERA': 5,
+        **getattr(settings, 'SWAPPLACE_IDEMPOTENCIA', {}),
+    }
+
+
+def _guardable(response):
+    return not response.streaming and response.status_code < 500
+
+
+def idempotente(vista):
+    """Un POST con la misma clave de idempotencia se ejecuta una sola vez.
+
+    La clave viene en la cabecera ``Idempotency-Key`` o en el campo
+    ``idempotency_key`` del formulario (``base.html`` la completa en cada
+    formulario POST). Los reintentos reciben la respuesta guardada; si el
+    primero aún está en curso se espera hasta ``ESPERA`` segundos y si no
+    terminó se responde 409. Sin clave la vista se ejecuta como siempre.
+    Va debajo de ``login_required``: la clave es por usuario.
+    """
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        clave = request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key')
+        if request.method != 'POST' or not clave:
+            return vista(request, *args, **kwargs)
+        conf = _config_idempotencia()
+        c = caches[conf['CACHE']]
+        huella = hashlib.sha256(f'{request.user.pk}:{request.path}:{clave}'.encode()).hexdigest()
+        clave = f'idempotencia:{huella}'
+
+        if not c.add(clave, EN_CURSO, conf['TTL']):
+            limite = time.monotonic() + conf['ESPERA']
+            guardada = c.get(clave)
+            while guardada == EN_CURSO and time.monotonic() < limite:
+                time.sleep(0.05)
+                guardada = c.get(clave)
+            if guardada == EN_CURSO:
+                return JsonResponse({'ok': False, 'error': 'Petición repetida en curso'}, status=409)
+            if guardada is not None:
+                response = HttpResponse(guardada['contenido'], status=guardada['estado'])
+                for cabecera, valor in guardada['cabeceras'].items():
+                    response[cabecera] = valor
+                response['Idempotent-Replayed'] = 'true'
+                return response
+
+        try:
+            response = vista(request, *args, **kwargs)
+        except Exception:
+            c.delete(clave)
+            raise
+        if _guardable(response):
+            c.set(clave, {
+                'estado': response.status_code,
+                'contenido': response.content,
+                'cabeceras': {k: response[k] for k in ('Content-Type', 'Location') if k in response},
+            }, conf['TTL'])
+        else:
+            c.delete(clave)
+        return response
+    return envoltura
@@ -0,0 +1,373 @@
+"""
+Emparejamiento de trueques entre varios usuarios.
+
+Cada ``Trueque`` pendiente es una arista del grafo de *deseos*: el
+solicitante quiere un producto del receptor (``u → x``). Un ciclo
+``u0 → u1 → … → u0`` es un intercambio en el que todos reciben algo que
+pidieron: ``u0`` recibe de ``u1``, ``u1`` de ``u2`` y el último de ``u0``.
+Los ciclos de 2 son permutas directas; se buscan también de 3 y 4
+participantes (``SWAPPLACE_EMPAREJAMIENTO['LARGO_MAXIMO']``).
+
+El grafo vive en memoria de cada proceso. Se arma desde la base la primera
+vez que se usa y después se actualiza con las señales de ``Trueque`` y
+``Producto`` (ver ``signals.py``) al confirmarse cada transacción. Lo que
+no emite señales (``bulk_create``, ``update``) o lo que escribe otro
+proceso llega al reconstruirlo: cada ``MAX_EDAD`` segundos, o cuando
+``recalcular_emparejamientos`` incrementa la generación en la caché
+``CACHE``. Esa caché tiene que ser compartida (memcached, redis...): con la
+de memoria local, que es la de por defecto, el comando solo cambia su
+propia copia y los demás procesos esperan a ``MAX_EDAD``. Por eso el grafo solo propone candidatos: ``sugerencias``
+confirma contra la base que cada pedido siga pendiente antes de
+devolverlo.
+
+La búsqueda desde un usuario es acotada: primero marca, recorriendo las
+aristas al revés, qué usuarios pueden volver a él en pocos pasos, y el DFS
+hacia adelante solo entra en esos.
+"""
+
+import random
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+LARGO_MINIMO = 2
+
+
+def _config():
+    return {
+        'LARGO_MAXIMO': 4,
+        'MAX_EDAD': 300,
+        'LIMITE': 20,
+        'CACHE': 'default',
+        **getattr(settings, 'SWAPPLACE_EMPAREJAMIENTO', {}),
+    }
+
+
+class Grafo:
+    def __init__(self):
+        self._pedidos = {}                                             # trueque -> (solicitante, producto, dueño)
+        self._por_producto = defaultdict(set)                          # producto -> {trueques}
+        self._salientes = defaultdict(lambda: defaultdict(dict))       # u -> x -> {producto: n}
+        self._entrantes = defaultdict(lambda: defaultdict(int))        # x -> u -> productos de x que u quiere
+        self._lock = threading.RLock()
+        self.construido = time.monotonic()
+        self.generacion = None
+
+    def __len__(self):
+        return len(self._pedidos)
+
+    # ---------- ACTUALIZACIÓN ----------
+    def agregar_pedido(self, trueque_id, solicitante_id, producto_id, dueno_id):
+        with self._lock:
+            if self._pedidos.get(trueque_id) == (solicitante_id, producto_id, dueno_id):
+                return
+            self.quitar_pedido(trueque_id)
+            self._pedidos[trueque_id] = (solicitante_id, producto_id, dueno_id)
+            self._por_producto[producto_id].add(trueque_id)
+            productos = self._salientes[solicitante_id][dueno_id]
+            if producto_id not in productos:
+                self._entrantes[dueno_id][solicitante_id] += 1
+            productos[producto_id] = productos.get(producto_id, 0) + 1
+
+    def quitar_pedido(self, trueque_id):
+        with self._lock:
+            pedido = self._pedidos.pop(trueque_id, None)
+            if pedido is None:
+                return
+            u, p, x = pedido
+            self._descartar(self._por_producto, p, trueque_id)
+            productos = self._salientes[u][x]
+            productos[p] -= 1
+            if productos[p]:
+                return
+            del productos[p]
+            self._entrantes[x][u] -= 1
+            if not self._entrantes[x][u]:
+                del self._entrantes[x][u]
+                if not self._entrantes[x]:
+                    del self._entrantes[x]
+            if not productos:
+                del self._salientes[u][x]
+                if not self._salientes[u]:
+                    del self._salientes[u]
+
+    @staticmethod
+    def _descartar(indice, clave, valor):
+        conjunto = indice.get(clave)
+        if conjunto is not None:
+            conjunto.discard(valor)
+            if not conjunto:
+                del indice[clave]
+
+    def cambiar_dueno(self, producto_id, dueno_id):
+        with self._lock:
+            for t in list(self._por_producto.get(producto_id, ())):
+                u, p, _ = self._pedidos[t]
+                self.agregar_pedido(t, u, p, dueno_id)
+
+    def quitar_producto(self, producto_id):
+        with self._lock:
+            for t in list(self._por_producto.get(producto_id, ())):
+                self.quitar_pedido(t)
+
+    # ---------- BÚSQUEDA ----------
+    def productos_entre(self, usuario_id, dueno_id):
+        return sorted(self._salientes.get(usuario_id, {}).get(dueno_id, ()))
+
+    def _distancias_de_vuelta(self, destino, largo_maximo, minimo=None):
+        # pasos que le faltan a cada usuario para volver a destino (BFS al revés)
+        distancias = {destino: 0}
+        frontera = [destino]
+        for d in range(1, largo_maximo):
+            siguiente = []
+            for x in frontera:
+                for u in self._entrantes.get(x, ()):
+                    if u not in distancias and (minimo is None or u > minimo):
+                        distancias[u] = d
+                        siguiente.append(u)
+            frontera = siguiente
+        return distancias
+
+    def _ciclos(self, origen, largo, distancias, minimo=None):
+        camino = [origen]
+        en_camino = {origen}
+
+        def visitar(u):
+            restantes = largo - len(camino)
+            for x in self._salientes.get(u, ()):
+                if x == origen:
+                    if not restantes:
+                        yield tuple(camino)
+                elif (restantes and x not in en_camino and (minimo is None or x > minimo)
+                      and distancias.get(x, largo) <= restantes):
+                    camino.append(x)
+                    en_camino.add(x)
+                    yield from visitar(x)
+                    camino.pop()
+                    en_camino.discard(x)
+
+        yield from visitar(origen)
+
+    def ciclos_de(self, usuario_id, largo_maximo=4, limite=20):
+        """Ciclos que pasan por el usuario, de menos a más participantes."""
+        with self._lock:
+            if usuario_id not in self._salientes or usuario_id not in self._entrantes:
+                return []
+            distancias = self._distancias_de_vuelta(usuario_id, largo_maximo)
+            ciclos = []
+            for largo in range(LARGO_MINIMO, largo_maximo + 1):
+                for ciclo in self._ciclos(usuario_id, largo, distancias):
+                    ciclos.append(ciclo)
+                    if len(ciclos) >= limite:
+                        return ciclos
+            return ciclos
+
+    def todos_los_ciclos(self, largo_maximo=4, limite=None):
+        """Cada ciclo una vez, empezando por su usuario de menor id."""
+        with self._lock:
+            usuarios = sorted(u for u in self._salientes if u in self._entrantes)
+            total = 0
+            for s in usuarios:
+                distancias = self._distancias_de_vuelta(s, largo_maximo, minimo=s)
+                if len(distancias) == 1:
+                    continue
+                for largo in range(LARGO_MINIMO, largo_maximo + 1):
+                    for ciclo in self._ciclos(s, largo, distancias, minimo=s):
+                        yield ciclo
+                        total += 1
+                        if limite is not None and total >= limite:
+                            return
+
+
+def desde_bd():
+    from .models import Trueque
+    g = Grafo()
+    pedidos = (Trueque.objects.filter(estado='pendiente')
+               .values_list('id', 'solicitante_id', 'producto_id', 'producto__usuario_id')
+               .iterator(chunk_size=5000))
+    for t, u, p, x in pedidos:
+        if u != x:
+            g.agregar_pedido(t, u, p, x)
+    return g
+
+
+def sintetico(productos, productos_por_usuario=4, pedidos_por_usuario=3, semilla=0):
+    """Grafo aleatorio para medir: ``productos`` repartidos entre usuarios."""
+    rnd = random.Random(semilla)
+    usuarios = max(2, productos // productos_por_usuario)
+    dueno = [p % usuarios for p in range(productos)]
+    g = Grafo()
+    t = 0
+    for u in range(usuarios):
+        for p in rnd.sample(range(productos), pedidos_por_usuario):
+            if dueno[p] != u:
+                t += 1
+                g.agregar_pedido(t, u, p, dueno[p])
+    return g
+
+
+# ---------- GRAFO DEL PROCESO ----------
+_grafo = None
+_grafo_lock = threading.Lock()
+
+
+def _clave_generacion():
+    return 'emparejamiento:generacion'
+
+
+def _generacion():
+    return caches[_config()['CACHE']].get(_clave_generacion(), 0)
+
+
+def generacion_compartida():
+    """False si ``CACHE`` es memoria local: la generación no sale del proceso."""
+    return not isinstance(caches[_config()['CACHE']], LocMemCache)
+
+
+def invalidar():
+    """Incrementa la generación en ``CACHE``.
+
+    Los procesos que leen esa caché rearman su grafo en el próximo uso; con
+    una caché de memoria local eso es solo el proceso que llama.
+    """
+    c = caches[_config()['CACHE']]
+    c.add(_clave_generacion(), 0, None)
+    try:
+        c.incr(_clave_generacion())
+    except ValueError:
+        c.set(_clave_generacion(), 1, None)
+
+
+def reiniciar():
+    global _grafo
+    _grafo = None
+
+
+def _vigente(g, generacion):
+    return (g is not None and g.generacion == generacion
+            and time.monotonic() - g.construido < _config()['MAX_EDAD'])
+
+
+def grafo():
+    global _grafo
+    generacion = _generacion()
+    g = _grafo
+    if _vigente(g, generacion):
+        return g
+    with _grafo_lock:
+        g = _grafo
+        if not _vigente(g, generacion):
+            g = desde_bd()
+            g.generacion = generacion
+            _grafo = g
+    return g
+
+
+def _al_confirmar(funcion, *args):
+    # si el grafo aún no se armó, la base ya tendrá el cambio cuando se arme
+    def aplicar():
+        g = _grafo
+        if g is not None:
+            getattr(g, funcion)(*args)
+    transaction.on_commit(aplicar)
+
+
+def trueque_guardado(trueque):
+    if trueque.estado == 'pendiente' and trueque.solicitante_id != trueque.receptor_id:
+        _al_confirmar('agregar_pedido', trueque.id, trueque.solicitante_id, trueque.producto_id,
+                      trueque.receptor_id)
+    else:
+        _al_confirmar('quitar_pedido', trueque.id)
+
+
+def trueque_borrado(trueque):
+    _al_confirmar('quitar_pedido', trueque.id)
+
+
+def producto_guardado(producto):
+    _al_confirmar('cambiar_dueno', producto.id, producto.usuario_id)
+
+
+def producto_borrado(producto):
+    _al_confirmar('quitar_producto', producto.id)
+
+
+# ---------- SUGERENCIAS ----------
+def _rotar(ciclo, usuario_id):
+    i = ciclo.index(usuario_id)
+    return ciclo[i:] + ciclo[:i]
+
+
+def sugerencias(usuario_id, limite=None):
+    """Intercambios en los que participa el usuario, confirmados contra la base.
+
+    Cada uno es una lista de pasos ``(usuario, dueño, [productos])``: el
+    usuario recibe alguno de esos productos del dueño. El primer paso es
+    siempre el del usuario pedido.
+    """
+    from .models import Producto, Trueque
+    conf = _config()
+    limite = limite or conf['LIMITE']
+    g = grafo()
+    ciclos = [_rotar(c, usuario_id) for c in g.ciclos_de(usuario_id, conf['LARGO_MAXIMO'], limite)]
+    if not ciclos:
+        return []
+    candidatos = [[(c[i], c[(i + 1) % len(c)], g.productos_entre(c[i], c[(i + 1) % len(c)]))
+                   for i in range(len(c))] for c in ciclos]
+    usuarios = {u for c in ciclos for u in c}
+    productos_ids = {p for pasos in candidatos for _, _, ps in pasos for p in ps}
+    vigentes = set(Trueque.objects.filter(estado='pendiente', solicitante_id__in=usuarios,
+                                          producto_id__in=productos_ids)
+                   .values_list('solicitante_id', 'producto_id'))
+    productos = Producto.objects.select_related('usuario').in_bulk(productos_ids)
+
+    resultado = []
+    for pasos in candidatos:
+        confirmados = []
+        for u, x, ps in pasos:
+            ps = [productos[p] for p in ps
+                  if (u, p) in vigentes and p in productos and productos[p].usuario_id == x]
+            if not ps:
+                break
+            confirmados.append((u, x, ps))
+        else:
+            resultado.append(confirmados)
+    return resultado
+
+
+# ---------- MEDICIÓN ----------
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return round(valores[min(len(valores) - 1, int(p * len(valores)))] * 1000, 3) if valores else None
+
+
+def medir(g, largo_maximo=4, muestras=1000, limite_global=None, semilla=0):
+    inicio = time.perf_counter()
+    por_largo = defaultdict(int)
+    usuarios_en_ciclos = set()
+    for ciclo in g.todos_los_ciclos(largo_maximo, limite_global):
+        por_largo[len(ciclo)] += 1
+        usuarios_en_ciclos.update(ciclo)
+    total = time.perf_counter() - inicio
+
+    usuarios = list(g._salientes)
+    tiempos = []
+    for u in random.Random(semilla).sample(usuarios, min(muestras, len(usuarios))):
+        t = time.perf_counter()
+        g.ciclos_de(u, largo_maximo, _config()['LIMITE'])
+        tiempos.append(time.perf_counter() - t)
+    return {
+        'pedidos': len(g),
+        'usuarios_con_pedidos': len(usuarios),
+        'ciclos_por_largo': dict(sorted(por_largo.items())),
+        'usuarios_con_sugerencia': len(usuarios_en_ciclos),
+        'recalculo_s': round(total, 3),
+        'por_usuario_p50_ms': _percentil(tiempos, 0.5),
+        'por_usuario_p95_ms': _percentil(tiempos, 0.95),
+        'por_usuario_max_ms': round(max(tiempos) * 1000, 3) if tiempos else None,
+    }
@@ -0,0 +1,122 @@
+"""
+Archivos estáticos con huella y precomprimidos.
+
+``AlmacenEstatico`` es el ``ManifestStaticFilesStorage`` de Django (nombres
+con el hash del contenido y ``staticfiles.json`` como manifiesto) que al
+final de ``collectstatic`` escribe junto a cada archivo de texto con huella
+su variante ``.gz`` y, si está instalado el paquete ``brotli``, ``.br``. Se
+comprimen una vez y al máximo nivel, no en cada request.
+
+``servir`` entrega la variante que acepte el cliente y marca como
+inmutables los nombres con huella: si el archivo cambia, cambia de nombre,
+así que el navegador no vuelve a pedirlo. Sin ``collectstatic``
+(desarrollo, pruebas) ``{% static %}`` da el nombre sin huella y ``servir``
+lo busca con los finders, sin caché larga.
+"""
+
+import gzip
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils.http import http_date
+
+from . import compresion
+from .media import INMUTABLE
+
+try:
+    import brotli
+except ImportError:  # opcional: sin él solo se generan .gz
+    brotli = None
+
+COMPRIMIBLES = {'.css', '.js', '.mjs', '.map', '.svg', '.json', '.txt', '.xml', '.html', '.ico'}
+# en orden de preferencia
+VARIANTES = (('br', '.br'), ('gzip', '.gz'))
+_HUELLA = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+
+def comprimir(datos):
+    """``{extension: bytes}`` de las variantes que salen más chicas que el original."""
+    variantes = {'.gz': gzip.compress(datos, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variantes['.br'] = brotli.compress(datos, quality=11)
+    return {ext: v for ext, v in variantes.items() if len(v) < len(datos)}
+
+
+class AlmacenEstatico(ManifestStaticFilesStorage):
+    def stored_name(self, name):
+        # sin collectstatic no hay manifiesto: se usa el nombre sin huella
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for nombre in sorted(set(self.hashed_files.values())):
+            if posixpath.splitext(nombre)[1].lower() not in COMPRIMIBLES:
+                continue
+            with self.open(nombre) as f:
+                variantes = comprimir(f.read())
+            for ext, datos in variantes.items():
+                # con huella el contenido no cambia: lo ya comprimido sirve
+                if not self.exists(nombre + ext):
+                    self._save(nombre + ext, ContentFile(datos))
+                yield nombre, nombre + ext, True
+
+
+# ---------- SERVIR ----------
+def _buscar(ruta):
+    """Camino en disco: STATIC_ROOT si se corrió collectstatic, si no los finders."""
+    try:
+        if settings.STATIC_ROOT:
+            camino = staticfiles_storage.path(ruta)
+            if os.path.isfile(camino):
+                return camino
+        return finders.find(ruta)
+    except SuspiciousFileOperation:
+        return None
+
+
+def servir(request, ruta):
+    ruta = posixpath.normpath(ruta).lstrip('/')
+    camino = _buscar(ruta)
+    if not camino or not os.path.isfile(camino):
+        raise Http404
+
+    servido, codificacion = camino, None
+    if posixpath.splitext(ruta)[1].lower() in COMPRIMIBLES:
+        acepta = compresion.aceptadas(request)
+        for nombre, ext in VARIANTES:
+            if nombre in acepta and os.path.isfile(camino + ext):
+                servido, codificacion = camino + ext, nombre
+                break
+    st = os.stat(servido)
+    # una ETag por variante: gzip y brotli no son los mismos bytes
+    etag = f'"{int(st.st_mtime)}-{st.st_size}"'
+    cabeceras = {
+        'ETag': etag,
+        'Last-Modified': http_date(st.st_mtime),
+        'Cache-Control': INMUTABLE if _HUELLA.search(ruta) else 'no-cache',
+    }
+    if posixpath.splitext(ruta)[1].lower() in COMPRIMIBLES:
+        cabeceras['Vary'] = 'Accept-Encoding'
+
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        tipo = mimetypes.guess_type(camino)[0] or 'application/octet-stream'
+        response = FileResponse(open(servido, 'rb'), content_type=tipo)
+        if codificacion:
+            response['Content-Encoding'] = codificacion
+    for clave, valor in cabeceras.items():
+        response[clave] = valor
+    return response
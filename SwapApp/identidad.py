@@ -0,0 +1,111 @@
+"""
+Identidad cacheada para las URLs de polling.
+
+Con ``AuthenticationMiddleware`` cada request autenticado lee el ``User``
+de la base de datos y verifica el hash de sesión contra su contraseña.
+Para las vistas de ``SWAPPLACE_IDENTIDAD['VISTAS']`` (chat y
+notificaciones, consultadas cada pocos segundos) ``IdentidadCacheadaMiddleware``
+cambia ``request.user`` / ``request.auser`` por una versión que arma el
+usuario desde la caché: id, username, flags y el hash de sesión esperado.
+El resto de los campos queda diferido y se carga solo si alguien lo lee;
+``save()`` sobre ese usuario solo escribe los campos cargados.
+
+La sesión en sí sale de la caché con ``SESSION_ENGINE = cached_db``: en
+el caso normal estas vistas no tocan la base de datos antes de empezar.
+
+La entrada se escribe al iniciar sesión y en cada fallo de caché, y se
+borra cuando el usuario se guarda (cambio de contraseña, desactivación...)
+o se elimina (ver ``signals.py``). Si el hash de la sesión no coincide se
+cae al camino normal de Django, que cierra la sesión si corresponde. La
+caché es un alias de ``CACHES`` (``SWAPPLACE_IDENTIDAD['CACHE']``): con
+varios procesos tiene que ser compartida, o un cambio de contraseña en un
+proceso no invalidaría la identidad guardada en otro hasta su TTL.
+"""
+
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+CAMPOS = ('id', 'username', 'is_active', 'is_staff', 'is_superuser')
+
+
+def _config():
+    return {
+        'CACHE': 'default',
+        'TTL': 300,
+        'VISTAS': (),
+        **getattr(settings, 'SWAPPLACE_IDENTIDAD', {}),
+    }
+
+
+def _cache():
+    return caches[_config()['CACHE']]
+
+
+def _clave(usuario_id):
+    return f'identidad:{usuario_id}'
+
+
+def guardar(user):
+    datos = {c: getattr(user, c) for c in CAMPOS}
+    datos['hash_sesion'] = user.get_session_auth_hash()
+    _cache().set(_clave(user.pk), datos, _config()['TTL'])
+
+
+def olvidar(usuario_id):
+    _cache().delete(_clave(usuario_id))
+
+
+def _desde_cache(datos):
+    User = get_user_model()
+    # from_db deja diferidos los campos que no vienen
+    return User.from_db('default', list(CAMPOS), [datos[c] for c in CAMPOS])
+
+
+def usuario_de_sesion(request):
+    session = request.session
+    try:
+        usuario_id = get_user_model()._meta.pk.to_python(session[SESSION_KEY])
+        backend = session[BACKEND_SESSION_KEY]
+    except (KeyError, ValueError):
+        return AnonymousUser()
+    if backend not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+
+    datos = _cache().get(_clave(usuario_id))
+    if datos is not None and constant_time_compare(session.get(HASH_SESSION_KEY, ''), datos['hash_sesion']):
+        return _desde_cache(datos)
+
+    # fallo de caché o hash distinto: camino normal (base de datos)
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        guardar(user)
+    return user
+
+
+def _usuario(request):
+    if not hasattr(request, '_identidad'):
+        request._identidad = usuario_de_sesion(request)
+    return request._identidad
+
+
+async def _ausuario(request):
+    return await sync_to_async(_usuario)(request)
+
+
+class IdentidadCacheadaMiddleware(MiddlewareMixin):
+    """Va después de ``AuthenticationMiddleware``."""
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        if match is not None and match.url_name in _config()['VISTAS']:
+            request.user = SimpleLazyObject(lambda: _usuario(request))
+            request.auser = partial(_ausuario, request)
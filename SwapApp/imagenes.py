@@ -0,0 +1,86 @@
+"""
+Variantes de ``Producto.imagen``.
+
+Al subir una imagen se generan, fuera del request, copias redimensionadas
+en formatos modernos (AVIF/WebP según lo que soporte Pillow) sin metadatos
+EXIF, y se guardan sus nombres y las dimensiones del original en el
+producto. Las plantillas y ``buscar_productos`` usan esas variantes; el
+original solo se sirve mientras las variantes no estén listas.
+"""
+
+import logging
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+from . import cache, media, tareas
+
+logger = logging.getLogger(__name__)
+
+ANCHOS = (160, 320, 640, 1280)
+CALIDAD = {'avif': 55, 'webp': 80}
+
+
+def formatos_disponibles():
+    return [f for f in ('avif', 'webp') if features.check(f)]
+
+
+def _anchos_para(ancho_original):
+    # No se amplía: solo anchos menores al original, y al menos el más chico.
+    anchos = [a for a in ANCHOS if a < ancho_original]
+    return anchos or [min(ANCHOS[0], ancho_original)]
+
+
+def generar_variantes(imagen_field):
+    """Genera las variantes de un FieldFile y devuelve el dict a guardar en el producto."""
+    storage = imagen_field.storage
+    with imagen_field.open('rb') as f:
+        original = Image.open(f)
+        original.load()
+    # aplica la orientación EXIF antes de descartar los metadatos
+    original = ImageOps.exif_transpose(original)
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'A' in original.getbands() else 'RGB')
+    ancho, alto = original.size
+
+    base = posixpath.splitext(posixpath.basename(imagen_field.name))[0]
+    variantes = {'origen': imagen_field.name, 'ancho': ancho, 'alto': alto}
+    for formato in formatos_disponibles():
+        variantes[formato] = {}
+        for a in _anchos_para(ancho):
+            copia = original.resize((a, max(1, round(alto * a / ancho))), Image.LANCZOS)
+            buf = BytesIO()
+            copia.save(buf, formato.upper(), quality=CALIDAD[formato])
+            nombre = storage.save(f'productos/variantes/{base}_{a}.{formato}', ContentFile(buf.getvalue()))
+            variantes[formato][str(a)] = nombre
+    return variantes
+
+
+def procesar_producto(producto_id):
+    from .models import Producto
+    producto = Producto.objects.filter(id=producto_id).first()
+    if producto is None or not producto.imagen:
+        return
+    try:
+        variantes = generar_variantes(producto.imagen)
+    except (OSError, ValueError):
+        logger.warning('No se pudo procesar la imagen del producto %s', producto_id, exc_info=True)
+        return
+    # update condicional: si mientras tanto cambiaron la imagen, se descarta
+    actualizado = Producto.objects.filter(id=producto_id, imagen=producto.imagen.name).update(
+        imagen_ancho=variantes['ancho'],
+        imagen_alto=variantes['alto'],
+        imagen_variantes=variantes,
+    )
+    if actualizado:
+        media.ajustar_referencias(media.nombres_variantes(producto.imagen_variantes),
+                                  media.nombres_variantes(variantes))
+        cache.invalidar_al_confirmar('productos')
+    # las variantes reemplazadas o descartadas quedan sin referencias: las borra limpiar_media
+
+
+def programar(producto):
+    if producto.imagen and (producto.imagen_variantes or {}).get('origen') != producto.imagen.name:
+        tareas.al_confirmar(procesar_producto, producto.id)
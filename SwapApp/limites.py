@@ -0,0 +1,199 @@
+"""
+Límites de peticiones por usuario y vista.
+
+``LimitesMiddleware`` aplica a cada vista de ``SWAPPLACE_LIMITES['POLITICAS']``
+un cubo de fichas por usuario (por IP si no hay sesión): ``RAFAGA`` fichas
+que se reponen a ``POR_MINUTO``. Sin fichas responde 429 con
+``Retry-After``. Los contadores de permitidas/rechazadas por vista salen en
+``api_metricas``.
+
+El cubo se guarda como GCRA: un solo número por clave, el instante teórico
+en que el cubo vuelve a estar lleno, que equivale a un cubo de fichas sin
+tener que reponerlas con un temporizador.
+
+Almacenes (``BACKEND``):
+
+* ``AlmacenLocal`` (por defecto): un dict del proceso, sin locks. Dos hilos
+  que consumen de la misma clave a la vez pueden dejar pasar una petición
+  de más, nunca bloquear de más. Cada proceso lleva su propia cuenta.
+* ``AlmacenCache``: compartido entre procesos vía un alias de ``CACHES``.
+  Usa ventanas fijas con ``incr`` atómico: el mismo promedio, pero en el
+  borde entre dos ventanas puede pasar hasta el doble de la ráfaga.
+"""
+
+import math
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.module_loading import import_string
+
+
+@dataclass(frozen=True)
+class Politica:
+    rafaga: int
+    por_minuto: float
+
+    @property
+    def intervalo(self):
+        return 60 / self.por_minuto
+
+
+class AlmacenLocal:
+    def __init__(self, max_claves=100_000):
+        self.max_claves = max_claves
+        self._llenos_en = {}
+
+    def consumir(self, clave, politica):
+        """Segundos a esperar; 0 si la petición pasa."""
+        ahora = time.monotonic()
+        lleno_en = max(self._llenos_en.get(clave, ahora), ahora) + politica.intervalo
+        espera = lleno_en - ahora - politica.rafaga * politica.intervalo
+        if espera > 0:
+            return espera
+        self._llenos_en[clave] = lleno_en
+        if len(self._llenos_en) > self.max_claves:
+            self._purgar(ahora)
+        return 0
+
+    def _purgar(self, ahora):
+        # un cubo que ya se llenó es igual a uno que no existe
+        for clave, lleno_en in list(self._llenos_en.items()):
+            if lleno_en <= ahora:
+                self._llenos_en.pop(clave, None)
+
+    def vaciar(self):
+        self._llenos_en.clear()
+
+    def estadisticas(self):
+        return {'backend': type(self).__name__, 'claves': len(self._llenos_en), 'max_claves': self.max_claves}
+
+
+class AlmacenCache:
+    def __init__(self, alias='default', prefijo='limite'):
+        self._cache = caches[alias]
+        self.prefijo = prefijo
+
+    def consumir(self, clave, politica):
+        ventana = politica.rafaga * politica.intervalo
+        ahora = time.time()
+        n = int(ahora // ventana)
+        clave = f'{self.prefijo}:{clave}:{n}'
+        self._cache.add(clave, 0, math.ceil(ventana) + 1)
+        try:
+            usadas = self._cache.incr(clave)
+        except ValueError:
+            # expiró entre add e incr
+            self._cache.set(clave, 1, math.ceil(ventana) + 1)
+            usadas = 1
+        if usadas <= politica.rafaga:
+            return 0
+        return (n + 1) * ventana - ahora
+
+    def vaciar(self):
+        pass  # las ventanas expiran solas
+
+    def estadisticas(self):
+        return {'backend': type(self).__name__}
+
+
+def _config():
+    return {
+        'ACTIVO': True,
+        'BACKEND': 'SwapApp.limites.AlmacenLocal',
+        'OPCIONES': {},
+        'POLITICAS': {},
+        **getattr(settings, 'SWAPPLACE_LIMITES', {}),
+    }
+
+
+_almacen = None
+_politicas = None
+_permitidas = Counter()
+_rechazadas = Counter()
+
+
+def obtener_almacen():
+    global _almacen
+    if _almacen is None:
+        conf = _config()
+        _almacen = import_string(conf['BACKEND'])(**conf['OPCIONES'])
+    return _almacen
+
+
+def politicas():
+    global _politicas
+    if _politicas is None:
+        conf = _config()
+        _politicas = {} if not conf['ACTIVO'] else {
+            vista: Politica(p['RAFAGA'], p['POR_MINUTO']) for vista, p in conf['POLITICAS'].items()
+        }
+    return _politicas
+
+
+def reiniciar():
+    """Vuelve a leer la configuración y vacía cubos y contadores."""
+    global _almacen, _politicas
+    if _almacen is not None:
+        _almacen.vaciar()
+    _almacen = None
+    _politicas = None
+    _permitidas.clear()
+    _rechazadas.clear()
+
+
+def estadisticas():
+    # los contadores son aproximados: se incrementan sin lock
+    return {
+        **obtener_almacen().estadisticas(),
+        'vistas': {v: {'permitidas': _permitidas[v], 'rechazadas': _rechazadas[v]}
+                   for v in sorted(set(_permitidas) | set(_rechazadas))},
+    }
+
+
+def _quien(request):
+    user = request.user
+    if user.is_authenticated:
+        return f'u{user.pk}'
+    return f'ip{request.META.get("REMOTE_ADDR", "")}'
+
+
+class LimitesMiddleware(MiddlewareMixin):
+    """Va después de ``IdentidadCacheadaMiddleware``: usa su ``request.user``."""
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        politica = politicas().get(match.url_name) if match is not None else None
+        if politica is None:
+            return None
+        espera = obtener_almacen().consumir(f'{match.url_name}:{_quien(request)}', politica)
+        if not espera:
+            _permitidas[match.url_name] += 1
+            return None
+        _rechazadas[match.url_name] += 1
+        response = JsonResponse({'ok': False, 'error': 'Demasiadas peticiones, espera un momento.'}, status=429)
+        response['Retry-After'] = str(math.ceil(espera))
+        return response
+
+
+# ---------- MEDICIÓN ----------
+def medir(almacen, n=100_000, claves=1000, politica=None):
+    """Microsegundos por ``consumir`` sobre ``claves`` claves distintas."""
+    politica = politica or Politica(rafaga=n, por_minuto=60 * n)
+    inicio = time.perf_counter()
+    for i in range(n):
+        almacen.consumir(f'medicion:u{i % claves}', politica)
+    return round((time.perf_counter() - inicio) / n * 1e6, 3)
+
+
+def medir_middleware(request, n=100_000):
+    """Microsegundos por ``process_view`` con la configuración actual."""
+    middleware = LimitesMiddleware(lambda r: None)
+    inicio = time.perf_counter()
+    for _ in range(n):
+        middleware.process_view(request, None, (), {})
+    return round((time.perf_counter() - inicio) / n * 1e6, 3)
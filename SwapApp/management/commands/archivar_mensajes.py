@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from SwapApp import archivo
+
+
+class Command(BaseCommand):
+    help = ('Mueve los mensajes anteriores a --dias días a bloques comprimidos por chat, '
+            'dejando en la tabla los --retener más nuevos de cada chat.')
+
+    def add_arguments(self, parser):
+        conf = archivo._config()
+        parser.add_argument('--dias', type=int, default=conf['DIAS'])
+        parser.add_argument('--retener', type=int, default=conf['RETENER'])
+        parser.add_argument('--tamano-bloque', type=int, default=conf['TAMANO_BLOQUE'])
+        parser.add_argument('--max-chats', type=int, help='Procesar como mucho estos chats en esta pasada.')
+
+    def handle(self, *args, **options):
+        antes_de = timezone.now() - timedelta(days=options['dias'])
+        chats, bloques, mensajes = archivo.archivar(antes_de, retener=options['retener'],
+                                                    tamano=options['tamano_bloque'],
+                                                    max_chats=options['max_chats'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{mensajes} mensajes de {chats} chats archivados en {bloques} bloques.'))
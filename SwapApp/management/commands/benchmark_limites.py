@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from django.urls import resolve, reverse
+
+from SwapApp import limites
+
+
+class Command(BaseCommand):
+    help = 'Mide el costo por petición de los límites de peticiones, en microsegundos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', type=int, default=100_000)
+        parser.add_argument('--claves', type=int, default=1000, help='Usuarios distintos simulados.')
+        parser.add_argument('--cache', default='default', help='Alias de CACHES para AlmacenCache.')
+
+    def handle(self, *args, **options):
+        n = options['n']
+        local = limites.medir(limites.AlmacenLocal(), n, options['claves'])
+        compartido = limites.medir(limites.AlmacenCache(options['cache']), n, options['claves'])
+        self.stdout.write(f'AlmacenLocal: {local} µs por petición')
+        self.stdout.write(f'AlmacenCache ({options["cache"]}): {compartido} µs por petición')
+
+        # camino completo del middleware, con una política que siempre deja pasar
+        conf = {**settings.SWAPPLACE_LIMITES, 'BACKEND': 'SwapApp.limites.AlmacenLocal', 'OPCIONES': {},
+                'POLITICAS': {'buscar_productos': {'RAFAGA': n, 'POR_MINUTO': 60 * n}}}
+        with override_settings(SWAPPLACE_LIMITES=conf):
+            for nombre in ('buscar_productos', 'home'):
+                request = RequestFactory().get(reverse(nombre))
+                request.resolver_match = resolve(request.path)
+                request.user = AnonymousUser()
+                costo = limites.medir_middleware(request, n)
+                etiqueta = 'con política' if nombre in limites.politicas() else 'sin política'
+                self.stdout.write(f'middleware en {nombre} ({etiqueta}): {costo} µs por petición')
@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from SwapApp import concurrencia, sembrado
+
+
+class Command(BaseCommand):
+    help = ('Mide cuántas pestañas haciendo long-poll de notificaciones sostiene un proceso, '
+            'con un pool de hilos tipo WSGI y con el event loop (ASGI).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pestanas', default='10,50,200,500',
+                            help='Niveles de concurrencia separados por coma.')
+        parser.add_argument('--modo', action='append', dest='modos', choices=['wsgi', 'asgi'])
+        parser.add_argument('--duracion', type=float, default=5, help='Segundos por nivel.')
+        parser.add_argument('--espera', type=float, default=2, help='Parámetro wait del long-poll.')
+        parser.add_argument('--hilos', type=int, default=8, help='Hilos del modo wsgi.')
+        parser.add_argument('--intervalo-eventos', type=float, default=0.02)
+        parser.add_argument('--latencia-max', type=float, default=1.0,
+                            help='p95 de entrega (s) para considerar sostenido un nivel.')
+        parser.add_argument('--salida', help='Archivo donde escribir el reporte JSON.')
+
+    def handle(self, *args, **options):
+        niveles = [int(n) for n in options['pestanas'].split(',') if n]
+
+        with sembrado.base_de_prueba():
+            reporte = concurrencia.ejecutar(
+                niveles,
+                modos=options['modos'] or ('wsgi', 'asgi'),
+                latencia_max=options['latencia_max'],
+                duracion=options['duracion'],
+                espera=options['espera'],
+                intervalo_eventos=options['intervalo_eventos'],
+                hilos=options['hilos'],
+            )
+
+        for r in reporte['resultados']:
+            self.stdout.write(
+                f"{r['modo']:>4} {r['pestanas']:>5} pestañas: {r['req_por_segundo']:>8} req/s  "
+                f"entrega p50 {r['entrega_p50_ms']} ms  p95 {r['entrega_p95_ms']} ms  "
+                f"errores {r['errores']}  {'OK' if r['sostenido'] else 'saturado'}"
+            )
+        for modo, n in reporte['max_pestanas_sostenidas'].items():
+            self.stdout.write(self.style.SUCCESS(f'{modo}: sostiene {n} pestañas'))
+        if options['salida']:
+            with open(options['salida'], 'w') as f:
+                json.dump(reporte, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,49 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from SwapApp import benchmark, sembrado
+
+
+class Command(BaseCommand):
+    help = ('Mide consultas, tiempo de BD, render y tamaño de respuesta de cada vista '
+            'sobre un marketplace sintético en una base de datos de prueba.')
+
+    def add_arguments(self, parser):
+        escala = sembrado.Escala()
+        for campo in ('usuarios', 'productos', 'trueques', 'chats', 'mensajes_por_chat', 'notificaciones'):
+            parser.add_argument(f'--{campo.replace("_", "-")}', type=int, default=getattr(escala, campo))
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--vista', action='append', dest='vistas', help='Medir solo estas vistas.')
+        parser.add_argument('--umbrales', help='JSON {vista: max_consultas} que sobrescribe los umbrales.')
+        parser.add_argument('--salida', help='Archivo donde escribir el reporte JSON (por defecto stdout).')
+
+    def handle(self, *args, **options):
+        escala = sembrado.Escala(**{
+            campo: options[campo]
+            for campo in ('usuarios', 'productos', 'trueques', 'chats', 'mensajes_por_chat', 'notificaciones')
+        })
+        umbrales = None
+        if options['umbrales']:
+            with open(options['umbrales']) as f:
+                umbrales = json.load(f)
+
+        with sembrado.base_de_prueba():
+            mercado = sembrado.sembrar(escala)
+            reporte = benchmark.ejecutar(mercado, options['repeticiones'], umbrales, options['vistas'])
+
+        reporte['escala'] = vars(escala)
+        reporte['vendor'] = connection.vendor
+        texto = json.dumps(reporte, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w') as f:
+                f.write(texto)
+        else:
+            self.stdout.write(texto)
+
+        for r in reporte['regresiones']:
+            self.stderr.write(self.style.ERROR(f'Regresión: {r}'))
+        if reporte['regresiones']:
+            sys.exit(1)
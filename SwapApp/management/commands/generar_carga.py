@@ -0,0 +1,86 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from SwapApp import carga, sembrado
+
+
+class Command(BaseCommand):
+    help = ('Levanta el proyecto contra una base de prueba y lo carga con usuarios virtuales '
+            '(chat, home y buscador abiertos). Reporta req/s y p50/p95/p99 por vista en cada '
+            'nivel de concurrencia y compara con un reporte anterior.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', default='50,100,250,500',
+                            help='Niveles de usuarios concurrentes separados por coma.')
+        parser.add_argument('--duracion', type=float, default=30, help='Segundos medidos por nivel.')
+        parser.add_argument('--calentamiento', type=float, default=5,
+                            help='Segundos al inicio de cada nivel que no se miden.')
+        parser.add_argument('--hilos', type=int, default=16, help='Peticiones que atiende el servidor a la vez.')
+        parser.add_argument('--mezcla', help='JSON {pestaña: parámetros} que reemplaza la mezcla por defecto.')
+        parser.add_argument('--semilla', type=int, default=1)
+        parser.add_argument('--p95-max', type=float, default=0.5,
+                            help='p95 global (s) para considerar sostenido un nivel.')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--productos-por-usuario', type=int, default=10)
+        parser.add_argument('--mensajes-por-chat', type=int, default=20)
+        parser.add_argument('--salida', help='Archivo donde escribir el reporte JSON.')
+        parser.add_argument('--comparar', metavar='BASE', help='Reporte JSON anterior; sale con 1 si hay regresiones.')
+        parser.add_argument('--tolerancia', type=float, default=0.2,
+                            help='Empeoramiento relativo de p95 o req/s que cuenta como regresión.')
+
+    def handle(self, *args, **options):
+        niveles = [int(n) for n in options['usuarios'].split(',') if n]
+        mezcla = None
+        if options['mezcla']:
+            with open(options['mezcla']) as f:
+                mezcla = json.load(f)
+            desconocidas = set(mezcla) - set(carga.PESTANAS)
+            if desconocidas:
+                raise CommandError(f'Pestañas desconocidas: {", ".join(sorted(desconocidas))}')
+        base = None
+        if options['comparar']:
+            with open(options['comparar']) as f:
+                base = json.load(f)
+
+        # el servidor atiende con varios hilos: SQLite en archivo, no en memoria
+        with sembrado.base_de_prueba(en_archivo=True, debug=False):
+            reporte = carga.ejecutar(
+                niveles,
+                duracion=options['duracion'],
+                calentamiento=options['calentamiento'],
+                hilos=options['hilos'],
+                mezcla=mezcla,
+                semilla=options['semilla'],
+                p95_max=options['p95_max'],
+                timeout=options['timeout'],
+                productos_por_usuario=options['productos_por_usuario'],
+                mensajes_por_chat=options['mensajes_por_chat'],
+            )
+
+        for r in reporte['resultados']:
+            self.stdout.write(
+                f"{r['usuarios']:>5} usuarios: {r['req_por_segundo']:>8} req/s  p50 {r['p50_ms']} ms  "
+                f"p95 {r['p95_ms']} ms  p99 {r['p99_ms']} ms  errores {r['errores']}  "
+                f"429 {r['limitadas']}  {'OK' if r['sostenido'] else 'saturado'}"
+            )
+            for vista, v in r['vistas'].items():
+                self.stdout.write(
+                    f"    {vista:<20} {v['req_por_segundo']:>8} req/s  p50 {v['p50_ms']}  "
+                    f"p95 {v['p95_ms']}  p99 {v['p99_ms']}  errores {v['errores']}  429 {v['limitadas']}"
+                )
+        self.stdout.write(self.style.SUCCESS(f"Sostiene {reporte['max_usuarios_sostenidos']} usuarios."))
+        if options['salida']:
+            with open(options['salida'], 'w') as f:
+                json.dump(reporte, f, indent=2, ensure_ascii=False)
+
+        if base is not None:
+            try:
+                regresiones = carga.comparar(reporte, base, options['tolerancia'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            for r in regresiones:
+                self.stderr.write(self.style.ERROR(f'Regresión: {r}'))
+            if regresiones:
+                sys.exit(1)
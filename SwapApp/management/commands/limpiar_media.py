@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from SwapApp import media
+
+
+class Command(BaseCommand):
+    help = ('Borra los archivos subidos que ningún producto usa desde hace más de --gracia segundos. '
+            'Con --disco recorre también MEDIA_ROOT buscando archivos sin registrar.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gracia', type=int, default=media._config()['GRACIA'])
+        parser.add_argument('--disco', action='store_true',
+                            help='Borrar también los archivos del disco que no tienen referencias.')
+        parser.add_argument('--recontar', action='store_true',
+                            help='Antes de limpiar, recalcular las referencias desde los productos.')
+        parser.add_argument('--simular', action='store_true', help='Solo informar qué se borraría.')
+
+    def handle(self, *args, **options):
+        if options['recontar']:
+            self.stdout.write(f'{media.recontar()} contadores corregidos.')
+        archivos, liberados = media.limpiar(gracia=options['gracia'], disco=options['disco'],
+                                            simular=options['simular'])
+        verbo = 'se borrarían' if options['simular'] else 'borrados'
+        self.stdout.write(self.style.SUCCESS(
+            f'{archivos} archivos {verbo} ({liberados / 1024 / 1024:.1f} MB).'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from SwapApp import imagenes
+from SwapApp.models import Producto
+
+
+class Command(BaseCommand):
+    help = 'Genera las variantes de imagen de los productos que aún no las tienen.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true', help='Regenera también las que ya existen.')
+
+    def handle(self, *args, **options):
+        total = 0
+        for p in Producto.objects.exclude(imagen='').exclude(imagen__isnull=True).iterator():
+            if options['todas'] or p.imagen_variantes.get('origen') != p.imagen.name:
+                imagenes.procesar_producto(p.id)
+                total += 1
+        self.stdout.write(self.style.SUCCESS(f'{total} imágenes procesadas.'))
@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from SwapApp import notificaciones
+
+
+class Command(BaseCommand):
+    help = 'Borra por lotes las notificaciones ya leídas más antiguas que --dias.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=30)
+        parser.add_argument('--lote', type=int, default=1000)
+        parser.add_argument('--archivo', help='Antes de borrar, agrega las filas a este .jsonl.gz.')
+
+    def handle(self, *args, **options):
+        antes_de = timezone.now() - timedelta(days=options['dias'])
+        total = notificaciones.purgar(antes_de, lote=options['lote'], archivo=options['archivo'])
+        self.stdout.write(self.style.SUCCESS(f'{total} notificaciones purgadas.'))
@@ -0,0 +1,62 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from SwapApp import emparejamiento
+
+
+class Command(BaseCommand):
+    help = ('Rearma el grafo de pedidos pendientes, cuenta los intercambios posibles e incrementa '
+            'la generación en la caché para que los procesos que la comparten rearmen el suyo. '
+            'Con --sintetico mide sobre un grafo aleatorio.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sintetico', type=int, metavar='PRODUCTOS',
+                            help='Medir sobre un grafo aleatorio de N productos, sin tocar la base.')
+        parser.add_argument('--pedidos-por-usuario', type=int, default=3)
+        parser.add_argument('--largo-maximo', type=int, default=emparejamiento._config()['LARGO_MAXIMO'])
+        parser.add_argument('--muestras', type=int, default=1000,
+                            help='Usuarios al azar para medir la búsqueda individual.')
+        parser.add_argument('--limite', type=int, help='Máximo de ciclos a enumerar.')
+        parser.add_argument('--salida', help='Archivo donde escribir el reporte JSON.')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        if options['sintetico']:
+            g = emparejamiento.sintetico(options['sintetico'],
+                                         pedidos_por_usuario=options['pedidos_por_usuario'])
+        else:
+            g = emparejamiento.desde_bd()
+        armado = time.perf_counter() - inicio
+
+        reporte = emparejamiento.medir(g, options['largo_maximo'], options['muestras'], options['limite'])
+        reporte['armado_s'] = round(armado, 3)
+        if options['sintetico']:
+            reporte['productos'] = options['sintetico']
+        else:
+            emparejamiento.invalidar()
+
+        self.stdout.write(
+            f"{reporte['pedidos']} pedidos de {reporte['usuarios_con_pedidos']} usuarios, "
+            f"armado en {reporte['armado_s']} s"
+        )
+        for largo, n in reporte['ciclos_por_largo'].items():
+            self.stdout.write(f'  {n} intercambios de {largo}')
+        self.stdout.write(
+            f"recálculo completo {reporte['recalculo_s']} s; por usuario p50 "
+            f"{reporte['por_usuario_p50_ms']} ms, p95 {reporte['por_usuario_p95_ms']} ms"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{reporte['usuarios_con_sugerencia']} usuarios con al menos una sugerencia."))
+        if not options['sintetico']:
+            if emparejamiento.generacion_compartida():
+                self.stdout.write('Generación incrementada: los procesos rearman su grafo en el próximo uso.')
+            else:
+                self.stderr.write(self.style.WARNING(
+                    f"La caché '{emparejamiento._config()['CACHE']}' es de memoria local: los demás "
+                    f"procesos no ven la nueva generación y rearman su grafo recién a los "
+                    f"{emparejamiento._config()['MAX_EDAD']} s."))
+        if options['salida']:
+            with open(options['salida'], 'w') as f:
+                json.dump(reporte, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from SwapApp import reputacion
+
+
+class Command(BaseCommand):
+    help = ('Recalcula la reputación de cada usuario desde sus calificaciones y reportes. '
+            'Con --verificar solo informa cuántos agregados no coinciden.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Usuarios por transacción.')
+        parser.add_argument('--verificar', action='store_true', help='No corregir, solo contar diferencias.')
+
+    def handle(self, *args, **options):
+        usuarios, diferencias = reputacion.recalcular(lote=options['lote'], corregir=not options['verificar'])
+        verbo = 'con diferencias' if options['verificar'] else 'corregidos'
+        self.stdout.write(self.style.SUCCESS(f'{usuarios} usuarios revisados, {diferencias} {verbo}.'))
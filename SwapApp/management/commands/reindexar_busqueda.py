@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from SwapApp import busqueda
+from SwapApp.models import Producto
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de todos los productos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500)
+
+    def handle(self, *args, **options):
+        total = 0
+        for p in Producto.objects.select_related('usuario').iterator(chunk_size=options['lote']):
+            busqueda.indexar(p)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f'{total} productos indexados.'))
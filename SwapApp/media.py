@@ -0,0 +1,235 @@
+"""
+Archivos subidos direccionados por contenido.
+
+``AlmacenPorContenido`` (el storage ``default`` en ``STORAGES``) guarda cada
+archivo como ``<carpeta>/<h[:2]>/<h>.<ext>``, con ``h`` el SHA-256 de su
+contenido: dos imágenes iguales son un solo archivo y un nombre nunca cambia
+de contenido, así que se puede cachear para siempre (``servir`` responde con
+``Cache-Control: immutable`` y admite ``Range``).
+
+Cada nombre tiene una fila ``ArchivoMedia`` con cuántos ``Producto`` lo usan
+(la imagen o alguna de sus variantes). Las señales de ``Producto`` ajustan
+las referencias al guardar y borrar; lo que escribe con ``update()``
+(``imagenes.procesar_producto``) llama a ``ajustar_referencias``. Nada se
+borra en el request: ``limpiar_media`` elimina después los archivos sin
+referencias desde hace más de ``GRACIA`` segundos, y con ``--disco`` también
+los que no tienen fila (subidas cuya transacción no se confirmó, archivos
+de antes de este esquema).
+"""
+
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db.models import F
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import http_date
+
+INMUTABLE = 'public, max-age=31536000, immutable'
+_DIRECCIONADO = re.compile(r'(?:^|/)[0-9a-f]{2}/([0-9a-f]{64})\.[a-z0-9]+$')
+TROZO = 64 * 1024
+
+
+def _config():
+    return {
+        'GRACIA': 3600,
+        **getattr(settings, 'SWAPPLACE_MEDIA', {}),
+    }
+
+
+def huella(archivo):
+    h = hashlib.sha256()
+    if hasattr(archivo, 'seek'):
+        archivo.seek(0)
+    for trozo in archivo.chunks():
+        h.update(trozo)
+    if hasattr(archivo, 'seek'):
+        archivo.seek(0)
+    return h.hexdigest()
+
+
+def nombre_por_contenido(nombre, archivo):
+    carpeta = posixpath.dirname(nombre)
+    ext = posixpath.splitext(nombre)[1].lower()
+    h = huella(archivo)
+    return posixpath.join(carpeta, h[:2], f'{h}{ext}')
+
+
+class AlmacenPorContenido(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = nombre_por_contenido(name, content)
+        if self.exists(name):
+            # mismo contenido: se reutiliza; el mtime nuevo lo protege de limpiar_media
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
+
+
+# ---------- REFERENCIAS ----------
+def nombres_variantes(variantes):
+    # {'origen': ..., 'ancho': ..., 'webp': {ancho: nombre}, 'avif': {...}}
+    return [n for v in (variantes or {}).values() if isinstance(v, dict) for n in v.values()]
+
+
+def archivos_guardados(producto_id):
+    from .models import Producto
+    producto = Producto.objects.filter(id=producto_id).only('imagen', 'imagen_variantes').first()
+    return producto.archivos_media() if producto is not None else set()
+
+
+def ajustar_referencias(anteriores, nuevos):
+    from .models import ArchivoMedia
+    anteriores = set(anteriores or ()) - {''}
+    nuevos = set(nuevos or ()) - {''}
+    agregar, quitar = nuevos - anteriores, anteriores - nuevos
+    ahora = timezone.now()
+    if agregar:
+        ArchivoMedia.objects.bulk_create([ArchivoMedia(nombre=n) for n in agregar], ignore_conflicts=True)
+        ArchivoMedia.objects.filter(nombre__in=agregar).update(referencias=F('referencias') + 1, actualizado=ahora)
+    if quitar:
+        (ArchivoMedia.objects.filter(nombre__in=quitar, referencias__gt=0)
+         .update(referencias=F('referencias') - 1, actualizado=ahora))
+
+
+def recontar():
+    """Recalcula las referencias desde los productos. Devuelve cuántas filas cambiaron."""
+    from .models import ArchivoMedia, Producto
+    cuentas = {}
+    for p in Producto.objects.only('imagen', 'imagen_variantes').iterator(chunk_size=2000):
+        for n in p.archivos_media():
+            cuentas[n] = cuentas.get(n, 0) + 1
+    ArchivoMedia.objects.bulk_create([ArchivoMedia(nombre=n) for n in cuentas], ignore_conflicts=True)
+    cambiadas = []
+    ahora = timezone.now()
+    for a in ArchivoMedia.objects.iterator(chunk_size=2000):
+        if a.referencias != cuentas.get(a.nombre, 0):
+            a.referencias = cuentas.get(a.nombre, 0)
+            a.actualizado = ahora
+            cambiadas.append(a)
+    ArchivoMedia.objects.bulk_update(cambiadas, ['referencias', 'actualizado'], batch_size=1000)
+    return len(cambiadas)
+
+
+# ---------- LIMPIEZA ----------
+def _viejo(storage, nombre, limite):
+    try:
+        return os.stat(storage.path(nombre)).st_mtime < limite.timestamp()
+    except FileNotFoundError:
+        return True
+
+
+def limpiar(gracia=None, disco=False, simular=False, storage=None):
+    """Borra archivos sin referencias. Devuelve ``(archivos, bytes)`` liberados."""
+    from .models import ArchivoMedia
+    storage = storage or default_storage
+    gracia = _config()['GRACIA'] if gracia is None else gracia
+    limite = timezone.now() - timedelta(seconds=gracia)
+    borrados, liberados = 0, 0
+
+    def borrar(nombre):
+        nonlocal borrados, liberados
+        try:
+            tamano = storage.size(nombre)
+        except FileNotFoundError:
+            tamano = 0
+        if not simular:
+            storage.delete(nombre)
+        borrados += 1
+        liberados += tamano
+
+    for a in ArchivoMedia.objects.filter(referencias=0, actualizado__lt=limite).iterator():
+        if not _viejo(storage, a.nombre, limite):
+            continue
+        # condicional: si alguien volvió a referenciarlo, no se toca
+        if simular or ArchivoMedia.objects.filter(id=a.id, referencias=0).delete()[0]:
+            borrar(a.nombre)
+
+    if disco:
+        vivos = set(ArchivoMedia.objects.filter(referencias__gt=0).values_list('nombre', flat=True))
+        for raiz, _, archivos in os.walk(storage.location):
+            for f in archivos:
+                nombre = os.path.relpath(os.path.join(raiz, f), storage.location).replace(os.sep, '/')
+                if nombre not in vivos and _viejo(storage, nombre, limite):
+                    borrar(nombre)
+    return borrados, liberados
+
+
+# ---------- SERVIR ----------
+def _rango(cabecera, tamano):
+    """``(inicio, fin)`` inclusivo, None para responder entero o False si no se puede cumplir."""
+    m = re.fullmatch(r'bytes=(\d*)-(\d*)', (cabecera or '').strip())
+    if m is None or m.group(1) == m.group(2) == '':
+        return None  # sin Range, rangos múltiples o sintaxis inválida: se ignora
+    if m.group(1) == '':
+        largo = int(m.group(2))
+        if not largo:
+            return False
+        return max(0, tamano - largo), tamano - 1
+    inicio = int(m.group(1))
+    fin = min(int(m.group(2)), tamano - 1) if m.group(2) else tamano - 1
+    if inicio >= tamano or fin < inicio:
+        return False
+    return inicio, fin
+
+
+def _trozos(camino, inicio, largo):
+    with open(camino, 'rb') as f:
+        f.seek(inicio)
+        while largo > 0:
+            datos = f.read(min(TROZO, largo))
+            if not datos:
+                break
+            largo -= len(datos)
+            yield datos
+
+
+def servir(request, ruta):
+    try:
+        camino = default_storage.path(ruta)
+        st = os.stat(camino)
+    except (SuspiciousFileOperation, FileNotFoundError, NotADirectoryError):
+        raise Http404
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404
+
+    direccionado = _DIRECCIONADO.search(ruta)
+    etag = f'"{direccionado.group(1)}"' if direccionado else f'"{int(st.st_mtime)}-{st.st_size}"'
+    cabeceras = {
+        'ETag': etag,
+        'Last-Modified': http_date(st.st_mtime),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': INMUTABLE if direccionado else 'public, max-age=3600',
+    }
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        rango = _rango(request.headers.get('Range'), st.st_size)
+        if request.headers.get('If-Range', etag) != etag:
+            rango = None  # cambió desde que el cliente bajó la primera parte
+        tipo = mimetypes.guess_type(camino)[0] or 'application/octet-stream'
+        if rango is None:
+            response = FileResponse(open(camino, 'rb'), content_type=tipo)
+        elif rango is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{st.st_size}'
+        else:
+            inicio, fin = rango
+            response = StreamingHttpResponse(_trozos(camino, inicio, fin - inicio + 1), status=206, content_type=tipo)
+            response['Content-Range'] = f'bytes {inicio}-{fin}/{st.st_size}'
+            response['Content-Length'] = str(fin - inicio + 1)
+    for clave, valor in cabeceras.items():
+        response[clave] = valor
+    return response
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-18 08:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SwapApp', '0004_alter_mensaje_contenido'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mensaje',
+            index=models.Index(fields=['chat', 'id'], name='mensaje_chat_id_idx'),
+        ),
+    ]
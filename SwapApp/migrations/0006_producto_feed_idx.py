@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-18 08:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SwapApp', '0005_mensaje_chat_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['-fecha_agregado', '-id'], name='producto_feed_idx'),
+        ),
+    ]
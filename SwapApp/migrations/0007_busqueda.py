@@ -0,0 +1,83 @@
+# Generated by Django 5.0.14 on 2026-10-18 08:50
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Copia de la normalización de busqueda.py tal como estaba al crear el
+# índice: la migración no debe cambiar si el módulo cambia después.
+PESOS = {'nombre': 3, 'usuario': 2, 'descripcion': 1}
+_PALABRA = re.compile(r'[a-z0-9]+')
+
+
+def _tokenizar(texto):
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    return [t[:40] for t in _PALABRA.findall(texto) if len(t) >= 2]
+
+
+def _terminos(nombre, descripcion, usuario):
+    pesos = {}
+    for campo, texto in (('nombre', nombre), ('descripcion', descripcion), ('usuario', usuario)):
+        for t in set(_tokenizar(texto)):
+            pesos[t] = pesos.get(t, 0) + PESOS[campo]
+    return pesos
+
+
+def _documento(nombre, descripcion, usuario):
+    partes = [nombre] * PESOS['nombre'] + [usuario] * PESOS['usuario'] + [descripcion]
+    return ' '.join(' '.join(_tokenizar(p)) for p in partes)
+
+
+def crear_fulltext(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(
+            'ALTER TABLE SwapApp_documentobusqueda ADD FULLTEXT INDEX documento_texto_ft (texto)'
+        )
+
+
+def indexar_productos(apps, schema_editor):
+    Producto = apps.get_model('SwapApp', 'Producto')
+    TerminoBusqueda = apps.get_model('SwapApp', 'TerminoBusqueda')
+    DocumentoBusqueda = apps.get_model('SwapApp', 'DocumentoBusqueda')
+    for p in Producto.objects.select_related('usuario').iterator():
+        pesos = _terminos(p.nombre, p.descripcion, p.usuario.username)
+        TerminoBusqueda.objects.bulk_create([
+            TerminoBusqueda(producto=p, termino=t, peso=peso) for t, peso in pesos.items()
+        ])
+        DocumentoBusqueda.objects.create(
+            producto=p, texto=_documento(p.nombre, p.descripcion, p.usuario.username)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SwapApp', '0006_producto_feed_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentoBusqueda',
+            fields=[
+                ('producto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='documento', serialize=False, to='SwapApp.producto')),
+                ('texto', models.TextField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TerminoBusqueda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('termino', models.CharField(max_length=40)),
+                ('peso', models.PositiveSmallIntegerField()),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terminos', to='SwapApp.producto')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['termino', 'producto'], name='termino_producto_idx')],
+            },
+        ),
+        migrations.RunPython(crear_fulltext, migrations.RunPython.noop),
+        migrations.RunPython(indexar_productos, migrations.RunPython.noop),
+    ]
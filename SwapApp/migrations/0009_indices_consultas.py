@@ -0,0 +1,27 @@
+# Generated by Django 5.0.14 on 2026-10-18 08:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SwapApp', '0008_producto_imagen_variantes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['usuario', '-creado', 'visible'], name='notif_usuario_creado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trueque',
+            index=models.Index(fields=['receptor', 'estado', '-fecha'], name='trueque_receptor_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trueque',
+            index=models.Index(fields=['solicitante', 'estado', '-fecha'], name='trueque_solicit_estado_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.14 on 2026-10-18 09:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def contar_no_leidas(apps, schema_editor):
+    Notificacion = apps.get_model('SwapApp', 'Notificacion')
+    EstadoNotificaciones = apps.get_model('SwapApp', 'EstadoNotificaciones')
+    conteos = (Notificacion.objects.values('usuario_id')
+               .annotate(n=Count('id', filter=Q(visible=True))).order_by())
+    EstadoNotificaciones.objects.bulk_create(
+        [EstadoNotificaciones(usuario_id=c['usuario_id'], no_leidas=c['n']) for c in conteos],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SwapApp', '0010_notificacion_agrupacion'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadoNotificaciones',
+            fields=[
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='estado_notificaciones', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('no_leidas', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(contar_no_leidas, migrations.RunPython.noop),
+    ]
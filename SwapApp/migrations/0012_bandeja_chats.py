@@ -0,0 +1,69 @@
+# Generated by Django 5.0.14 on 2026-10-18 09:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def armar_bandeja(apps, schema_editor):
+    # el historial existente se considera leído
+    Chat = apps.get_model('SwapApp', 'Chat')
+    Mensaje = apps.get_model('SwapApp', 'Mensaje')
+    ParticipanteChat = apps.get_model('SwapApp', 'ParticipanteChat')
+    for chat in Chat.objects.prefetch_related('usuarios').iterator(chunk_size=500):
+        ultimo = Mensaje.objects.filter(chat=chat).order_by('-id').first()
+        if ultimo is not None:
+            chat.ultimo_mensaje_id = ultimo.id
+            chat.ultima_actividad = ultimo.fecha
+            chat.vista_previa = ' '.join(ultimo.contenido.split())[:120]
+            chat.save(update_fields=['ultimo_mensaje_id', 'ultima_actividad', 'vista_previa'])
+        ParticipanteChat.objects.bulk_create([
+            ParticipanteChat(chat=chat, usuario=u, ultimo_leido_id=chat.ultimo_mensaje_id or 0,
+                             ultima_actividad=chat.ultima_actividad or chat.creado)
+            for u in chat.usuarios.all()
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SwapApp', '0011_estado_notificaciones'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='ultima_actividad',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='ultimo_mensaje_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='vista_previa',
+            field=models.CharField(blank=True, max_length=120),
+        ),
+        migrations.CreateModel(
+            name='ParticipanteChat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ultimo_leido_id', models.PositiveBigIntegerField(default=0)),
+                ('no_leidos', models.PositiveIntegerField(default=0)),
+                ('ultima_actividad', models.DateTimeField()),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participantes', to='SwapApp.chat')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participaciones', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['usuario', '-ultima_actividad'], name='participante_actividad_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='participantechat',
+            constraint=models.UniqueConstraint(fields=('chat', 'usuario'), name='participante_chat_unico'),
+        ),
+        migrations.RunPython(armar_bandeja, migrations.RunPython.noop),
+    ]
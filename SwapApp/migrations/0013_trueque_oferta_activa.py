@@ -0,0 +1,38 @@
+# Generated by Django 5.0.14 on 2026-10-18 09:19
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def marcar_activas(apps, schema_editor):
+    Trueque = apps.get_model('SwapApp', 'Trueque')
+    Trueque.objects.exclude(estado='pendiente').update(activa=None)
+    # ofertas pendientes repetidas: queda la primera
+    repetidas = (Trueque.objects.filter(estado='pendiente').values('solicitante_id', 'producto_id')
+                 .annotate(n=Count('id'), primera=Min('id')).filter(n__gt=1).order_by())
+    for r in repetidas:
+        (Trueque.objects.filter(estado='pendiente', solicitante_id=r['solicitante_id'],
+                                producto_id=r['producto_id'])
+         .exclude(id=r['primera']).delete())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SwapApp', '0012_bandeja_chats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trueque',
+            name='activa',
+            field=models.BooleanField(default=True, editable=False, null=True),
+        ),
+        migrations.RunPython(marcar_activas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='trueque',
+            constraint=models.UniqueConstraint(fields=('solicitante', 'producto', 'activa'), name='trueque_oferta_activa_unica'),
+        ),
+    ]
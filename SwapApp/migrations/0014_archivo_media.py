@@ -0,0 +1,42 @@
+# Generated by Django 5.0.14 on 2026-10-18 09:27
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def contar_referencias(apps, schema_editor):
+    # los archivos de antes conservan su nombre; solo se cuentan sus usos
+    Producto = apps.get_model('SwapApp', 'Producto')
+    ArchivoMedia = apps.get_model('SwapApp', 'ArchivoMedia')
+    cuentas = Counter()
+    for imagen, variantes in Producto.objects.values_list('imagen', 'imagen_variantes').iterator():
+        nombres = {n for v in (variantes or {}).values() if isinstance(v, dict) for n in v.values()}
+        if imagen:
+            nombres.add(imagen)
+        cuentas.update(nombres)
+    ArchivoMedia.objects.bulk_create([ArchivoMedia(nombre=n, referencias=c) for n, c in cuentas.items()],
+                                     batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SwapApp', '0013_trueque_oferta_activa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivoMedia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=255, unique=True)),
+                ('referencias', models.PositiveIntegerField(default=0)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['referencias', 'actualizado'], name='media_huerfanos_idx')],
+            },
+        ),
+        migrations.RunPython(contar_referencias, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.14 on 2026-10-18 09:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SwapApp', '0014_archivo_media'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BloqueMensajes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('desde_id', models.PositiveBigIntegerField()),
+                ('hasta_id', models.PositiveBigIntegerField()),
+                ('cantidad', models.PositiveIntegerField()),
+                ('datos', models.BinaryField()),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bloques', to='SwapApp.chat')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['chat', 'desde_id'], name='bloque_chat_desde_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.0.14 on 2026-10-18 09:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SwapApp', '0015_bloque_mensajes'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reputacion',
+            fields=[
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reputacion', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('calificaciones', models.PositiveIntegerField(default=0)),
+                ('suma', models.PositiveIntegerField(default=0)),
+                ('promedio', models.FloatField(default=0)),
+                ('puntaje', models.FloatField(default=0)),
+                ('reportes', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Reporte',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('motivo', models.TextField(blank=True, max_length=500)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('autor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reportes_hechos', to=settings.AUTH_USER_MODEL)),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reportes', to='SwapApp.chat')),
+                ('reportado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reportes_recibidos', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Calificacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('puntaje', models.PositiveSmallIntegerField()),
+                ('fecha', models.DateTimeField(auto_now=True)),
+                ('autor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calificaciones_hechas', to=settings.AUTH_USER_MODEL)),
+                ('calificado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calificaciones_recibidas', to=settings.AUTH_USER_MODEL)),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calificaciones', to='SwapApp.chat')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['calificado'], name='calificacion_calificado_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='calificacion',
+            constraint=models.UniqueConstraint(fields=('chat', 'autor'), name='calificacion_unica_por_chat'),
+        ),
+        migrations.AddIndex(
+            model_name='reporte',
+            index=models.Index(fields=['reportado'], name='reporte_reportado_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='reporte',
+            constraint=models.UniqueConstraint(fields=('chat', 'autor'), name='reporte_unico_por_chat'),
+        ),
+    ]
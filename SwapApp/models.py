@@ -6,11 +6,76 @@ class Producto(models.Model):
     nombre = models.CharField(max_length=100)
     descripcion = models.TextField()
     imagen = models.ImageField(upload_to='productos/', blank=True, null=True)
+    # los completa SwapApp.imagenes en segundo plano después de subir la imagen
+    imagen_ancho = models.PositiveIntegerField(null=True, blank=True)
+    imagen_alto = models.PositiveIntegerField(null=True, blank=True)
+    imagen_variantes = models.JSONField(default=dict, blank=True)
     fecha_agregado = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # feed del home paginado por cursor (fecha_agregado, id)
+            models.Index(fields=['-fecha_agregado', '-id'], name='producto_feed_idx'),
+        ]
+
+    # archivos que la fila tiene en la base; None si se cargó sin la imagen
+    _media_guardada = frozenset()
+
     def __str__(self):
         return self.nombre
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        cargada = 'imagen' in field_names and 'imagen_variantes' in field_names
+        instancia._media_guardada = instancia.archivos_media() if cargada else None
+        return instancia
+
+    def archivos_media(self):
+        """Nombres en el storage que usa el producto: la imagen y todas sus variantes."""
+        from .media import nombres_variantes
+        nombres = set(nombres_variantes(self.imagen_variantes))
+        if self.imagen:
+            nombres.add(self.imagen.name)
+        return nombres
+
+    def _variantes_vigentes(self):
+        v = self.imagen_variantes or {}
+        return v if self.imagen and v.get('origen') == self.imagen.name else {}
+
+    def imagen_urls(self, formato='webp'):
+        """{ancho: url} de las variantes de un formato (vacío si aún no se generan)."""
+        storage = self.imagen.storage
+        return {int(a): storage.url(n) for a, n in self._variantes_vigentes().get(formato, {}).items()}
+
+    @property
+    def imagen_srcset(self):
+        from .imagenes import formatos_disponibles
+        srcset = {}
+        for formato in formatos_disponibles():
+            urls = self.imagen_urls(formato)
+            if urls:
+                srcset[formato] = ', '.join(f'{u} {a}w' for a, u in sorted(urls.items()))
+        return srcset
+
+    def miniatura_url(self, ancho):
+        # la variante más chica que cubre el ancho pedido, o el original
+        urls = self.imagen_urls('webp')
+        for a in sorted(urls):
+            if a >= ancho:
+                return urls[a]
+        if urls:
+            return urls[max(urls)]
+        return self.imagen.url if self.imagen else None
+
+    @property
+    def miniatura_tarjeta(self):
+        return self.miniatura_url(640)
+
+    @property
+    def miniatura_preview(self):
+        return self.miniatura_url(160)
+
 
 class Trueque(models.Model):
     ESTADOS = [
@@ -22,16 +87,40 @@ class Trueque(models.Model):
     receptor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='trueques_recibidos')
     producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
     estado = models.CharField(max_length=10, choices=ESTADOS, default='pendiente')
+    # True mientras está pendiente y NULL después: con la restricción única
+    # deja una sola oferta pendiente por (solicitante, producto)
+    activa = models.BooleanField(null=True, default=True, editable=False)
     fecha = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['solicitante', 'producto', 'activa'],
+                                    name='trueque_oferta_activa_unica'),
+        ]
+        indexes = [
+            # solicitudes pendientes que recibe un usuario / trueques aceptados (rama receptor)
+            models.Index(fields=['receptor', 'estado', '-fecha'], name='trueque_receptor_estado_idx'),
+            # trueques aceptados (rama solicitante)
+            models.Index(fields=['solicitante', 'estado', '-fecha'], name='trueque_solicit_estado_idx'),
+        ]
+
     def __str__(self):
         return f"{self.solicitante.username} → {self.receptor.username} ({self.estado})"
 
+    def save(self, *args, **kwargs):
+        # las transiciones normales van por SwapApp.trueques; esto cubre el admin
+        self.activa = True if self.estado == 'pendiente' else None
+        super().save(*args, **kwargs)
+
 
 class Chat(models.Model):
     trueque = models.OneToOneField(Trueque, on_delete=models.CASCADE, related_name='chat')
     usuarios = models.ManyToManyField(User)
     creado = models.DateTimeField(auto_now_add=True)
+    # bandeja: datos del último mensaje, mantenidos por bandeja.py al crear cada Mensaje
+    ultimo_mensaje_id = models.PositiveBigIntegerField(null=True, blank=True)
+    ultima_actividad = models.DateTimeField(null=True, blank=True)
+    vista_previa = models.CharField(max_length=120, blank=True)
 
     def __str__(self):
         try:
@@ -41,24 +130,188 @@ class Chat(models.Model):
         return f"Chat entre {nombres}"
 
 
+class ParticipanteChat(models.Model):
+    # una fila por usuario de Chat.usuarios: cursor de lectura y orden de la bandeja
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='participantes')
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='participaciones')
+    ultimo_leido_id = models.PositiveBigIntegerField(default=0)
+    no_leidos = models.PositiveIntegerField(default=0)
+    ultima_actividad = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chat', 'usuario'], name='participante_chat_unico'),
+        ]
+        indexes = [
+            # barra lateral: chats del usuario por actividad reciente
+            models.Index(fields=['usuario', '-ultima_actividad'], name='participante_actividad_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.usuario_id} en chat {self.chat_id}"
+
+
 class Mensaje(models.Model):
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='mensajes')
     autor = models.ForeignKey(User, on_delete=models.CASCADE)
     contenido = models.TextField(max_length=500)
     fecha = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # paginación por cursor (since_id / before_id) dentro de un chat
+            models.Index(fields=['chat', 'id'], name='mensaje_chat_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.autor.username}: {self.contenido[:30]}"
 
 
+class BloqueMensajes(models.Model):
+    # mensajes archivados de un chat: JSON por línea comprimido con zlib; SwapApp.archivo
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='bloques')
+    desde_id = models.PositiveBigIntegerField()
+    hasta_id = models.PositiveBigIntegerField()
+    cantidad = models.PositiveIntegerField()
+    datos = models.BinaryField()
+    creado = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['chat', 'desde_id'], name='bloque_chat_desde_idx'),
+        ]
+
+    def __str__(self):
+        return f"Chat {self.chat_id}: mensajes {self.desde_id}–{self.hasta_id}"
+
+
 class Notificacion(models.Model):
     usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notificaciones')
     titulo = models.CharField(max_length=150)
     mensaje = models.CharField(max_length=300)
     tipo = models.CharField(max_length=50, blank=True)
     link = models.CharField(max_length=300, blank=True)  # ruta relativa p.ej. '/chat/5/'
+    # eventos con la misma agrupación se juntan en una sola notificación visible
+    agrupacion = models.CharField(max_length=100, blank=True)
+    cantidad = models.PositiveIntegerField(default=1)
     creado = models.DateTimeField(auto_now_add=True)
     visible = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # últimas notificaciones visibles de un usuario: las dos igualdades
+            # primero, así el orden por -creado sale del índice sin ordenar aparte
+            models.Index(fields=['usuario', 'visible', '-creado'], name='notif_usuario_visible_idx'),
+            models.Index(fields=['usuario', 'agrupacion'], name='notif_usuario_agrupacion_idx'),
+        ]
+
     def __str__(self):
         return f"Notif a {self.usuario.username}: {self.titulo}"
+
+
+class EstadoNotificaciones(models.Model):
+    # contador de notificaciones visibles (no leídas); lo mantiene
+    # notificaciones.py en la misma transacción que crea o marca las filas
+    usuario = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True,
+                                   related_name='estado_notificaciones')
+    no_leidas = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.usuario.username}: {self.no_leidas} sin leer"
+
+
+# ---------- REPUTACIÓN ----------
+class Calificacion(models.Model):
+    # un participante califica a la otra parte del chat; calificar de nuevo la reemplaza
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='calificaciones')
+    autor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='calificaciones_hechas')
+    calificado = models.ForeignKey(User, on_delete=models.CASCADE, related_name='calificaciones_recibidas')
+    puntaje = models.PositiveSmallIntegerField()
+    fecha = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chat', 'autor'], name='calificacion_unica_por_chat'),
+        ]
+        indexes = [
+            # recalcular_reputacion agrupa por calificado
+            models.Index(fields=['calificado'], name='calificacion_calificado_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.autor_id} → {self.calificado_id}: {self.puntaje}"
+
+
+class Reporte(models.Model):
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='reportes')
+    autor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reportes_hechos')
+    reportado = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reportes_recibidos')
+    motivo = models.TextField(max_length=500, blank=True)
+    fecha = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chat', 'autor'], name='reporte_unico_por_chat'),
+        ]
+        indexes = [
+            models.Index(fields=['reportado'], name='reporte_reportado_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.autor_id} reportó a {self.reportado_id} (chat {self.chat_id})"
+
+
+class Reputacion(models.Model):
+    # agregados de Calificacion y Reporte por usuario; los mantiene
+    # reputacion.py en la misma transacción que cada calificación o reporte
+    usuario = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='reputacion')
+    calificaciones = models.PositiveIntegerField(default=0)
+    suma = models.PositiveIntegerField(default=0)
+    promedio = models.FloatField(default=0)
+    puntaje = models.FloatField(default=0)  # promedio bayesiano
+    reportes = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.usuario_id}: {self.puntaje:.2f} ({self.calificaciones})"
+
+
+# ---------- BÚSQUEDA ----------
+class TerminoBusqueda(models.Model):
+    # índice invertido: un término normalizado por producto con su peso
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='terminos')
+    termino = models.CharField(max_length=40)
+    peso = models.PositiveSmallIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['termino', 'producto'], name='termino_producto_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.termino} → {self.producto_id}"
+
+
+class DocumentoBusqueda(models.Model):
+    # texto normalizado para el índice FULLTEXT de MySQL
+    producto = models.OneToOneField(Producto, on_delete=models.CASCADE, primary_key=True, related_name='documento')
+    texto = models.TextField()
+
+    def __str__(self):
+        return f"Documento de {self.producto_id}"
+
+
+# ---------- MEDIA ----------
+class ArchivoMedia(models.Model):
+    # cuántos productos usan cada archivo del storage; SwapApp.media
+    nombre = models.CharField(max_length=255, unique=True)
+    referencias = models.PositiveIntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # limpiar_media: sin referencias desde hace rato
+            models.Index(fields=['referencias', 'actualizado'], name='media_huerfanos_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.nombre} ({self.referencias})"
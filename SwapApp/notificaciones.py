@@ -0,0 +1,320 @@
+"""
+Despacho y versionado de notificaciones.
+
+``Despachador`` junta los eventos de una acción y los guarda de una vez:
+descarta duplicados exactos, agrupa los que comparten ``agrupacion`` (diez
+ofertas por el mismo producto son una notificación "10 nuevas ofertas") y
+crea el resto con un solo ``bulk_create``, todo en una transacción. Con
+``SWAPPLACE_NOTIFICACIONES_DIFERIDAS = True`` el guardado se hace en el pool
+de tareas (``tareas.py``) después de confirmar la transacción del request.
+
+Cada vez que cambia alguna ``Notificacion`` de un usuario se incrementa su
+versión en la caché y se avisa por el canal ``notif:<id>``; así
+``api_notificaciones`` puede contestar 304 sin consultar la tabla y los
+clientes en long-poll se despiertan al instante. Con varios procesos la
+caché por defecto (memoria local) no se comparte: en producción hay que
+configurar ``CACHES`` con un backend compartido.
+
+``EstadoNotificaciones`` guarda cuántas notificaciones visibles tiene cada
+usuario; se ajusta en la misma transacción que las crea (``guardar``), las
+marca como leídas (``marcar_leidas``, un solo UPDATE) o las borra, así que
+el badge del navbar cuesta una lectura por clave primaria. ``purgar`` borra
+por lotes las ya leídas y antiguas, opcionalmente archivándolas antes.
+"""
+
+import gzip
+import json
+import time
+from dataclasses import dataclass
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.urls import reverse
+from django.utils import timezone
+
+from . import cache as cache_swap
+from . import tareas, tiempo_real
+
+
+def _clave(usuario_id):
+    return f'notif:version:{usuario_id}'
+
+
+def canal(usuario_id):
+    return f'notif:{usuario_id}'
+
+
+def version(usuario_id):
+    v = cache.get(_clave(usuario_id))
+    if v is None:
+        # Sin versión previa (caché vacía o expulsada) se parte de un valor
+        # nuevo para no coincidir nunca con un ETag que tenga un cliente.
+        cache.add(_clave(usuario_id), time.time_ns(), None)
+        v = cache.get(_clave(usuario_id))
+    return v
+
+
+async def aversion(usuario_id):
+    v = await cache.aget(_clave(usuario_id))
+    if v is None:
+        await cache.aadd(_clave(usuario_id), time.time_ns(), None)
+        v = await cache.aget(_clave(usuario_id))
+    return v
+
+
+def etag(usuario_id, v):
+    return f'W/"n{usuario_id}-{v}"'
+
+
+def marcar_cambio(usuario_ids):
+    for usuario_id in set(usuario_ids):
+        try:
+            v = cache.incr(_clave(usuario_id))
+        except ValueError:
+            v = time.time_ns()
+            cache.set(_clave(usuario_id), v, None)
+        tiempo_real.publicar(canal(usuario_id), {'version': v})
+
+
+# ---------- DESPACHO ----------
+@dataclass(frozen=True)
+class Evento:
+    usuario_id: int
+    titulo: str
+    mensaje: str
+    tipo: str = ''
+    link: str = ''
+    agrupacion: str = ''
+    # plantillas con {n} para cuando el evento se junta con otros
+    titulo_agrupado: str = ''
+    mensaje_agrupado: str = ''
+
+
+class Despachador:
+    def __init__(self):
+        self.eventos = []
+
+    def notificar(self, usuario, titulo, mensaje, **kwargs):
+        usuario_id = getattr(usuario, 'pk', usuario)
+        self.eventos.append(Evento(usuario_id, titulo, mensaje, **kwargs))
+
+    def despachar(self):
+        eventos, self.eventos = self.eventos, []
+        if not eventos:
+            return
+        if getattr(settings, 'SWAPPLACE_NOTIFICACIONES_DIFERIDAS', False):
+            tareas.al_confirmar(guardar, eventos)
+        else:
+            guardar(eventos)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo_exc, *exc):
+        if tipo_exc is None:
+            self.despachar()
+
+
+def _texto_agrupado(plantilla, n, por_defecto):
+    return plantilla.format(n=n) if plantilla else por_defecto
+
+
+def guardar(eventos):
+    from .models import Notificacion
+    # duplicados exactos dentro del lote (doble clic, reintentos)
+    eventos = list(dict.fromkeys(eventos))
+    grupos = {}
+    sueltos = []
+    for e in eventos:
+        if e.agrupacion:
+            grupos.setdefault((e.usuario_id, e.agrupacion), []).append(e)
+        else:
+            sueltos.append(e)
+
+    nuevas = [Notificacion(usuario_id=e.usuario_id, titulo=e.titulo, mensaje=e.mensaje,
+                           tipo=e.tipo, link=e.link) for e in sueltos]
+    with transaction.atomic(savepoint=False):
+        for (usuario_id, agrupacion), grupo in grupos.items():
+            ultimo = grupo[-1]
+            existente = (Notificacion.objects.select_for_update()
+                         .filter(usuario_id=usuario_id, agrupacion=agrupacion, visible=True)
+                         .order_by('-creado').first())
+            if existente is not None:
+                n = existente.cantidad + len(grupo)
+                Notificacion.objects.filter(id=existente.id).update(
+                    cantidad=F('cantidad') + len(grupo),
+                    titulo=_texto_agrupado(ultimo.titulo_agrupado, n, ultimo.titulo),
+                    mensaje=_texto_agrupado(ultimo.mensaje_agrupado, n, ultimo.mensaje),
+                    link=ultimo.link,
+                    creado=timezone.now(),
+                )
+                continue
+            n = len(grupo)
+            nuevas.append(Notificacion(
+                usuario_id=usuario_id, tipo=ultimo.tipo, link=ultimo.link,
+                agrupacion=agrupacion, cantidad=n,
+                titulo=ultimo.titulo if n == 1 else _texto_agrupado(ultimo.titulo_agrupado, n, ultimo.titulo),
+                mensaje=ultimo.mensaje if n == 1 else _texto_agrupado(ultimo.mensaje_agrupado, n, ultimo.mensaje),
+            ))
+        Notificacion.objects.bulk_create(nuevas)
+        # bulk_create y update no emiten señales: el contador y el aviso van aquí
+        cambios = {}
+        for n in nuevas:
+            cambios[n.usuario_id] = cambios.get(n.usuario_id, 0) + 1
+        ajustar_no_leidas(cambios)
+        usuarios = {e.usuario_id for e in eventos}
+        transaction.on_commit(lambda: _avisar(usuarios))
+
+
+def _avisar(usuario_ids):
+    marcar_cambio(usuario_ids)
+    cache_swap.invalidar(*(cache_swap.espacio_usuario(u) for u in usuario_ids))
+
+
+# ---------- LEÍDAS / NO LEÍDAS ----------
+def no_leidas(usuario_id):
+    from .models import EstadoNotificaciones, Notificacion
+    valor = (EstadoNotificaciones.objects.filter(usuario_id=usuario_id)
+             .values_list('no_leidas', flat=True).first())
+    if valor is None:
+        # primera lectura (usuario nuevo o filas cargadas en bloque): se cuenta una vez
+        valor = Notificacion.objects.filter(usuario_id=usuario_id, visible=True).count()
+        EstadoNotificaciones.objects.get_or_create(usuario_id=usuario_id, defaults={'no_leidas': valor})
+    return valor
+
+
+async def ano_leidas(usuario_id):
+    from .models import EstadoNotificaciones
+    valor = await (EstadoNotificaciones.objects.filter(usuario_id=usuario_id)
+                   .values_list('no_leidas', flat=True).afirst())
+    if valor is None:
+        valor = await sync_to_async(no_leidas)(usuario_id)
+    return valor
+
+
+def ajustar_no_leidas(cambios, crear=True):
+    """Suma ``{usuario_id: delta}`` a los contadores.
+
+    Se llama después de escribir las filas, dentro de la misma transacción:
+    si el contador aún no existe, ``no_leidas`` lo crea contando la tabla,
+    que ya incluye el cambio. Con ``crear=False`` (borrados en cascada) un
+    contador inexistente se deja como está.
+    """
+    from .models import EstadoNotificaciones
+    for usuario_id, delta in cambios.items():
+        if not delta:
+            continue
+        if delta > 0:
+            nuevo = F('no_leidas') + delta
+        else:
+            # sin restar de más: la columna no admite negativos
+            nuevo = Case(When(no_leidas__gt=-delta, then=F('no_leidas') + delta), default=Value(0))
+        actualizados = EstadoNotificaciones.objects.filter(usuario_id=usuario_id).update(no_leidas=nuevo)
+        if not actualizados and crear:
+            no_leidas(usuario_id)
+
+
+def marcar_leidas(usuario_id, ids=None, hasta_id=None):
+    """Marca como leídas las notificaciones visibles del usuario con un solo UPDATE.
+
+    Sin ``ids`` ni ``hasta_id`` marca todas. Devuelve cuántas cambiaron.
+    """
+    from .models import Notificacion
+    qs = Notificacion.objects.filter(usuario_id=usuario_id, visible=True)
+    if ids is not None:
+        qs = qs.filter(id__in=ids)
+    if hasta_id is not None:
+        qs = qs.filter(id__lte=hasta_id)
+    with transaction.atomic():
+        n = qs.update(visible=False)
+        if n:
+            ajustar_no_leidas({usuario_id: -n})
+            transaction.on_commit(lambda: _avisar([usuario_id]))
+    return n
+
+
+# ---------- RETENCIÓN ----------
+def _fila_archivo(n):
+    return {
+        'id': n['id'], 'usuario_id': n['usuario_id'], 'titulo': n['titulo'], 'mensaje': n['mensaje'],
+        'tipo': n['tipo'], 'link': n['link'], 'cantidad': n['cantidad'], 'creado': n['creado'].isoformat(),
+    }
+
+
+def purgar(antes_de, lote=1000, archivo=None):
+    """Borra las notificaciones leídas creadas antes de ``antes_de``.
+
+    Avanza por id en lotes de ``lote`` filas, cada uno en su transacción,
+    para no bloquear la tabla. Con ``archivo`` (ruta) cada fila se escribe
+    antes como una línea JSON en un gzip. Devuelve cuántas se borraron.
+    """
+    from .models import Notificacion
+    campos = ('id', 'usuario_id', 'titulo', 'mensaje', 'tipo', 'link', 'cantidad', 'creado')
+    salida = gzip.open(archivo, 'at', encoding='utf-8') if archivo else None
+    total = 0
+    ultimo_id = 0
+    try:
+        while True:
+            filas = list(Notificacion.objects
+                         .filter(id__gt=ultimo_id, visible=False, creado__lt=antes_de)
+                         .order_by('id').values(*campos)[:lote])
+            if not filas:
+                break
+            ultimo_id = filas[-1]['id']
+            if salida:
+                salida.writelines(json.dumps(_fila_archivo(f), ensure_ascii=False) + '\n' for f in filas)
+                salida.flush()
+            with transaction.atomic():
+                # las filas ya no son visibles: las señales de borrado no tocan
+                # contadores ni versiones (ver signals.notificacion_borrada)
+                total += Notificacion.objects.filter(pk__in=[f['id'] for f in filas]).delete()[0]
+    finally:
+        if salida:
+            salida.close()
+    return total
+
+
+# ---------- EVENTOS DE TRUEQUE ----------
+def oferta_recibida(despachador, trueque):
+    producto = trueque.producto
+    despachador.notificar(
+        trueque.receptor_id,
+        titulo='Nueva solicitud de trueque',
+        mensaje=f'{trueque.solicitante.username} ofreció un trueque por "{producto.nombre}".',
+        tipo='nuevo_trueque',
+        link=reverse('home'),
+        agrupacion=f'ofertas:{producto.id}',
+        titulo_agrupado='Nuevas solicitudes de trueque',
+        mensaje_agrupado=f'{{n}} nuevas ofertas por "{producto.nombre}".',
+    )
+
+
+def trueque_aceptado(despachador, trueque, chat):
+    chat_url = reverse('chat_detalle', args=[chat.id])
+    despachador.notificar(
+        trueque.solicitante_id,
+        titulo='Trueque aceptado',
+        mensaje=f'{trueque.receptor.username} aceptó tu solicitud. Pulsa Ver chat.',
+        tipo='trueque_aceptado',
+        link=chat_url,
+    )
+    despachador.notificar(
+        trueque.receptor_id,
+        titulo='Trueque aceptado',
+        mensaje=f'Aceptaste la solicitud de {trueque.solicitante.username}. Pulsa Ver chat.',
+        tipo='trueque_aceptado',
+        link=chat_url,
+    )
+
+
+def trueque_rechazado(despachador, trueque):
+    despachador.notificar(
+        trueque.solicitante_id,
+        titulo='Trueque rechazado',
+        mensaje=f'{trueque.receptor.username} rechazó tu solicitud por "{trueque.producto.nombre}".',
+        tipo='trueque_rechazado',
+        link=reverse('home'),
+    )
@@ -0,0 +1,240 @@
+"""
+Perfilado por request.
+
+``PerfiladoMiddleware`` mide, en una muestra de los requests
+(``SWAPPLACE_PERFILADO['MUESTREO']``), cuántas consultas SQL se hicieron y
+cuánto tardaron, cuántas se repitieron idénticas, el tiempo de render de
+plantillas y el de la vista. Lo devuelve en la cabecera ``Server-Timing``
+y lo acumula en histogramas por nombre de URL, que se consultan en
+``api_metricas`` (solo staff).
+
+El tiempo de plantillas lo mide ``DjangoTemplatesPerfilados``, el backend
+de plantillas configurado en ``TEMPLATES``; fuera de un request muestreado
+solo cuesta leer una ContextVar.
+"""
+
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+_perfil_actual = ContextVar('swapplace_perfil', default=None)
+
+LIMITES_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class Perfil:
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.inicio_vista = None
+        self.sql_n = 0
+        self.sql_s = 0.0
+        self.plantillas_s = 0.0
+        self._sentencias = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # bajo ASGI los requests async comparten las conexiones del hilo de
+        # sync_to_async: solo cuenta lo que corre en el contexto de este request
+        if _perfil_actual.get() is not self:
+            return execute(sql, params, many, context)
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_s += time.perf_counter() - inicio
+            self.sql_n += 1
+            try:
+                self._sentencias[(sql, repr(params))] += 1
+            except Exception:
+                pass
+
+    @property
+    def duplicadas(self):
+        return sum(n - 1 for n in self._sentencias.values() if n > 1)
+
+
+class _TemplatePerfilada(Template):
+    def render(self, context=None, request=None):
+        perfil = _perfil_actual.get()
+        if perfil is None:
+            return super().render(context, request)
+        inicio = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            perfil.plantillas_s += time.perf_counter() - inicio
+
+
+class DjangoTemplatesPerfilados(DjangoTemplates):
+    def from_string(self, template_code):
+        return _TemplatePerfilada(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        t = super().get_template(template_name)
+        return _TemplatePerfilada(t.template, self)
+
+
+class _Histograma:
+    def __init__(self):
+        self.cuentas = [0] * (len(LIMITES_MS) + 1)
+        self.n = 0
+        self.total_ms = 0.0
+        self.sql_n = 0
+        self.sql_ms = 0.0
+        self.plantillas_ms = 0.0
+        self.vista_ms = 0.0
+        self.con_duplicadas = 0
+        self.max_ms = 0.0
+
+    def registrar(self, total_ms, sql_n, sql_ms, plantillas_ms, vista_ms, duplicadas):
+        i = 0
+        while i < len(LIMITES_MS) and total_ms > LIMITES_MS[i]:
+            i += 1
+        self.cuentas[i] += 1
+        self.n += 1
+        self.total_ms += total_ms
+        self.sql_n += sql_n
+        self.sql_ms += sql_ms
+        self.plantillas_ms += plantillas_ms
+        self.vista_ms += vista_ms
+        self.con_duplicadas += bool(duplicadas)
+        self.max_ms = max(self.max_ms, total_ms)
+
+    def percentil(self, p):
+        objetivo = p * self.n
+        acumulado = 0
+        for i, c in enumerate(self.cuentas):
+            acumulado += c
+            if acumulado >= objetivo:
+                # cota superior del bucket, sin pasar del máximo observado
+                return min(LIMITES_MS[i], round(self.max_ms, 3)) if i < len(LIMITES_MS) else round(self.max_ms, 3)
+        return self.max_ms
+
+    def resumen(self):
+        n = self.n or 1
+        return {
+            'requests': self.n,
+            'total_ms_prom': round(self.total_ms / n, 3),
+            'total_ms_p50': self.percentil(0.5),
+            'total_ms_p95': self.percentil(0.95),
+            'total_ms_max': round(self.max_ms, 3),
+            'sql_consultas_prom': round(self.sql_n / n, 2),
+            'sql_ms_prom': round(self.sql_ms / n, 3),
+            'plantillas_ms_prom': round(self.plantillas_ms / n, 3),
+            'vista_ms_prom': round(self.vista_ms / n, 3),
+            'requests_con_duplicadas': self.con_duplicadas,
+            'buckets_ms': dict(zip([*map(str, LIMITES_MS), 'inf'], self.cuentas)),
+        }
+
+
+_histogramas = {}
+_lock = threading.Lock()
+
+
+def registrar(nombre, perfil, total_s, vista_s):
+    with _lock:
+        h = _histogramas.get(nombre)
+        if h is None:
+            h = _histogramas[nombre] = _Histograma()
+        h.registrar(total_s * 1000, perfil.sql_n, perfil.sql_s * 1000,
+                    perfil.plantillas_s * 1000, vista_s * 1000, perfil.duplicadas)
+
+
+def resumen():
+    with _lock:
+        return {nombre: h.resumen() for nombre, h in sorted(_histogramas.items())}
+
+
+def reiniciar():
+    with _lock:
+        _histogramas.clear()
+
+
+def _instalar(perfil):
+    for alias in connections:
+        connections[alias].execute_wrappers.append(perfil)
+
+
+def _quitar(perfil):
+    for alias in connections:
+        wrappers = connections[alias].execute_wrappers
+        if perfil in wrappers:
+            wrappers.remove(perfil)
+
+
+def _config():
+    return {'ACTIVO': False, 'MUESTREO': 1.0, 'CABECERA': True, **getattr(settings, 'SWAPPLACE_PERFILADO', {})}
+
+
+class PerfiladoMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        conf = _config()
+        if not conf['ACTIVO'] or random.random() >= conf['MUESTREO']:
+            return self.get_response(request)
+
+        perfil = Perfil()
+        token = _perfil_actual.set(perfil)
+        request._perfil = perfil
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(perfil))
+                response = self.get_response(request)
+        finally:
+            _perfil_actual.reset(token)
+        return self._cerrar(request, response, perfil, conf)
+
+    async def __acall__(self, request):
+        conf = _config()
+        if not conf['ACTIVO'] or random.random() >= conf['MUESTREO']:
+            return await self.get_response(request)
+
+        perfil = Perfil()
+        token = _perfil_actual.set(perfil)
+        request._perfil = perfil
+        # el ORM async corre en el hilo de sync_to_async: el wrapper se
+        # instala y se quita ahí, sobre las mismas conexiones
+        await sync_to_async(_instalar)(perfil)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_quitar)(perfil)
+            _perfil_actual.reset(token)
+        return self._cerrar(request, response, perfil, conf)
+
+    def _cerrar(self, request, response, perfil, conf):
+        fin = time.perf_counter()
+        total = fin - perfil.inicio
+        vista = fin - perfil.inicio_vista if perfil.inicio_vista else 0.0
+        match = getattr(request, 'resolver_match', None)
+        registrar(match.view_name if match else '<sin ruta>', perfil, total, vista)
+        if conf['CABECERA']:
+            response['Server-Timing'] = ', '.join([
+                f'total;dur={total * 1000:.2f}',
+                f'vista;dur={vista * 1000:.2f}',
+                f'sql;dur={perfil.sql_s * 1000:.2f};desc="{perfil.sql_n} consultas, {perfil.duplicadas} duplicadas"',
+                f'plantillas;dur={perfil.plantillas_s * 1000:.2f}',
+            ])
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        perfil = getattr(request, '_perfil', None)
+        if perfil is not None:
+            perfil.inicio_vista = time.perf_counter()
@@ -0,0 +1,154 @@
+"""
+Calificaciones, reportes y reputación de los usuarios.
+
+Cada participante de un chat puede calificar (1 a 5) y reportar a la otra
+parte del trueque una vez por chat; calificar de nuevo reemplaza el
+puntaje. ``Reputacion`` guarda por usuario cantidad, suma, promedio,
+puntaje bayesiano y reportes, y se ajusta con el delta de cada
+calificación en la misma transacción, con la fila bloqueada
+(``select_for_update``), así que las tarjetas y la búsqueda la leen con un
+JOIN en vez de agregar ``Calificacion`` por usuario.
+
+El puntaje bayesiano parte de ``PRIOR_PESO`` calificaciones ficticias de
+``PRIOR_MEDIA``: un 5 con una sola calificación no supera a un 4,8 con
+cincuenta. ``recalcular`` rehace todo desde las tablas, por lotes de
+usuarios, para verificar o corregir los agregados (y aplicar un prior
+nuevo).
+"""
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from . import cache
+from .models import Calificacion, Reporte, Reputacion, Trueque
+
+_CAMPOS = ('calificaciones', 'suma', 'reportes', 'promedio', 'puntaje')
+
+
+def _config():
+    return {
+        'PRIOR_MEDIA': 3.5,
+        'PRIOR_PESO': 5,
+        **getattr(settings, 'SWAPPLACE_REPUTACION', {}),
+    }
+
+
+def _puntajes(calificaciones, suma):
+    conf = _config()
+    promedio = suma / calificaciones if calificaciones else 0
+    puntaje = (conf['PRIOR_PESO'] * conf['PRIOR_MEDIA'] + suma) / (conf['PRIOR_PESO'] + calificaciones)
+    return round(promedio, 4), round(puntaje, 4)
+
+
+def ajustar(usuario_id, calificaciones=0, suma=0, reportes=0, crear=True):
+    """Suma deltas a la reputación de un usuario. Va dentro de la transacción que los causa."""
+    qs = Reputacion.objects.select_for_update()
+    if crear:
+        # la primera vez se inserta ya con los valores: sin UPDATE aparte
+        promedio, puntaje = _puntajes(max(0, calificaciones), max(0, suma))
+        rep, creada = qs.get_or_create(usuario_id=usuario_id, defaults={
+            'calificaciones': max(0, calificaciones), 'suma': max(0, suma), 'reportes': max(0, reportes),
+            'promedio': promedio, 'puntaje': puntaje,
+        })
+        if creada:
+            return rep
+    else:
+        rep = qs.filter(usuario_id=usuario_id).first()
+        if rep is None:
+            return None
+    rep.calificaciones = max(0, rep.calificaciones + calificaciones)
+    rep.suma = max(0, rep.suma + suma)
+    rep.reportes = max(0, rep.reportes + reportes)
+    rep.promedio, rep.puntaje = _puntajes(rep.calificaciones, rep.suma)
+    rep.save(update_fields=_CAMPOS)
+    return rep
+
+
+def _invalidar(usuario_id):
+    # la reputación sale en las tarjetas y en las solicitudes pendientes que el usuario hizo
+    receptores = (Trueque.objects.filter(solicitante_id=usuario_id, estado='pendiente')
+                  .values_list('receptor_id', flat=True).distinct())
+    cache.invalidar('productos', cache.espacio_usuario(usuario_id),
+                    *(cache.espacio_usuario(r) for r in receptores))
+
+
+def contraparte(chat_id, usuario_id):
+    solicitante_id, receptor_id = (Trueque.objects.filter(chat=chat_id)
+                                   .values_list('solicitante_id', 'receptor_id').get())
+    return receptor_id if usuario_id == solicitante_id else solicitante_id
+
+
+def calificar(chat_id, autor, puntaje):
+    """Guarda o reemplaza la calificación de ``autor`` en el chat. Devuelve ``(calificacion, creada)``."""
+    calificado_id = contraparte(chat_id, autor.id)
+    with transaction.atomic():
+        c, creada = Calificacion.objects.select_for_update().get_or_create(
+            chat_id=chat_id, autor=autor, defaults={'calificado_id': calificado_id, 'puntaje': puntaje})
+        delta = puntaje if creada else puntaje - c.puntaje
+        if not creada and delta:
+            c.puntaje = puntaje
+            c.save(update_fields=['puntaje', 'fecha'])
+        if creada or delta:
+            ajustar(calificado_id, calificaciones=int(creada), suma=delta)
+    if creada or delta:
+        _invalidar(calificado_id)
+    return c, creada
+
+
+def reportar(chat_id, autor, motivo=''):
+    """Un reporte por chat y autor; repetirlo no suma. Devuelve ``(reporte, creado)``."""
+    reportado_id = contraparte(chat_id, autor.id)
+    with transaction.atomic():
+        r, creado = Reporte.objects.get_or_create(
+            chat_id=chat_id, autor=autor, defaults={'reportado_id': reportado_id, 'motivo': motivo[:500]})
+        if creado:
+            ajustar(reportado_id, reportes=1)
+    return r, creado
+
+
+# ---------- RECÁLCULO ----------
+def recalcular(lote=1000, corregir=True):
+    """Rehace los agregados desde ``Calificacion`` y ``Reporte`` por lotes de usuarios.
+
+    Cada lote bloquea sus filas de ``Reputacion`` antes de contar: una
+    calificación en curso espera y después aplica su delta sobre lo
+    recalculado. Devuelve ``(usuarios, diferencias)``.
+    """
+    revisados = 0
+    corregidos = []
+    ultimo_id = 0
+    while True:
+        ids = list(User.objects.filter(id__gt=ultimo_id).order_by('id').values_list('id', flat=True)[:lote])
+        if not ids:
+            break
+        ultimo_id = ids[-1]
+        with transaction.atomic():
+            actuales = Reputacion.objects.select_for_update().in_bulk(ids)
+            calificaciones = {
+                f['calificado_id']: (f['n'], f['suma'])
+                for f in (Calificacion.objects.filter(calificado_id__in=ids).order_by()
+                          .values('calificado_id').annotate(n=Count('id'), suma=Sum('puntaje')))
+            }
+            reportes = dict(Reporte.objects.filter(reportado_id__in=ids).order_by()
+                            .values('reportado_id').annotate(n=Count('id')).values_list('reportado_id', 'n'))
+            crear, cambiar = [], []
+            for uid in ids:
+                n, suma = calificaciones.get(uid, (0, 0))
+                esperado = Reputacion(usuario_id=uid, calificaciones=n, suma=suma, reportes=reportes.get(uid, 0))
+                esperado.promedio, esperado.puntaje = _puntajes(n, suma)
+                rep = actuales.get(uid)
+                if rep is None:
+                    if n or esperado.reportes:
+                        crear.append(esperado)
+                elif any(getattr(rep, c) != getattr(esperado, c) for c in _CAMPOS):
+                    cambiar.append(esperado)
+            corregidos += [r.usuario_id for r in crear + cambiar]
+            if corregir:
+                Reputacion.objects.bulk_create(crear)
+                Reputacion.objects.bulk_update(cambiar, _CAMPOS)
+        revisados += len(ids)
+    if corregir and corregidos:
+        cache.invalidar('productos', *(cache.espacio_usuario(uid) for uid in corregidos))
+    return revisados, len(corregidos)
@@ -0,0 +1,176 @@
+"""
+Ruteo de lecturas a réplicas.
+
+``ReplicasMiddleware`` marca como *de lectura* los GET/HEAD a las vistas de
+``SWAPPLACE_REPLICAS['VISTAS']``. Durante esos requests ``RouterReplicas``
+manda las lecturas de los modelos de SwapApp a una réplica sana; todo lo
+demás (escrituras, sesiones, usuarios, vistas no listadas) va a
+``default``.
+
+Lecturas de lo propio escrito:
+
+* dentro del request, después de la primera escritura todas las lecturas
+  van al primario, y también las que ocurren dentro de una transacción;
+* entre requests, una sesión que escribió queda *pegada* al primario por
+  ``RETRASO_MAXIMO`` segundos (el retraso de replicación que se tolera),
+  con la marca guardada en la caché ``CACHE``.
+
+Cada réplica se revisa como mucho cada ``SALUD_CADA`` segundos: que la
+conexión responda y, en MySQL, que su retraso (``SHOW REPLICA STATUS``)
+no supere ``RETRASO_MAXIMO``. Si ninguna está sana se lee del primario.
+
+Para probarlo en local basta con otra base SQLite o MySQL como réplica
+(ver ``SWAPPLACE_DB_REPLICAS`` en ``settings.py``).
+"""
+
+import itertools
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, connections
+
+PRIMARIO = 'default'
+
+_lectura = ContextVar('swapplace_lectura', default=False)
+_escribio = ContextVar('swapplace_escribio', default=False)
+
+_salud = {}
+_salud_lock = threading.Lock()
+_turno = itertools.count()
+
+
+def _config():
+    return {
+        'ALIAS': [],
+        'VISTAS': (),
+        'RETRASO_MAXIMO': 2,
+        'SALUD_CADA': 5,
+        'CACHE': 'default',
+        **getattr(settings, 'SWAPPLACE_REPLICAS', {}),
+    }
+
+
+def _revisar(alias, retraso_maximo):
+    try:
+        conexion = connections[alias]
+        conexion.ensure_connection()
+        if conexion.vendor != 'mysql':
+            return True
+        with conexion.cursor() as cursor:
+            cursor.execute('SHOW REPLICA STATUS')
+            fila = cursor.fetchone()
+            if fila is None:
+                return True  # no es réplica (p.ej. un MySQL local de pruebas)
+            columnas = [c[0] for c in cursor.description]
+            retraso = dict(zip(columnas, fila)).get('Seconds_Behind_Source')
+        return retraso is not None and retraso <= retraso_maximo
+    except DatabaseError:
+        return False
+
+
+def replica_sana(alias):
+    conf = _config()
+    ahora = time.monotonic()
+    estado = _salud.get(alias)
+    if estado is not None and estado[0] > ahora:
+        return estado[1]
+    with _salud_lock:
+        estado = _salud.get(alias)
+        if estado is None or estado[0] <= ahora:
+            estado = (ahora + conf['SALUD_CADA'], _revisar(alias, conf['RETRASO_MAXIMO']))
+            _salud[alias] = estado
+    return estado[1]
+
+
+def elegir_replica():
+    replicas = [a for a in _config()['ALIAS'] if replica_sana(a)]
+    if not replicas:
+        return None
+    return replicas[next(_turno) % len(replicas)]
+
+
+class RouterReplicas:
+    def db_for_read(self, model, **hints):
+        if not _lectura.get() or _escribio.get() or model._meta.app_label != 'SwapApp':
+            return None
+        if connections[PRIMARIO].in_atomic_block:
+            return None
+        return elegir_replica()
+
+    def db_for_write(self, model, **hints):
+        _escribio.set(True)
+        return PRIMARIO
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # las réplicas tienen los mismos datos que el primario
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARIO
+
+
+# ---------- MIDDLEWARE ----------
+def _clave_pegada(session_key):
+    return f'replicas:pegada:{session_key}'
+
+
+def esta_pegada(session_key):
+    return bool(session_key) and caches[_config()['CACHE']].get(_clave_pegada(session_key)) is not None
+
+
+def pegar(session_key):
+    conf = _config()
+    caches[conf['CACHE']].set(_clave_pegada(session_key), 1, conf['RETRASO_MAXIMO'])
+
+
+class ReplicasMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _antes(self):
+        return _lectura.set(False), _escribio.set(False)
+
+    def _despues(self, request, tokens):
+        try:
+            session_key = request.session.session_key if hasattr(request, 'session') else None
+            if _escribio.get() and session_key:
+                pegar(session_key)
+        finally:
+            _lectura.reset(tokens[0])
+            _escribio.reset(tokens[1])
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = self._antes()
+        try:
+            return self.get_response(request)
+        finally:
+            self._despues(request, tokens)
+
+    async def __acall__(self, request):
+        tokens = self._antes()
+        try:
+            return await self.get_response(request)
+        finally:
+            self._despues(request, tokens)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        conf = _config()
+        if not conf['ALIAS'] or request.method not in ('GET', 'HEAD'):
+            return None
+        match = request.resolver_match
+        if match is None or match.url_name not in conf['VISTAS']:
+            return None
+        session_key = request.session.session_key if hasattr(request, 'session') else None
+        if not esta_pegada(session_key):
+            _lectura.set(True)
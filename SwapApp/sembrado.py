@@ -0,0 +1,195 @@
+"""
+Marketplace sintético para benchmarks y pruebas de carga.
+
+Crea usuarios, productos, trueques, chats con historiales largos y
+notificaciones con ``bulk_create``. El primer usuario (``protagonista``)
+concentra actividad: recibe solicitudes y notificaciones y participa en
+los chats, para que sus páginas sean las más pesadas.
+"""
+
+import os
+import random
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from . import bandeja, busqueda
+from .models import Chat, EstadoNotificaciones, Mensaje, Notificacion, Producto, TerminoBusqueda, Trueque
+
+PASSWORD = 'swapplace-bench'
+
+PALABRAS = (
+    'bicicleta', 'mesa', 'silla', 'microondas', 'celular', 'notebook', 'lavadora',
+    'pala', 'cargador', 'guitarra', 'libro', 'lámpara', 'zapatillas', 'chaqueta',
+    'cámara', 'audífonos', 'teclado', 'monitor', 'cafetera', 'mochila',
+)
+ADJETIVOS = ('roja', 'usada', 'nueva', 'grande', 'pequeña', 'antigua', 'eléctrica', 'de madera')
+
+
+@dataclass
+class Escala:
+    usuarios: int = 50
+    productos: int = 500
+    trueques: int = 300
+    chats: int = 20
+    mensajes_por_chat: int = 200
+    notificaciones: int = 500
+
+
+@dataclass
+class Marketplace:
+    protagonista: User
+    usuarios: list = field(default_factory=list)
+    productos: list = field(default_factory=list)
+    chats: list = field(default_factory=list)
+
+
+def _texto(rnd, n):
+    return ' '.join(rnd.choice(PALABRAS + ADJETIVOS) for _ in range(n))
+
+
+@transaction.atomic
+def sembrar(escala=None, semilla=1, prefijo='bench'):
+    escala = escala or Escala()
+    rnd = random.Random(semilla)
+    password = make_password(PASSWORD)  # un solo hash para todos: PBKDF2 es lento a propósito
+
+    User.objects.bulk_create([
+        User(username=f'{prefijo}{i}', email=f'{prefijo}{i}@example.com', password=password)
+        for i in range(escala.usuarios)
+    ])
+    usuarios = list(User.objects.filter(username__startswith=prefijo).order_by('id'))
+    protagonista = usuarios[0]
+
+    Producto.objects.bulk_create([
+        Producto(
+            usuario=rnd.choice(usuarios),
+            nombre=f'{rnd.choice(PALABRAS)} {rnd.choice(ADJETIVOS)}'.capitalize(),
+            descripcion=_texto(rnd, 20),
+        )
+        for _ in range(escala.productos)
+    ], batch_size=500)
+    productos = list(Producto.objects.filter(usuario__in=usuarios).select_related('usuario'))
+    # bulk_create no emite post_save: el índice de búsqueda se arma aquí
+    TerminoBusqueda.objects.bulk_create([
+        TerminoBusqueda(producto=p, termino=t, peso=peso)
+        for p in productos
+        for t, peso in busqueda.terminos(p.nombre, p.descripcion, p.usuario.username).items()
+    ], batch_size=1000)
+
+    propios = [p for p in productos if p.usuario_id == protagonista.id] or productos[:1]
+    ajenos = [p for p in productos if p.usuario_id != protagonista.id]
+    trueques = {}
+    for i in range(escala.trueques * 3):
+        if len(trueques) == escala.trueques:
+            break
+        # la mitad de las solicitudes van a productos del protagonista
+        p = rnd.choice(propios) if i % 2 == 0 or not ajenos else rnd.choice(ajenos)
+        solicitante = rnd.choice(usuarios)
+        if solicitante.id != p.usuario_id:
+            trueques.setdefault((solicitante.id, p.id), Trueque(
+                solicitante=solicitante, receptor_id=p.usuario_id, producto=p))
+    Trueque.objects.bulk_create(trueques.values(), batch_size=500)
+
+    aceptados = list(Trueque.objects.filter(receptor=protagonista).order_by('id')[:escala.chats])
+    Trueque.objects.filter(id__in=[t.id for t in aceptados]).update(estado='aceptado', activa=None)
+    Chat.objects.bulk_create([Chat(trueque=t) for t in aceptados])
+    chats = list(Chat.objects.filter(trueque__in=aceptados).select_related('trueque'))
+    Chat.usuarios.through.objects.bulk_create([
+        Chat.usuarios.through(chat_id=c.id, user_id=uid)
+        for c in chats for uid in (c.trueque.solicitante_id, c.trueque.receptor_id)
+    ])
+    Mensaje.objects.bulk_create([
+        Mensaje(chat=c, autor_id=rnd.choice((c.trueque.solicitante_id, c.trueque.receptor_id)),
+                contenido=_texto(rnd, 8))
+        for c in chats for _ in range(escala.mensajes_por_chat)
+    ], batch_size=1000)
+    # ni el through de usuarios ni los mensajes emitieron señales: la bandeja se arma aquí
+    bandeja.reconstruir(chats)
+
+    Notificacion.objects.bulk_create([
+        Notificacion(
+            usuario=protagonista if i % 2 == 0 else rnd.choice(usuarios),
+            titulo='Nueva solicitud de trueque',
+            mensaje=_texto(rnd, 6),
+            tipo='nuevo_trueque',
+            link='/',
+            visible=i % 5 != 0,
+        )
+        for i in range(escala.notificaciones)
+    ], batch_size=1000)
+    # igual que el índice de búsqueda: los contadores de no leídas se arman aquí
+    no_leidas = dict.fromkeys((u.id for u in usuarios), 0)
+    for uid in Notificacion.objects.filter(usuario__in=usuarios, visible=True).values_list('usuario_id', flat=True):
+        no_leidas[uid] += 1
+    EstadoNotificaciones.objects.bulk_create([
+        EstadoNotificaciones(usuario_id=uid, no_leidas=n) for uid, n in no_leidas.items()
+    ], batch_size=1000)
+
+    return Marketplace(protagonista=protagonista, usuarios=usuarios, productos=productos, chats=chats)
+
+
+@transaction.atomic
+def chats_en_pareja(mercado, mensajes_por_chat=20, semilla=1):
+    """Un chat aceptado entre cada par de usuarios consecutivos, para que todos tengan uno abierto."""
+    rnd = random.Random(semilla)
+    por_dueno = {}
+    for p in mercado.productos:
+        por_dueno.setdefault(p.usuario_id, p)
+    trueques = []
+    for a, b in zip(mercado.usuarios[::2], mercado.usuarios[1::2]):
+        producto = por_dueno.get(b.id) or por_dueno.get(a.id)
+        if producto is None:
+            continue
+        solicitante = a if producto.usuario_id == b.id else b
+        trueques.append(Trueque(solicitante=solicitante, receptor_id=producto.usuario_id,
+                                producto=producto, estado='aceptado', activa=None))
+    Trueque.objects.bulk_create(trueques, batch_size=500)
+    # MySQL no devuelve los ids de bulk_create: se releen
+    pares = {(t.solicitante_id, t.producto_id) for t in trueques}
+    trueques = [t for t in Trueque.objects.filter(estado='aceptado', chat__isnull=True,
+                                                  producto_id__in={p for _, p in pares})
+                if (t.solicitante_id, t.producto_id) in pares]
+    Chat.objects.bulk_create([Chat(trueque=t) for t in trueques], batch_size=500)
+    chats = list(Chat.objects.filter(trueque__in=trueques).select_related('trueque'))
+    Chat.usuarios.through.objects.bulk_create([
+        Chat.usuarios.through(chat_id=c.id, user_id=uid)
+        for c in chats for uid in (c.trueque.solicitante_id, c.trueque.receptor_id)
+    ], batch_size=1000)
+    Mensaje.objects.bulk_create([
+        Mensaje(chat=c, autor_id=rnd.choice((c.trueque.solicitante_id, c.trueque.receptor_id)),
+                contenido=_texto(rnd, 8))
+        for c in chats for _ in range(mensajes_por_chat)
+    ], batch_size=1000)
+    bandeja.reconstruir(chats)
+    mercado.chats.extend(chats)
+    return chats
+
+
+# ---------- BASE DE PRUEBA ----------
+@contextmanager
+def base_de_prueba(en_archivo=False, debug=None):
+    """Crea una base de prueba para los comandos de medición y la destruye al salir.
+
+    Nunca se siembra ni se mide sobre la base real. Con ``en_archivo`` una
+    base SQLite va a un archivo temporal en vez de a memoria, para que cada
+    hilo de un servidor tenga su propia conexión.
+    """
+    setup_test_environment(debug=debug)
+    nombre_original = connection.settings_dict['NAME']
+    nombre_prueba = connection.settings_dict['TEST']['NAME']
+    with tempfile.TemporaryDirectory() as carpeta:
+        if en_archivo and connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(carpeta, 'prueba.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+            connection.settings_dict['TEST']['NAME'] = nombre_prueba
+            teardown_test_environment()
@@ -0,0 +1,172 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_in
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Calificacion, Chat, Mensaje, Notificacion, ParticipanteChat, Producto, Reporte, Trueque
+from . import bandeja, busqueda, cache, emparejamiento, identidad, imagenes, limites, media, notificaciones, reputacion
+
+
+def _avisar_notificaciones(usuario_id):
+    # al confirmar, como notificaciones.guardar: un cliente despertado antes
+    # leería la lista vieja con la versión nueva y se quedaría con ella
+    def avisar():
+        notificaciones.marcar_cambio([usuario_id])
+        cache.invalidar(cache.espacio_usuario(usuario_id))
+    transaction.on_commit(avisar)
+
+
+@receiver(post_save, sender=Notificacion)
+def notificacion_modificada(sender, instance, **kwargs):
+    _avisar_notificaciones(instance.usuario_id)
+
+
+@receiver(post_save, sender=Notificacion)
+def notificacion_creada(sender, instance, created, **kwargs):
+    # las altas por Despachador usan bulk_create y ajustan el contador ellas mismas
+    if created and instance.visible:
+        notificaciones.ajustar_no_leidas({instance.usuario_id: 1})
+
+
+@receiver(post_delete, sender=Notificacion)
+def notificacion_borrada(sender, instance, **kwargs):
+    # una leída ya no se lista ni se cuenta: borrarla (p.ej. al purgar) no
+    # cambia nada que el usuario vea, así que no se despierta a nadie
+    if instance.visible:
+        notificaciones.ajustar_no_leidas({instance.usuario_id: -1}, crear=False)
+        _avisar_notificaciones(instance.usuario_id)
+
+
+@receiver(post_save, sender=Producto)
+def producto_guardado(sender, instance, **kwargs):
+    busqueda.indexar(instance)
+    imagenes.programar(instance)
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+def producto_modificado(sender, instance, **kwargs):
+    # el grid y la búsqueda son globales; las solicitudes pendientes del
+    # dueño muestran el nombre del producto
+    cache.invalidar_al_confirmar('productos', cache.espacio_usuario(instance.usuario_id))
+
+
+@receiver(pre_save, sender=Producto)
+def producto_media_previa(sender, instance, **kwargs):
+    # cargado con only()/defer() sin la imagen: se lee lo que hay en la base
+    if instance._media_guardada is None:
+        instance._media_guardada = media.archivos_guardados(instance.pk)
+
+
+@receiver(post_save, sender=Producto)
+def producto_media(sender, instance, **kwargs):
+    nuevos = instance.archivos_media()
+    media.ajustar_referencias(instance._media_guardada, nuevos)
+    instance._media_guardada = nuevos
+
+
+@receiver(post_delete, sender=Producto)
+def producto_media_borrada(sender, instance, **kwargs):
+    guardada = instance._media_guardada
+    media.ajustar_referencias(instance.archivos_media() if guardada is None else guardada, ())
+
+
+@receiver(post_save, sender=Trueque)
+@receiver(post_delete, sender=Trueque)
+def trueque_modificado(sender, instance, **kwargs):
+    cache.invalidar_al_confirmar(cache.espacio_usuario(instance.solicitante_id),
+                                 cache.espacio_usuario(instance.receptor_id))
+
+
+@receiver(post_save, sender=Trueque)
+def trueque_emparejamiento(sender, instance, **kwargs):
+    emparejamiento.trueque_guardado(instance)
+
+
+@receiver(post_delete, sender=Trueque)
+def trueque_emparejamiento_borrado(sender, instance, **kwargs):
+    emparejamiento.trueque_borrado(instance)
+
+
+@receiver(post_save, sender=Producto)
+def producto_emparejamiento(sender, instance, created, **kwargs):
+    # un producto nuevo no tiene pedidos todavía
+    if not created:
+        emparejamiento.producto_guardado(instance)
+
+
+@receiver(post_delete, sender=Producto)
+def producto_emparejamiento_borrado(sender, instance, **kwargs):
+    emparejamiento.producto_borrado(instance)
+
+
+@receiver(post_delete, sender=Calificacion)
+def calificacion_borrada(sender, instance, **kwargs):
+    # borrados en cascada (chat o usuario); las altas las ajusta reputacion.calificar
+    reputacion.ajustar(instance.calificado_id, calificaciones=-1, suma=-instance.puntaje, crear=False)
+
+
+@receiver(post_delete, sender=Reporte)
+def reporte_borrado(sender, instance, **kwargs):
+    reputacion.ajustar(instance.reportado_id, reportes=-1, crear=False)
+
+
+@receiver(m2m_changed, sender=Chat.usuarios.through)
+def participantes_chat_modificados(sender, instance, action, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        cache.invalidar_al_confirmar(*(cache.espacio_usuario(pk) for pk in pk_set))
+    elif action == 'pre_clear':
+        cache.invalidar_al_confirmar(
+            *(cache.espacio_usuario(pk) for pk in instance.usuarios.values_list('pk', flat=True)))
+
+
+@receiver(m2m_changed, sender=Chat.usuarios.through)
+def participantes_sincronizados(sender, instance, action, reverse, pk_set, **kwargs):
+    # ParticipanteChat sigue a Chat.usuarios; con reverse=True instance es el usuario
+    if action == 'post_add':
+        if reverse:
+            for chat in Chat.objects.filter(pk__in=pk_set):
+                bandeja.agregar_participantes(chat, [instance.pk])
+        else:
+            bandeja.agregar_participantes(instance, pk_set)
+    elif action == 'post_remove':
+        if reverse:
+            ParticipanteChat.objects.filter(usuario=instance, chat_id__in=pk_set).delete()
+        else:
+            ParticipanteChat.objects.filter(chat=instance, usuario_id__in=pk_set).delete()
+    elif action == 'post_clear':
+        ParticipanteChat.objects.filter(**{'usuario' if reverse else 'chat': instance}).delete()
+
+
+@receiver(post_save, sender=Mensaje)
+def mensaje_creado(sender, instance, created, **kwargs):
+    if created:
+        bandeja.registrar_mensaje(instance)
+
+
+@receiver(pre_delete, sender=Chat)
+def chat_eliminado(sender, instance, **kwargs):
+    # los participantes se leen ahora, antes de que se borren con el chat
+    cache.invalidar_al_confirmar(
+        *(cache.espacio_usuario(pk) for pk in instance.usuarios.values_list('pk', flat=True)))
+
+
+@receiver(user_logged_in)
+def sesion_iniciada(sender, request, user, **kwargs):
+    identidad.guardar(user)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def usuario_modificado(sender, instance, **kwargs):
+    # cambio de contraseña, desactivación, etc.: la próxima petición va a la base
+    identidad.olvidar(instance.pk)
+
+
+@receiver(setting_changed)
+def configuracion_cambiada(sender, setting, **kwargs):
+    # override_settings en los tests
+    if setting == 'SWAPPLACE_LIMITES':
+        limites.reiniciar()
@@ -0,0 +1,53 @@
+"""
+Trabajo en segundo plano dentro del proceso.
+
+Un pool de hilos pequeño para sacar del request lo que no hace falta para
+responder (procesar imágenes, etc.). ``al_confirmar`` encola la tarea solo
+cuando la transacción actual se confirma, para que el worker vea los datos.
+Con ``SWAPPLACE_TAREAS_SINCRONAS = True`` las tareas se ejecutan en línea
+(útil en tests y en comandos de mantenimiento).
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _obtener_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'SWAPPLACE_TAREAS_WORKERS', 2),
+                    thread_name_prefix='swapplace-tarea',
+                )
+    return _pool
+
+
+def _ejecutar(funcion, args):
+    try:
+        funcion(*args)
+    except Exception:
+        logger.exception('Falló la tarea %s%r', funcion.__name__, args)
+    finally:
+        close_old_connections()
+
+
+def encolar(funcion, *args):
+    if getattr(settings, 'SWAPPLACE_TAREAS_SINCRONAS', False):
+        funcion(*args)
+        return None
+    return _obtener_pool().submit(_ejecutar, funcion, args)
+
+
+def al_confirmar(funcion, *args):
+    transaction.on_commit(lambda: encolar(funcion, *args))
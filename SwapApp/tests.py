@@ -1,3 +1,954 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db.models import Q
+from django.templatetags.static import static
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import (archivo, bandeja, benchmark, busqueda, cache, carga, emparejamiento, imagenes, limites, media,
+               notificaciones, perfilado, reputacion, routers, sembrado, tiempo_real, trueques)
+from .models import (ArchivoMedia, Calificacion, Chat, Mensaje, Notificacion, ParticipanteChat, Producto,
+                     Reputacion, TerminoBusqueda, Trueque)
+
+
+class PlanesDeConsultaTests(TestCase):
+    """Cada forma de consulta de las vistas debe resolverse con un índice.
+
+    Revisa el EXPLAIN de la base de datos en uso: ni recorrido completo de
+    la tabla ni ordenamiento aparte (filesort / TEMP B-TREE).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ana', password='x')
+        otro = User.objects.create_user('beto', password='x')
+        producto = Producto.objects.create(usuario=cls.user, nombre='Bicicleta', descripcion='roja')
+        trueque = Trueque.objects.create(solicitante=otro, receptor=cls.user, producto=producto)
+        cls.chat = Chat.objects.create(trueque=trueque)
+        cls.chat.usuarios.set([cls.user, otro])
+
+    def problemas_del_plan(self, qs):
+        if connection.vendor == 'mysql':
+            plan = json.loads(qs.explain(format='json'))
+            texto = json.dumps(plan)
+            problemas = []
+            if '"access_type": "ALL"' in texto:
+                problemas.append('recorrido completo')
+            if '"using_filesort": true' in texto:
+                problemas.append('filesort')
+            return problemas, texto
+        plan = qs.explain()
+        problemas = []
+        for linea in plan.splitlines():
+            if ' SCAN ' in f' {linea} ' and 'USING' not in linea:
+                problemas.append('recorrido completo')
+            if 'USE TEMP B-TREE' in linea:
+                problemas.append('ordenamiento aparte')
+        return problemas, plan
+
+    def assertUsaIndice(self, qs, permitir_ordenamiento=False):
+        problemas, plan = self.problemas_del_plan(qs)
+        if permitir_ordenamiento:
+            problemas = [p for p in problemas if p == 'recorrido completo']
+        self.assertFalse(problemas, f'{problemas}\n{plan}')
+
+    def test_notificaciones_visibles(self):
+        qs = Notificacion.objects.filter(usuario=self.user, visible=True).order_by('-creado')[:20]
+        if connection.vendor == 'mysql':
+            # visible = 1 es igualdad: (usuario, visible) fija el prefijo del
+            # índice y las filas ya salen ordenadas por -creado
+            problemas, plan = self.problemas_del_plan(qs)
+            self.assertIn('notif_usuario_visible_idx', plan)
+            self.assertFalse(problemas, f'{problemas}\n{plan}')
+        else:
+            # SQLite filtra el booleano como "visible" a secas, sin igualdad:
+            # busca por usuario y ordena aparte
+            self.assertUsaIndice(qs, permitir_ordenamiento=True)
+
+    def test_trueques_pendientes(self):
+        self.assertUsaIndice(
+            Trueque.objects.filter(receptor=self.user, estado='pendiente').order_by('-fecha')
+        )
+
+    def test_trueques_aceptados(self):
+        # El OR se resuelve con dos búsquedas por índice (index merge); el
+        # orden final se aplica sobre las pocas filas resultantes.
+        self.assertUsaIndice(
+            Trueque.objects.filter(estado='aceptado')
+            .filter(Q(solicitante=self.user) | Q(receptor=self.user)).order_by('-fecha'),
+            permitir_ordenamiento=True,
+        )
+
+    def test_mensajes_nuevos(self):
+        self.assertUsaIndice(
+            Mensaje.objects.filter(chat=self.chat, id__gt=10).select_related('autor').order_by('id')[:51]
+        )
+
+    def test_mensajes_anteriores(self):
+        self.assertUsaIndice(
+            Mensaje.objects.filter(chat=self.chat, id__lt=100).select_related('autor').order_by('-id')[:51]
+        )
+
+    def test_feed_de_productos(self):
+        self.assertUsaIndice(
+            Producto.objects.select_related('usuario').order_by('-fecha_agregado', '-id')[:25]
+        )
+
+    def test_bandeja_por_actividad(self):
+        self.assertUsaIndice(
+            ParticipanteChat.objects.filter(usuario=self.user)
+            .select_related('chat__trueque__producto').order_by('-ultima_actividad')
+        )
+
+    def test_busqueda_por_prefijo(self):
+        self.assertUsaIndice(TerminoBusqueda.objects.filter(busqueda._prefijo('bic')))
+
+
+class FeedProductosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ana = User.objects.create_user('ana', password='x')
+        Producto.objects.bulk_create([Producto(usuario=cls.ana, nombre=f'p{i}', descripcion='x') for i in range(60)])
+        # la mitad con la misma fecha: el id desempata
+        ids = list(Producto.objects.order_by('id').values_list('id', flat=True))
+        Producto.objects.filter(id__in=ids[10:40]).update(fecha_agregado=timezone.now())
+
+    def test_paginas_sin_duplicados_ni_huecos(self):
+        self.client.force_login(self.ana)
+        vistos, cursor, paginas = [], None, 0
+        while True:
+            r = self.client.get('/api/productos/', {'cursor': cursor} if cursor else {}).json()
+            vistos += [int(i) for i in re.findall(r'data-producto-id="(\d+)"', r['html'])]
+            paginas += 1
+            cursor = r['siguiente']
+            if not cursor:
+                break
+        self.assertEqual(paginas, 3)
+        esperado = list(Producto.objects.order_by('-fecha_agregado', '-id').values_list('id', flat=True))
+        self.assertEqual(vistos, esperado)
+
+    def test_cursor_invalido(self):
+        self.client.force_login(self.ana)
+        for cursor in ('abc', '1-2-3', '-5-3', '99999999999999999999-1'):
+            self.assertEqual(self.client.get('/api/productos/', {'cursor': cursor}).status_code, 400, cursor)
+
+
+class BusquedaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ana = User.objects.create_user('ana', password='x')
+        camion = User.objects.create_user('camionero', password='x')
+        cls.nombre = Producto.objects.create(usuario=cls.ana, nombre='Camión de juguete', descripcion='rojo')
+        cls.usuario = Producto.objects.create(usuario=camion, nombre='Lámpara', descripcion='de pie')
+        cls.descripcion = Producto.objects.create(usuario=cls.ana, nombre='Caja', descripcion='Para un CAMIÓN')
+        cls.otro = Producto.objects.create(usuario=cls.ana, nombre='Mesa', descripcion='roble')
+
+    def test_tildes_mayusculas_y_prefijo(self):
+        self.assertEqual(busqueda.tokenizar('Camión ÁRBOL ñandú'), ['camion', 'arbol', 'nandu'])
+        for consulta in ('camion', 'CAMIÓN', 'cam', 'Cámi'):
+            self.assertIn(self.nombre, busqueda.buscar(consulta))
+        self.assertEqual(busqueda.buscar('lampa pie'), [self.usuario])
+        self.assertEqual(busqueda.buscar('mesa camion'), [])
+
+    def test_orden_por_relevancia(self):
+        # nombre (3) > usuario (2) > descripción (1)
+        self.assertEqual(busqueda.buscar('camion'), [self.nombre, self.usuario, self.descripcion])
+
+    def test_consulta_corta_sigue_mostrando_lo_ultimo(self):
+        recientes = busqueda.buscar('')
+        self.assertEqual(recientes[0], self.otro)
+        self.assertEqual(busqueda.buscar('c'), recientes)
+        self.client.force_login(self.ana)
+        r = self.client.get('/buscar-productos/', {'q': 'm'})
+        self.assertEqual(len(r.json()['productos']), 4)
+        self.assertContains(self.client.get('/'), 'new RegExp("[a-z0-9]{" + 2 + ",}")')
+
+
+class TiempoRealTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        ana = User.objects.create_user('ana', password='x')
+        cls.beto = User.objects.create_user('beto', password='x')
+        cls.carla = User.objects.create_user('carla', password='x')
+        producto = Producto.objects.create(usuario=ana, nombre='Bicicleta', descripcion='x')
+        cls.chat = Chat.objects.create(trueque=Trueque.objects.create(solicitante=cls.beto, receptor=ana,
+                                                                      producto=producto))
+        cls.chat.usuarios.set([ana, cls.beto])
+
+    def test_broker_entrega_y_cancela(self):
+        broker = tiempo_real.BrokerLocal()
+        with broker.suscribir('chat:1') as s, broker.suscribir('chat:2') as otra:
+            self.assertEqual(broker.suscriptores('chat:1'), 1)
+            self.assertEqual(broker.publicar('chat:1', {'id': 1}), 1)
+            self.assertEqual(s.esperar(0), [{'id': 1}])
+            self.assertEqual(otra.esperar(0), [])
+        self.assertEqual((broker.suscriptores('chat:1'), broker.publicar('chat:1', {'id': 2})), (0, 0))
+
+    async def test_espera_async_despierta_desde_otro_hilo(self):
+        broker = tiempo_real.BrokerLocal()
+        with broker.suscribir('chat:1') as s:
+            threading.Timer(0.05, broker.publicar, ('chat:1', {'id': 7})).start()
+            self.assertEqual(await s.esperar_async(5), [{'id': 7}])
+
+    async def test_stream_del_chat(self):
+        url = f'/api/chat/{self.chat.id}/stream/'
+        canal = tiempo_real.canal_chat(self.chat.id)
+
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+        await self.async_client.aforce_login(self.carla)
+        self.assertEqual((await self.async_client.get(url)).status_code, 403)
+
+        await self.async_client.aforce_login(self.beto)
+        r = await self.async_client.get(url)
+        self.assertEqual((r.status_code, r['Content-Type']), (200, 'text/event-stream'))
+        eventos = aiter(r.streaming_content)
+        self.assertEqual(await anext(eventos), b'retry: 3000\n\n')
+        asyncio.get_running_loop().call_later(0.05, tiempo_real.publicar, canal, {'id': 9, 'contenido': 'hola'})
+        self.assertIn(b'event: mensaje', await anext(eventos))
+        # el cliente se desconecta: el servidor ASGI cancela la tarea que espera el próximo evento
+        espera = asyncio.ensure_future(anext(eventos))
+        await asyncio.sleep(0.05)
+        espera.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await espera
+        self.assertEqual(tiempo_real.obtener_broker().suscriptores(canal), 0)
+
+
+class NotificacionesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ana', password='x')
+        cls.producto = Producto.objects.create(usuario=cls.user, nombre='Bicicleta', descripcion='roja')
+
+    def setUp(self):
+        limites.reiniciar()
+
+    def test_ofertas_por_el_mismo_producto_se_agrupan(self):
+        for i in range(10):
+            otro = User.objects.create_user(f'u{i}', password='x')
+            self.client.force_login(otro)
+            self.client.post(f'/ofrecer-trueque/{self.producto.id}/')
+        n = Notificacion.objects.get(usuario=self.user)
+        self.assertEqual(n.cantidad, 10)
+        self.assertEqual(n.mensaje, '10 nuevas ofertas por "Bicicleta".')
+        self.assertEqual(notificaciones.no_leidas(self.user.id), 1)
+
+    def test_contador_de_no_leidas(self):
+        for i in range(5):
+            Notificacion.objects.create(usuario=self.user, titulo='t', mensaje=str(i))
+        notificaciones.guardar([notificaciones.Evento(self.user.id, 'x', str(i)) for i in range(3)])
+        ids = list(Notificacion.objects.order_by('id').values_list('id', flat=True))
+        self.assertEqual(notificaciones.no_leidas(self.user.id), 8)
+        self.assertEqual(notificaciones.marcar_leidas(self.user.id, hasta_id=ids[3]), 4)
+        self.assertEqual(notificaciones.marcar_leidas(self.user.id, hasta_id=ids[3]), 0)
+        Notificacion.objects.get(id=ids[-1]).delete()
+        self.assertEqual(notificaciones.no_leidas(self.user.id), 3)
+        self.assertEqual(
+            notificaciones.no_leidas(self.user.id),
+            Notificacion.objects.filter(usuario=self.user, visible=True).count(),
+        )
+
+    def test_la_version_cambia_al_confirmar(self):
+        version = notificaciones.version(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            n = Notificacion.objects.create(usuario=self.user, titulo='t', mensaje='m')
+            n.delete()
+            self.assertEqual(notificaciones.version(self.user.id), version)
+        self.assertNotEqual(notificaciones.version(self.user.id), version)
+
+    def test_purgar_borra_solo_las_leidas_viejas(self):
+        for i in range(5):
+            Notificacion.objects.create(usuario=self.user, titulo='t', mensaje=str(i))
+        ids = list(Notificacion.objects.order_by('id').values_list('id', flat=True))
+        notificaciones.marcar_leidas(self.user.id, hasta_id=ids[2])
+        version = notificaciones.version(self.user.id)
+        with tempfile.TemporaryDirectory() as d:
+            ruta = os.path.join(d, 'notificaciones.jsonl.gz')
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                total = notificaciones.purgar(timezone.now() + timedelta(seconds=1), lote=2, archivo=ruta)
+            with gzip.open(ruta, 'rt', encoding='utf-8') as f:
+                archivadas = [json.loads(linea)['id'] for linea in f]
+        self.assertEqual(total, 3)
+        self.assertEqual(archivadas, ids[:3])
+        self.assertEqual(list(Notificacion.objects.values_list('id', flat=True).order_by('id')), ids[3:])
+        # borrar leídas no cambia lo que se ve: ni contador ni versión
+        self.assertEqual(callbacks, [])
+        self.assertEqual(notificaciones.version(self.user.id), version)
+        self.assertEqual(notificaciones.no_leidas(self.user.id), 2)
+
+    async def test_long_poll_despierta_con_un_cambio(self):
+        await self.async_client.aforce_login(self.user)
+        version = await notificaciones.aversion(self.user.id)
+        asyncio.get_running_loop().call_later(0.1, notificaciones.marcar_cambio, [self.user.id])
+        inicio = time.monotonic()
+        r = await self.async_client.get('/api/notificaciones/', {'since': version, 'wait': 5})
+        self.assertLess(time.monotonic() - inicio, 2)
+        self.assertNotEqual(r.json()['version'], version)
+        self.assertNotIn('sin_cambios', r.json())
+
+
+class BandejaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ana = User.objects.create_user('ana', password='x')
+        cls.beto = User.objects.create_user('beto', password='x')
+        cls.carla = User.objects.create_user('carla', password='x')
+        cls.chats = []
+        for nombre in ('Bicicleta', 'Mesa'):
+            producto = Producto.objects.create(usuario=cls.ana, nombre=nombre, descripcion='x')
+            trueque = Trueque.objects.create(solicitante=cls.beto, receptor=cls.ana, producto=producto)
+            chat = Chat.objects.create(trueque=trueque)
+            chat.usuarios.set([cls.ana, cls.beto])
+            cls.chats.append(chat)
+
+    def test_orden_por_actividad_y_no_leidos(self):
+        viejo, nuevo = self.chats
+        bandeja.crear_mensaje(viejo.id, self.beto, 'hola')
+        bandeja.crear_mensaje(viejo.id, self.beto, 'sigue disponible?')
+        chats = bandeja.chats_de(self.ana.id)
+        self.assertEqual([c.id for c in chats], [viejo.id, nuevo.id])
+        self.assertEqual(chats[0].no_leidos, 2)
+        self.assertEqual(chats[0].vista_previa, 'sigue disponible?')
+        self.assertEqual(bandeja.chats_de(self.beto.id)[0].no_leidos, 0)
+
+        self.client.force_login(self.ana)
+        self.client.get(f'/chat/{viejo.id}/')
+        self.assertEqual(bandeja.chats_de(self.ana.id)[0].no_leidos, 0)
+
+    def test_acceso_solo_para_participantes(self):
+        chat = self.chats[0]
+        self.client.force_login(self.carla)
+        self.assertEqual(self.client.get(f'/chat/{chat.id}/').status_code, 403)
+        self.assertEqual(self.client.get(f'/api/chat/{chat.id}/messages/').status_code, 403)
+        self.assertEqual(self.client.get('/api/chat/999/messages/').status_code, 404)
+        self.assertEqual(self.client.post(f'/chat/{chat.id}/reportar/').status_code, 403)
+        chat.usuarios.add(self.carla)
+        self.assertEqual(self.client.get(f'/chat/{chat.id}/').status_code, 200)
+        chat.usuarios.remove(self.carla)
+        self.assertFalse(bandeja.es_participante(chat.id, self.carla.id))
+
+
+class ArchivoTests(TestCase):
+    def setUp(self):
+        self.ana = User.objects.create_user('ana', password='x')
+        beto = User.objects.create_user('beto', password='x')
+        producto = Producto.objects.create(usuario=self.ana, nombre='Bicicleta', descripcion='x')
+        self.chat = Chat.objects.create(trueque=Trueque.objects.create(solicitante=beto, receptor=self.ana,
+                                                                       producto=producto))
+        self.chat.usuarios.set([self.ana, beto])
+        for i in range(30):
+            bandeja.crear_mensaje(self.chat.id, (self.ana, beto)[i % 2], f'mensaje {i}')
+        self.ids = list(self.chat.mensajes.order_by('id').values_list('id', flat=True))
+        self.chat.mensajes.update(fecha=timezone.now() - timedelta(days=100))
+
+    def _ids(self, **params):
+        r = self.client.get(f'/api/chat/{self.chat.id}/messages/', params)
+        return [m['id'] for m in r.json()['mensajes']], r.json()['hay_mas']
+
+    def test_lo_archivado_se_sigue_leyendo(self):
+        antes_de = timezone.now() - timedelta(days=90)
+        self.assertEqual(archivo.archivar(antes_de, retener=10, tamano=8), (1, 3, 20))
+        self.assertEqual(self.chat.mensajes.count(), 10)
+        self.assertEqual(archivo.archivar(antes_de, retener=10, tamano=8), (0, 0, 0))
+
+        self.client.force_login(self.ana)
+        self.assertEqual(self._ids(limit=15), (self.ids[15:], True))
+        self.assertEqual(self._ids(before_id=self.ids[15], limit=12), (self.ids[3:15], True))
+        self.assertEqual(self._ids(before_id=self.ids[3], limit=12), (self.ids[:3], False))
+        self.assertEqual(self._ids(since_id=self.ids[2], limit=12), (self.ids[3:15], True))
+        with self.assertNumQueries(2):  # participante y la página caliente: sin tocar el archivo
+            self.assertEqual(self._ids(since_id=self.ids[-1]), ([], False))
+        r = self.client.get(f'/chat/{self.chat.id}/')
+        self.assertContains(r, 'mensaje 0')
+
+    def test_archivar_desde_otro_proceso_con_cache_caliente(self):
+        self.client.force_login(self.ana)
+        self.assertEqual(self._ids(limit=50), (self.ids, False))
+        # el comando corre en otro proceso: nada de lo que invalide llega a esta caché
+        with mock.patch.object(cache, 'invalidar'):
+            call_command('archivar_mensajes', retener=10, tamano_bloque=8, stdout=StringIO())
+        self.assertEqual(self.chat.mensajes.count(), 10)
+        self.assertEqual(self._ids(limit=50), (self.ids, False))
+        self.assertEqual(self._ids(since_id=self.ids[0], limit=50), (self.ids[1:], False))
+
+    def test_since_id_archivado_con_pagina_caliente_llena(self):
+        archivo.archivar(timezone.now() - timedelta(days=90), retener=10, tamano=8)
+        self.client.force_login(self.ana)
+        self.assertEqual(self._ids(since_id=self.ids[2], limit=5), (self.ids[3:8], True))
+        self.assertEqual(self._ids(since_id=self.ids[17], limit=5), (self.ids[18:23], True))
+        self.assertEqual(self._ids(before_id=self.ids[25], limit=5), (self.ids[20:25], True))
+        visto, todos = self.ids[0], []
+        while True:
+            ids, hay_mas = self._ids(since_id=visto, limit=7)
+            todos += ids
+            if not hay_mas:
+                break
+            visto = ids[-1]
+        self.assertEqual(todos, self.ids[1:])
+
+
+class ReputacionTests(TestCase):
+    def setUp(self):
+        limites.reiniciar()
+        self.ana = User.objects.create_user('ana', password='x')
+        self.beto = User.objects.create_user('beto', password='x')
+        producto = Producto.objects.create(usuario=self.ana, nombre='Bicicleta', descripcion='x')
+        self.chat = Chat.objects.create(trueque=Trueque.objects.create(solicitante=self.beto, receptor=self.ana,
+                                                                       producto=producto))
+        self.chat.usuarios.set([self.ana, self.beto])
+
+    def test_calificar_y_reportar_ajustan_la_reputacion(self):
+        self.client.force_login(self.beto)
+        self.client.get('/')  # deja la lista de productos en caché
+        for rating in (2, 5):
+            r = self.client.post(f'/chat/{self.chat.id}/calificar/', {'rating': rating})
+            self.assertTrue(r.json()['ok'])
+        self.assertIn('actualizada', r.json()['mensaje'])
+        for _ in range(2):
+            self.client.post(f'/chat/{self.chat.id}/reportar/', {'motivo': 'no vino'})
+        rep = Reputacion.objects.get(usuario=self.ana)
+        self.assertEqual((rep.calificaciones, rep.suma, rep.promedio, rep.reportes), (1, 5, 5.0, 1))
+        self.assertAlmostEqual(rep.puntaje, (5 * 3.5 + 5) / 6, places=3)
+        self.assertFalse(Reputacion.objects.filter(usuario=self.beto).exists())
+
+        self.assertContains(self.client.get('/'), 'class="badge text-bg-light reputacion"')
+        resultado = self.client.get('/buscar-productos/', {'q': 'bicicleta'}).json()['productos'][0]
+        self.assertEqual(resultado['reputacion']['calificaciones'], 1)
+
+        Calificacion.objects.filter(calificado=self.ana).delete()
+        self.assertEqual(Reputacion.objects.get(usuario=self.ana).calificaciones, 0)
+
+    def test_recalcular_corrige_los_agregados(self):
+        reputacion.calificar(self.chat.id, self.beto, 4)
+        reputacion.calificar(self.chat.id, self.ana, 3)
+        Reputacion.objects.update(calificaciones=9, suma=1)
+        Calificacion.objects.filter(autor=self.ana).update(puntaje=1)  # update() no pasa por ajustar
+        self.assertEqual(reputacion.recalcular(lote=1, corregir=False), (2, 2))
+        self.assertEqual(reputacion.recalcular(lote=1), (2, 2))
+        self.assertEqual(reputacion.recalcular(), (2, 0))
+        self.assertEqual(
+            dict(Reputacion.objects.values_list('usuario__username', 'suma')), {'ana': 4, 'beto': 1})
+
+
+class TruequesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ana = User.objects.create_user('ana', password='x')
+        cls.beto = User.objects.create_user('beto', password='x')
+        cls.producto = Producto.objects.create(usuario=cls.ana, nombre='Bicicleta', descripcion='x')
+
+    def setUp(self):
+        limites.reiniciar()
+
+    def test_oferta_repetida_no_se_duplica(self):
+        self.client.force_login(self.beto)
+        for _ in range(3):
+            self.client.post(f'/ofrecer-trueque/{self.producto.id}/')
+        self.assertEqual(Trueque.objects.filter(solicitante=self.beto).count(), 1)
+        self.assertEqual(Notificacion.objects.get(usuario=self.ana).cantidad, 1)
+
+    def test_transiciones_desde_pendiente(self):
+        t, _ = trueques.ofrecer(self.beto, self.producto)
+        chat, aplicado = trueques.aceptar(t)
+        self.assertTrue(aplicado)
+        self.assertEqual(trueques.aceptar(t), (chat, False))
+        with self.assertRaises(trueques.TransicionInvalida):
+            trueques.rechazar(t)
+        t.refresh_from_db()
+        self.assertEqual((t.estado, t.activa), ('aceptado', None))
+        self.assertEqual(Chat.objects.filter(trueque=t).count(), 1)
+        self.assertEqual(Notificacion.objects.filter(tipo='trueque_aceptado').count(), 2)
+        # ya no está pendiente: se puede volver a ofrecer
+        self.assertTrue(trueques.ofrecer(self.beto, self.producto)[1])
+
+    def test_oferta_que_gana_y_se_responde_antes_de_leerla(self):
+        crear = Trueque.objects.create
+        intentos = []
+
+        def create(**kwargs):
+            intentos.append(kwargs)
+            if len(intentos) == 1:
+                # la oferta que ganó ya no está pendiente cuando la buscamos
+                trueques.rechazar(crear(**kwargs))
+                raise IntegrityError('trueque_oferta_activa_unica')
+            return crear(**kwargs)
+
+        with mock.patch.object(Trueque.objects, 'create', side_effect=create):
+            t, creado = trueques.ofrecer(self.beto, self.producto)
+        self.assertEqual((len(intentos), creado, t.estado), (2, True, 'pendiente'))
+        self.assertEqual(Trueque.objects.filter(solicitante=self.beto, activa=True).get(), t)
+
+    def test_la_cache_se_invalida_al_confirmar(self):
+        t, _ = trueques.ofrecer(self.beto, self.producto)
+        espacio = cache.espacio_usuario(self.ana.id)
+        antes = cache.obtener_cache().generacion(espacio)
+        with self.captureOnCommitCallbacks(execute=True):
+            trueques.rechazar(t)
+            self.assertEqual(cache.obtener_cache().generacion(espacio), antes)
+        self.assertGreater(cache.obtener_cache().generacion(espacio), antes)
+
+    def test_aceptar_de_nuevo_sin_chat(self):
+        t, _ = trueques.ofrecer(self.beto, self.producto)
+        trueques.aceptar(t)
+        Chat.objects.filter(trueque=t).delete()
+        self.client.force_login(self.ana)
+        r = self.client.post(f'/aceptar-trueque/{t.id}/', headers={'Accept': 'application/json'})
+        self.assertEqual(r.json()['chat_url'], f'/chat/{Chat.objects.get(trueque=t).id}/')
+
+    def test_reintento_con_la_misma_clave(self):
+        t, _ = trueques.ofrecer(self.beto, self.producto)
+        self.client.force_login(self.ana)
+        url = f'/aceptar-trueque/{t.id}/'
+        primera = self.client.post(url, headers={'Idempotency-Key': 'k-aceptar'})
+        with self.assertNumQueries(1):  # solo el usuario: la sesión sale de la caché
+            segunda = self.client.post(url, headers={'Idempotency-Key': 'k-aceptar'})
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.assertEqual((segunda.status_code, segunda['Location']), (primera.status_code, primera['Location']))
+
+
+class AccionesHomeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ana = User.objects.create_user('ana', password='x')
+        cls.beto = User.objects.create_user('beto', password='x')
+
+    def setUp(self):
+        limites.reiniciar()
+
+    def test_json_con_solo_lo_que_cambio(self):
+        self.client.force_login(self.ana)
+        json_ = {'Accept': 'application/json'}
+        r = self.client.post('/crear-producto/', {'nombre': 'Bicicleta', 'descripcion': 'roja'}, headers=json_)
+        datos = r.json()
+        self.assertTrue(datos['ok'])
+        self.assertIn(f'data-producto-id="{datos["id"]}"', datos['html'])
+        self.assertEqual(self.client.post('/crear-producto/', {'nombre': ''}, headers=json_).status_code, 400)
+
+        self.client.force_login(self.beto)
+        r = self.client.post(f'/eliminar-producto/{datos["id"]}/', headers=json_)
+        self.assertEqual(r.status_code, 403)
+        t = self.client.post(f'/ofrecer-trueque/{datos["id"]}/', headers=json_).json()
+        self.assertTrue(t['creado'])
+
+        self.client.force_login(self.ana)
+        r = self.client.post(f'/aceptar-trueque/{t["trueque_id"]}/', headers=json_).json()
+        self.assertEqual(r['estado'], 'aceptado')
+        r = self.client.post(f'/rechazar-trueque/{t["trueque_id"]}/', headers=json_)
+        self.assertEqual(r.status_code, 409)
+
+    def test_formulario_sin_js_redirige(self):
+        self.client.force_login(self.ana)
+        r = self.client.post('/', {'action': 'crear_producto', 'nombre': 'Mesa', 'descripcion': 'x'})
+        self.assertRedirects(r, '/', fetch_redirect_response=False)
+        self.assertTrue(Producto.objects.filter(nombre='Mesa').exists())
+
+
+class EmparejamientoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.u = {n: User.objects.create_user(n, password='x') for n in ('ana', 'beto', 'carla', 'dani')}
+        cls.p = {n: Producto.objects.create(usuario=u, nombre=f'cosa de {n}', descripcion='x')
+                 for n, u in cls.u.items()}
+        cls.t = {}
+        for quien, de in (('ana', 'beto'), ('beto', 'ana'), ('ana', 'carla'), ('carla', 'dani'), ('dani', 'ana')):
+            cls.t[quien, de] = Trueque.objects.create(solicitante=cls.u[quien], receptor=cls.u[de],
+                                                      producto=cls.p[de])
+
+    def setUp(self):
+        emparejamiento.reiniciar()
+        self.client.force_login(self.u['ana'])
+
+    def _intercambios(self):
+        return [[(p['usuario'], p['recibe_de']) for p in i['pasos']]
+                for i in self.client.get('/api/sugerencias/').json()['intercambios']]
+
+    def test_directos_y_en_ciclo(self):
+        self.assertEqual(self._intercambios(), [
+            [('ana', 'beto'), ('beto', 'ana')],
+            [('ana', 'carla'), ('carla', 'dani'), ('dani', 'ana')],
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.t['beto', 'ana'].estado = 'rechazado'
+            self.t['beto', 'ana'].save()
+        self.assertEqual(len(emparejamiento.grafo()), 4)
+        self.assertEqual(len(self._intercambios()), 1)
+
+    def test_pedidos_cambiados_sin_senales_se_descartan(self):
+        self.assertEqual(len(self._intercambios()), 2)
+        Trueque.objects.filter(id=self.t['carla', 'dani'].id).update(estado='aceptado')
+        self.assertEqual(self._intercambios(), [[('ana', 'beto'), ('beto', 'ana')]])
+
+    def test_recalcular_avisa_si_la_cache_no_es_compartida(self):
+        salida, errores = StringIO(), StringIO()
+        call_command('recalcular_emparejamientos', muestras=4, stdout=salida, stderr=errores)
+        self.assertIn('memoria local', errores.getvalue())
+
+        with tempfile.TemporaryDirectory() as d:
+            cache_en_disco = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': d}
+            with override_settings(CACHES={'default': cache_en_disco}):
+                generacion = emparejamiento._generacion()
+                salida, errores = StringIO(), StringIO()
+                call_command('recalcular_emparejamientos', muestras=4, stdout=salida, stderr=errores)
+                self.assertEqual(errores.getvalue(), '')
+                self.assertIn('Generación incrementada', salida.getvalue())
+                self.assertEqual(emparejamiento._generacion(), generacion + 1)
+
+
+class LimitesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ana', password='x')
+        cls.admin = User.objects.create_user('admin', password='x', is_staff=True)
+
+    @override_settings(SWAPPLACE_LIMITES={'POLITICAS': {'buscar_productos': {'RAFAGA': 2, 'POR_MINUTO': 6}}})
+    def test_rafaga_y_retry_after(self):
+        self.client.force_login(self.user)
+        estados = [self.client.get('/buscar-productos/', {'q': 'bici'}).status_code for _ in range(3)]
+        self.assertEqual(estados, [200, 200, 429])
+        r = self.client.get('/buscar-productos/', {'q': 'bici'})
+        self.assertEqual(r['Retry-After'], '10')
+        self.assertEqual(self.client.get('/api/productos/').status_code, 200)
+
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get('/buscar-productos/', {'q': 'bici'}).status_code, 200)
+        vistas = self.client.get('/api/metricas/').json()['limites']['vistas']
+        self.assertEqual(vistas['buscar_productos'], {'permitidas': 3, 'rechazadas': 2})
+
+
+class MediaTests(TestCase):
+    def setUp(self):
+        raiz = tempfile.TemporaryDirectory()
+        self.addCleanup(raiz.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=raiz.name))
+        self.raiz = raiz.name
+        self.user = User.objects.create_user('ana', password='x')
+
+    def _producto(self, contenido, nombre='foto.JPG'):
+        return Producto.objects.create(usuario=self.user, nombre='bici', descripcion='roja',
+                                       imagen=SimpleUploadedFile(nombre, contenido))
+
+    def _referencias(self, nombre):
+        return ArchivoMedia.objects.get(nombre=nombre).referencias
+
+    def test_mismo_contenido_un_archivo_y_limpieza(self):
+        a, b = self._producto(b'x' * 1000), self._producto(b'x' * 1000, 'otra.jpg')
+        self.assertEqual(a.imagen.name, b.imagen.name)
+        self.assertRegex(a.imagen.name, r'^productos/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(self._referencias(a.imagen.name), 2)
+
+        a = Producto.objects.get(id=a.id)
+        a.imagen = SimpleUploadedFile('nueva.jpg', b'y' * 10)
+        a.save()
+        b.delete()
+        viejo = b.imagen.name
+        self.assertEqual(self._referencias(viejo), 0)
+        self.assertEqual(self._referencias(a.imagen.name), 1)
+
+        self.assertEqual(media.limpiar(gracia=3600), (0, 0))  # dentro de la gracia no se toca
+        os.utime(os.path.join(self.raiz, viejo), (0, 0))
+        ArchivoMedia.objects.filter(nombre=viejo).update(actualizado=timezone.now() - timedelta(hours=2))
+        self.assertEqual(media.limpiar(gracia=3600), (1, 1000))
+        self.assertFalse(os.path.exists(os.path.join(self.raiz, viejo)))
+        self.assertTrue(os.path.exists(os.path.join(self.raiz, a.imagen.name)))
+
+    def test_servir_inmutable_y_por_rangos(self):
+        p = self._producto(bytes(range(100)))
+        url = p.imagen.url
+        r = self.client.get(url)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(b''.join(r.streaming_content), bytes(range(100)))
+        self.assertEqual(r['Cache-Control'], media.INMUTABLE)
+        self.assertEqual(r['Accept-Ranges'], 'bytes')
+
+        r = self.client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(r.status_code, 206)
+        self.assertEqual(r['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(b''.join(r.streaming_content), bytes(range(10, 20)))
+        r = self.client.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(r.streaming_content), bytes(range(95, 100)))
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=100-').status_code, 416)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=r['ETag']).status_code, 304)
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+
+
+@override_settings(SWAPPLACE_TAREAS_SINCRONAS=True)
+class ImagenesTests(TestCase):
+    def setUp(self):
+        raiz = tempfile.TemporaryDirectory()
+        self.addCleanup(raiz.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=raiz.name))
+        self.user = User.objects.create_user('ana', password='x')
+        self.client.force_login(self.user)
+
+    def _subir(self, contenido, nombre):
+        with self.captureOnCommitCallbacks(execute=True):
+            r = self.client.post('/crear-producto/', {
+                'nombre': 'Bicicleta', 'descripcion': 'roja', 'imagen': SimpleUploadedFile(nombre, contenido),
+            }, headers={'Accept': 'application/json'})
+        self.assertEqual(r.status_code, 200)
+        return Producto.objects.get(id=r.json()['id'])
+
+    def test_variantes_por_ancho_y_formato(self):
+        from PIL import Image
+        buf = BytesIO()
+        Image.new('RGB', (800, 400), 'red').save(buf, 'PNG')
+        p = self._subir(buf.getvalue(), 'foto.png')
+        self.assertEqual((p.imagen_ancho, p.imagen_alto), (800, 400))
+        formatos = imagenes.formatos_disponibles()
+        self.assertIn('webp', formatos)
+        for formato in formatos:
+            self.assertEqual(sorted(p.imagen_urls(formato)), [160, 320, 640])
+            self.assertEqual(p.imagen_srcset[formato].count('w, '), 2)
+        self.assertEqual(p.miniatura_tarjeta, p.imagen_urls('webp')[640])
+        with p.imagen.storage.open(p.imagen_variantes['webp']['160']) as f:
+            self.assertEqual(Image.open(f).size, (160, 80))
+
+    def test_archivo_que_no_es_imagen(self):
+        with self.assertLogs('SwapApp.imagenes', 'WARNING'):
+            p = self._subir(b'esto no es una imagen', 'foto.jpg')
+        self.assertEqual((p.imagen_variantes or {}, p.imagen_srcset), ({}, {}))
+        self.assertEqual(p.miniatura_tarjeta, p.imagen.url)
+
+
+class EstaticosTests(TestCase):
+    def test_collectstatic_con_huella_y_precomprimido(self):
+        raiz = tempfile.TemporaryDirectory()
+        self.addCleanup(raiz.cleanup)
+        with override_settings(STATIC_ROOT=raiz.name):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            url = static('css/styles.css')
+            self.assertRegex(url, r'/static/css/styles\.[0-9a-f]{12}\.css$')
+
+            r = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual((r['Content-Encoding'], r['Cache-Control']), ('gzip', media.INMUTABLE))
+            with open(os.path.join(raiz.name, 'css', 'styles.css'), 'rb') as f:
+                self.assertEqual(gzip.decompress(b''.join(r.streaming_content)), f.read())
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=r['ETag'],
+                                             HTTP_ACCEPT_ENCODING='gzip').status_code, 304)
+
+            r = self.client.get('/static/css/styles.css', HTTP_ACCEPT_ENCODING='gzip')
+            self.assertFalse(r.has_header('Content-Encoding'))  # sin huella: sin variantes ni caché larga
+            self.assertEqual(r['Cache-Control'], 'no-cache')
+            self.assertEqual(self.client.get('/static/../manage.py').status_code, 404)
+
+    def test_html_y_json_se_comprimen_segun_accept_encoding(self):
+        user = User.objects.create_user('ana', password='x')
+        Producto.objects.create(usuario=user, nombre='Bicicleta', descripcion='x')
+        self.client.force_login(user)
+        r = self.client.get('/', HTTP_ACCEPT_ENCODING='br;q=1.0, gzip;q=0.8')
+        self.assertEqual(r['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', r['Vary'])
+        self.assertIn(static('img/logo.png'), gzip.decompress(r.content).decode())
+        self.assertFalse(self.client.get('/', HTTP_ACCEPT_ENCODING='gzip;q=0').has_header('Content-Encoding'))
+        # la búsqueda es JSON chico: bajo MIN_BYTES va sin comprimir
+        r = self.client.get('/buscar-productos/', {'q': 'bici'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(r.has_header('Content-Encoding'))
+        self.assertEqual(r.json()['productos'][0]['imagen'], static('img/logo.png'))
+
+
+class CargaTests(TestCase):
+    def _reporte(self, p95, rps=100):
+        vista = {'peticiones': 1000, 'req_por_segundo': rps, 'p50_ms': 5, 'p95_ms': p95, 'p99_ms': p95,
+                 'errores': 0, 'limitadas': 0}
+        return {'config': {'semilla': 1}, 'resultados': [
+            {'usuarios': 50, **vista, 'sostenido': p95 < 500, 'vistas': {'home': vista}}]}
+
+    def test_comparar_con_la_base(self):
+        base = self._reporte(40)
+        self.assertEqual(carga.comparar(self._reporte(45), base), [])
+        regresiones = carga.comparar(self._reporte(900, rps=60), base)
+        self.assertEqual(len(regresiones), 4)  # deja de sostenerse, req/s, p95 global y de home
+        otra = self._reporte(40)
+        otra['config']['semilla'] = 2
+        with self.assertRaises(ValueError):
+            carga.comparar(otra, base)
+
+
+class CacheLRUTests(TestCase):
+    def test_expulsa_el_menos_usado(self):
+        c = cache.CacheLRU(max_entradas=3)
+        for clave in 'abc':
+            c.set(clave, clave.upper())
+        self.assertEqual(c.get('a'), 'A')  # 'a' pasa a ser la más reciente
+        c.set('d', 'D')
+        self.assertIs(c.get('b'), cache._FALTA)
+        self.assertEqual([c.get(k) for k in 'acd'], ['A', 'C', 'D'])
+        c.set('e', 'E')
+        self.assertIs(c.get('a'), cache._FALTA)
+        stats = c.estadisticas()
+        self.assertEqual((stats['entradas'], stats['expulsiones']), (3, 2))
+        self.assertEqual((stats['aciertos'], stats['fallos'], stats['tasa_aciertos']), (4, 2, 0.6667))
+
+    def test_vencidas_cuentan_como_fallo(self):
+        c = cache.CacheLRU(ttl=60)
+        c.set('a', 1, ttl=-1)
+        self.assertIs(c.get('a'), cache._FALTA)
+        self.assertEqual((c.estadisticas()['entradas'], c.fallos), (0, 1))
+
+    def test_invalidar_y_generaciones_acotadas(self):
+        c = cache.CacheLRU(max_entradas=2, max_generaciones=2)
+        with mock.patch.object(cache, '_backend', c):
+            calcular = mock.Mock(side_effect=[1, 2, 3])
+            self.assertEqual(cache.cacheado(['x'], 'k', calcular), 1)
+            self.assertEqual(cache.cacheado(['x'], 'k', calcular), 1)
+            cache.invalidar('x')
+            self.assertEqual(cache.cacheado(['x'], 'k', calcular), 2)
+            gen = c.generacion('x')
+            for i in range(10):
+                c.incrementar_generacion(f'usuario:{i}')
+            self.assertEqual(c.estadisticas()['generaciones'], 2)
+            # 'x' salió del mapa: vuelve con una generación que no usó nunca
+            self.assertGreater(c.generacion('x'), gen)
+            self.assertEqual(cache.cacheado(['x'], 'k', calcular), 3)
+
+    def test_invalidar_al_confirmar(self):
+        gen = cache.obtener_cache().generacion('productos')
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.create(usuario=User.objects.create_user('ana', password='x'),
+                                    nombre='Bicicleta', descripcion='x')
+            self.assertEqual(cache.obtener_cache().generacion('productos'), gen)
+        self.assertGreater(cache.obtener_cache().generacion('productos'), gen)
+
+
+class PerfiladoTests(TestCase):
+    def setUp(self):
+        perfilado.reiniciar()
+        self.addCleanup(perfilado.reiniciar)
+        self.ana = User.objects.create_user('ana', password='x')
+        self.client.force_login(self.ana)
+
+    @override_settings(SWAPPLACE_PERFILADO={'ACTIVO': True, 'MUESTREO': 1.0, 'CABECERA': True})
+    def test_server_timing_y_metricas(self):
+        for _ in range(2):
+            r = self.client.get('/')
+        cabecera = r['Server-Timing']
+        self.assertEqual(re.findall(r'(?:^|, )(\w+);dur=[\d.]+', cabecera), ['total', 'vista', 'sql', 'plantillas'])
+        self.assertRegex(cabecera, r'sql;dur=[\d.]+;desc="[1-9]\d* consultas, \d+ duplicadas"')
+        self.assertEqual(self.client.get('/api/metricas/').status_code, 302)  # solo staff
+
+        User.objects.filter(id=self.ana.id).update(is_staff=True)
+        self.client.force_login(User.objects.get(id=self.ana.id))
+        vistas = self.client.get('/api/metricas/').json()['vistas']
+        self.assertEqual(vistas['home']['requests'], 2)
+        self.assertGreater(vistas['home']['sql_consultas_prom'], 0)
+        self.assertEqual(sum(vistas['home']['buckets_ms'].values()), 2)
+
+    @override_settings(SWAPPLACE_PERFILADO={'ACTIVO': True, 'MUESTREO': 1.0, 'CABECERA': True})
+    async def test_requests_async_simultaneos_no_se_mezclan(self):
+        beto = await sync_to_async(User.objects.create_user)('beto', password='x')
+        otro = self.async_client_class()
+        await otro.aforce_login(beto)
+        await self.async_client.aforce_login(self.ana)
+
+        def consultas(r):
+            return int(re.search(r'desc="(\d+) consultas', r['Server-Timing']).group(1))
+
+        async def long_poll():
+            version = await notificaciones.aversion(self.ana.id)
+            return await self.async_client.get('/api/notificaciones/', {'since': version, 'wait': 5})
+
+        async def despertar(requests_ajenos):
+            await asyncio.sleep(0.1)
+            for _ in range(requests_ajenos):
+                self.assertGreater(consultas(await otro.get('/api/notificaciones/')), 0)
+            notificaciones.marcar_cambio([self.ana.id])
+
+        await asyncio.gather(long_poll(), despertar(1))  # sesiones e identidades ya en caché
+        sola, _ = await asyncio.gather(long_poll(), despertar(0))
+        # mientras espera, otro usuario consulta por las mismas conexiones
+        acompanada, _ = await asyncio.gather(long_poll(), despertar(3))
+        self.assertEqual(consultas(acompanada), consultas(sola))
+
+    @override_settings(SWAPPLACE_PERFILADO={'ACTIVO': False})
+    def test_desactivado_no_mide(self):
+        r = self.client.get('/')
+        self.assertFalse(r.has_header('Server-Timing'))
+        self.assertEqual(perfilado.resumen(), {})
+
+
+class IdentidadCacheadaTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ana', password='x')
+        self.client.login(username='ana', password='x')
+        self.version = notificaciones.version(self.user.id)
+
+    def test_polling_sin_consultas(self):
+        with self.assertNumQueries(0):
+            r = self.client.get('/api/notificaciones/', {'since': self.version})
+        self.assertEqual(r.json()['sin_cambios'], True)
+
+    def test_cambio_de_contrasena_cierra_la_sesion(self):
+        self.client.get('/api/notificaciones/', {'since': self.version})
+        self.user.set_password('y')
+        self.user.save()
+        r = self.client.get('/api/notificaciones/', {'since': self.version})
+        self.assertEqual(r.status_code, 302)
+
+
+@override_settings(SWAPPLACE_REPLICAS={'ALIAS': ['replica1'], 'VISTAS': ['buscar_productos']})
+class RouterReplicasTests(TestCase):
+    def setUp(self):
+        self.router = routers.RouterReplicas()
+        self.tokens = (routers._lectura.set(True), routers._escribio.set(False))
+        routers._salud['replica1'] = (float('inf'), True)
+
+    def tearDown(self):
+        routers._lectura.reset(self.tokens[0])
+        routers._escribio.reset(self.tokens[1])
+        routers._salud.pop('replica1', None)
+
+    def leer(self):
+        # los tests corren dentro de una transacción: se mira el ruteo fuera de ella
+        connection.in_atomic_block, previo = False, connection.in_atomic_block
+        try:
+            return self.router.db_for_read(Producto)
+        finally:
+            connection.in_atomic_block = previo
+
+    def test_lecturas_a_la_replica(self):
+        self.assertEqual(self.leer(), 'replica1')
+        self.assertIsNone(self.router.db_for_read(User))
+
+    def test_tras_escribir_se_lee_del_primario(self):
+        self.assertEqual(self.router.db_for_write(Producto), 'default')
+        self.assertIsNone(self.leer())
+
+    def test_replica_caida(self):
+        routers._salud['replica1'] = (float('inf'), False)
+        self.assertIsNone(self.leer())
+
+    def test_dentro_de_una_transaccion_se_lee_del_primario(self):
+        self.assertIsNone(self.router.db_for_read(Producto))
+
+
+class BenchmarkVistasTests(TestCase):
+    """Corre el benchmark a escala chica: ninguna vista puede superar su umbral de consultas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.mercado = sembrado.sembrar(sembrado.Escala(
+            usuarios=8, productos=60, trueques=40, chats=3, mensajes_por_chat=80, notificaciones=40,
+        ))
+
+    def test_todas_las_urls_tienen_caso(self):
+        casos = benchmark.Casos(self.mercado)
+        self.assertEqual([n for n in benchmark.nombres_de_urls() if not hasattr(casos, n)], [])
+
+    def test_consultas_dentro_de_umbrales(self):
+        reporte = benchmark.ejecutar(self.mercado, repeticiones=2)
+        self.assertEqual(reporte['regresiones'], [], json.dumps(reporte['resultados'], indent=1))
@@ -0,0 +1,127 @@
+"""
+Canal de eventos en tiempo real (chat y notificaciones).
+
+Las vistas publican eventos en un canal (p.ej. ``chat:5``) y los clientes
+conectados por Server-Sent Events los reciben sin hacer polling. El broker
+se elige con ``settings.SWAPPLACE_BROKER``; el por defecto vive en memoria
+del proceso, así que funciona sin servicios externos. Con varios procesos
+hay que configurar un broker compartido que implemente la misma interfaz
+(``publicar``, ``suscribir``, ``cancelar``).
+"""
+
+import asyncio
+import threading
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class Suscripcion:
+    def __init__(self, broker, canal, max_pendientes=100):
+        self.broker = broker
+        self.canal = canal
+        self._pendientes = deque(maxlen=max_pendientes)
+        self._cond = threading.Condition()
+        self._loop = None
+        self._evento_async = None
+
+    def entregar(self, evento):
+        # Puede llamarse desde cualquier hilo (vistas síncronas bajo WSGI).
+        with self._cond:
+            self._pendientes.append(evento)
+            self._cond.notify_all()
+            loop, evento_async = self._loop, self._evento_async
+        if loop is not None:
+            loop.call_soon_threadsafe(evento_async.set)
+
+    def _vaciar(self):
+        eventos = list(self._pendientes)
+        self._pendientes.clear()
+        return eventos
+
+    def esperar(self, timeout):
+        with self._cond:
+            if not self._pendientes:
+                self._cond.wait(timeout)
+            return self._vaciar()
+
+    async def esperar_async(self, timeout):
+        with self._cond:
+            if self._pendientes:
+                return self._vaciar()
+            self._loop = asyncio.get_running_loop()
+            self._evento_async = asyncio.Event()
+            evento_async = self._evento_async
+        try:
+            await asyncio.wait_for(evento_async.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        with self._cond:
+            self._loop = None
+            self._evento_async = None
+            return self._vaciar()
+
+    def cerrar(self):
+        self.broker.cancelar(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+class BrokerLocal:
+    """Broker en memoria del proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._suscriptores = defaultdict(set)
+
+    def publicar(self, canal, evento):
+        with self._lock:
+            suscriptores = list(self._suscriptores.get(canal, ()))
+        for s in suscriptores:
+            s.entregar(evento)
+        return len(suscriptores)
+
+    def suscribir(self, canal):
+        s = Suscripcion(self, canal)
+        with self._lock:
+            self._suscriptores[canal].add(s)
+        return s
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            subs = self._suscriptores.get(suscripcion.canal)
+            if subs is not None:
+                subs.discard(suscripcion)
+                if not subs:
+                    del self._suscriptores[suscripcion.canal]
+
+    def suscriptores(self, canal):
+        with self._lock:
+            return len(self._suscriptores.get(canal, ()))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def obtener_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                ruta = getattr(settings, 'SWAPPLACE_BROKER', 'SwapApp.tiempo_real.BrokerLocal')
+                _broker = import_string(ruta)()
+    return _broker
+
+
+def publicar(canal, evento):
+    return obtener_broker().publicar(canal, evento)
+
+
+def canal_chat(chat_id):
+    return f'chat:{chat_id}'
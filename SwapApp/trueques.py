@@ -0,0 +1,101 @@
+"""
+Estados de un trueque.
+
+Un trueque nace ``pendiente`` y el receptor lo pasa a ``aceptado`` o
+``rechazado``; no hay más transiciones. Cada una es un solo UPDATE
+condicionado al estado de origen (``WHERE estado='pendiente'``) en la misma
+transacción que el chat y las notificaciones: si dos clics o reintentos
+llegan a la vez, solo uno cambia la fila y el otro no repite efectos.
+Repetir la transición que ya se aplicó no es un error (no hace nada);
+pedir la contraria sí (``TransicionInvalida``).
+
+Las ofertas pendientes son únicas por (solicitante, producto): lo asegura
+la restricción ``trueque_oferta_activa_unica`` sobre ``Trueque.activa``,
+que vale True solo mientras está pendiente (NULL no choca con nada). Una
+oferta repetida devuelve la que ya existe.
+
+Como ``update()`` no emite ``post_save``, aquí se hace lo que harían las
+señales de ``Trueque``: invalidar la caché de los dos usuarios y sacar el
+pedido del grafo de ``emparejamiento``, ambas cosas al confirmar la
+transacción.
+"""
+
+from django.db import IntegrityError, transaction
+
+from . import cache, emparejamiento, notificaciones
+from .models import Chat, Trueque
+
+TRANSICIONES = {
+    'aceptar': ('pendiente', 'aceptado'),
+    'rechazar': ('pendiente', 'rechazado'),
+}
+
+
+class TransicionInvalida(Exception):
+    def __init__(self, trueque, accion):
+        self.trueque = trueque
+        self.accion = accion
+        super().__init__(f'El trueque ya está {trueque.estado}.')
+
+
+def ofrecer(solicitante, producto, intentos=3):
+    """Crea la oferta o devuelve la pendiente que ya había: ``(trueque, creado)``."""
+    for intento in range(intentos):
+        try:
+            with transaction.atomic():
+                t = Trueque.objects.create(solicitante=solicitante, receptor=producto.usuario, producto=producto)
+                with notificaciones.Despachador() as d:
+                    notificaciones.oferta_recibida(d, t)
+            return t, True
+        except IntegrityError:
+            t = Trueque.objects.filter(solicitante=solicitante, producto=producto, activa=True).first()
+            if t is not None:
+                return t, False
+            # la que ganó ya se respondió o se deshizo: se vuelve a intentar
+            if intento == intentos - 1:
+                raise
+
+
+def _transicion(trueque, accion):
+    origen, destino = TRANSICIONES[accion]
+    cambiadas = (Trueque.objects.filter(id=trueque.id, estado=origen)
+                 .update(estado=destino, activa=None))
+    if not cambiadas:
+        trueque.refresh_from_db(fields=['estado', 'activa'])
+        if trueque.estado != destino:
+            raise TransicionInvalida(trueque, accion)
+        return False
+    trueque.estado = destino
+    trueque.activa = None
+    # después del commit: antes, otro request podría volver a llenar la
+    # caché con la fila vieja
+    cache.invalidar_al_confirmar(cache.espacio_usuario(trueque.solicitante_id),
+                                 cache.espacio_usuario(trueque.receptor_id))
+    emparejamiento.trueque_guardado(trueque)  # también al confirmar
+    return True
+
+
+def aceptar(trueque):
+    """Acepta y abre el chat. Devuelve ``(chat, aplicado)``."""
+    with transaction.atomic():
+        if not _transicion(trueque, 'aceptar'):
+            # ya aceptado: el chat es el que se abrió entonces (se rehace si lo borraron)
+            chat, creado = Chat.objects.get_or_create(trueque=trueque)
+            if creado:
+                chat.usuarios.set([trueque.solicitante_id, trueque.receptor_id])
+            return chat, False
+        chat = Chat.objects.create(trueque=trueque)
+        chat.usuarios.set([trueque.solicitante_id, trueque.receptor_id])
+        with notificaciones.Despachador() as d:
+            notificaciones.trueque_aceptado(d, trueque, chat)
+    return chat, True
+
+
+def rechazar(trueque):
+    """Devuelve si se aplicó (False si ya estaba rechazado)."""
+    with transaction.atomic():
+        if not _transicion(trueque, 'rechazar'):
+            return False
+        with notificaciones.Despachador() as d:
+            notificaciones.trueque_rechazado(d, trueque)
+    return True
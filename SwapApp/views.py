@@ -1,18 +1,27 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
+from django.templatetags.static import static
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.http import JsonResponse, HttpResponseForbidden
+from django.http import JsonResponse, HttpResponseForbidden, HttpResponseNotModified, StreamingHttpResponse
 from django.views.decorators.http import require_POST
 from django.urls import reverse
 from django.db.models import Q
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_exempt
+from django.middleware.csrf import get_token
 from django.utils.timezone import localtime
+from asgiref.sync import sync_to_async
 from .models import Producto, Trueque, Chat, Mensaje, Notificacion
 from .forms import MensajeForm
-from datetime import timedelta
+from . import (archivo, bandeja, busqueda, cache, emparejamiento, imagenes, limites, notificaciones, perfilado,
+               reputacion, tiempo_real, trueques)
+from .decoradores import idempotente, login_requerido_async
+from datetime import datetime, timedelta, timezone as dt_timezone
+import hashlib
 import json
 
 # ---------- AUTH ----------
@@ -54,319 +63,523 @@ def logout_view(request):
 
 
 # ---------- HOME ----------
-@login_required
-def home_view(request):
-    user = request.user
-    productos = Producto.objects.all().order_by('-fecha_agregado')
+PRODUCTOS_POR_PAGINA = 24
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
 
-    notifs = Notificacion.objects.filter(usuario=user, visible=True).order_by('-creado')[:20]
-    trueques_pendientes = Trueque.objects.filter(receptor=user, estado='pendiente').order_by('-fecha')
-    trueques_aceptados = Trueque.objects.filter(estado='aceptado').filter(Q(solicitante=user) | Q(receptor=user)).order_by('-fecha')
 
-    # CREAR producto
-    if request.method == 'POST' and request.POST.get('action') == 'crear_producto':
-        nombre = request.POST.get('nombre')
-        descripcion = request.POST.get('descripcion')
-        imagen = request.FILES.get('imagen')
-        if nombre and descripcion:
-            Producto.objects.create(usuario=user, nombre=nombre, descripcion=descripcion, imagen=imagen)
-            messages.success(request, 'Producto creado correctamente.')
-        else:
-            messages.error(request, 'Completa nombre y descripción.')
-        return redirect('home')
+def _cursor_producto(p):
+    micros = (p.fecha_agregado - _EPOCH) // timedelta(microseconds=1)
+    return f'{micros}-{p.id}'
 
-    # EDITAR producto
-    if request.method == 'POST' and request.POST.get('action') == 'editar_producto':
-        producto_id = request.POST.get('producto_id')
-        producto = get_object_or_404(Producto, id=producto_id)
-
-        # Permitir si es dueño o si es superusuario admin3000
-        if producto.usuario != user and not (user.is_superuser and user.username == "admin3000"):
-            return HttpResponseForbidden("No tienes permiso para editar.")
-
-        producto.nombre = request.POST.get('nombre')
-        producto.descripcion = request.POST.get('descripcion')
-        if 'imagen' in request.FILES:
-            producto.imagen = request.FILES['imagen']
-        producto.save()
-        messages.success(request, 'Producto actualizado correctamente.')
-        return redirect('home')
 
-    # ELIMINAR producto
-    if request.method == 'POST' and request.POST.get('action') == 'eliminar_producto':
-        producto_id = request.POST.get('producto_id')
-        producto = get_object_or_404(Producto, id=producto_id)
+def _pagina_productos(cursor=None, limite=PRODUCTOS_POR_PAGINA):
+    # Paginación keyset sobre (fecha_agregado, id): cada página es un rango
+    # del índice producto_feed_idx, sin OFFSET ni COUNT.
+    qs = Producto.objects.select_related('usuario__reputacion').order_by('-fecha_agregado', '-id')
+    if cursor:
+        micros, pk = (int(x) for x in cursor.split('-'))
+        fecha = _EPOCH + timedelta(microseconds=micros)
+        qs = qs.filter(Q(fecha_agregado__lt=fecha) | Q(fecha_agregado=fecha, id__lt=pk))
+    productos = list(qs[:limite + 1])
+    siguiente = _cursor_producto(productos[limite - 1]) if len(productos) > limite else None
+    return productos[:limite], siguiente
 
-        # Permitir si es dueño o si es superusuario admin3000
-        if producto.usuario != user and not (user.is_superuser and user.username == "admin3000"):
-            return HttpResponseForbidden("No tienes permiso para eliminar.")
 
-        producto.delete()
-        messages.success(request, 'Producto eliminado correctamente.')
-        return redirect('home')
+def _clave_fragmento(request, nombre):
+    # Los fragmentos llevan {% csrf_token %} y botones según el usuario, así
+    # que la clave incluye al usuario y su secreto CSRF (cambia al loguearse).
+    get_token(request)
+    secreto = hashlib.sha1(request.META['CSRF_COOKIE'].encode()).hexdigest()[:12]
+    return f'{nombre}:{request.user.id}:{secreto}'
 
-    # OFRECER trueque
-    if request.method == 'POST' and request.POST.get('action') == 'ofrecer_trueque':
-        producto = get_object_or_404(Producto, id=request.POST.get('producto_id'))
-        if producto.usuario == user:
-            messages.error(request, 'No puedes ofrecer por tu propio producto.')
-            return redirect('home')
-        t = Trueque.objects.create(solicitante=user, receptor=producto.usuario, producto=producto)
-        Notificacion.objects.create(
-            usuario=producto.usuario,
-            titulo='Nueva solicitud de trueque',
-            mensaje=f'{user.username} ofreció un trueque por "{producto.nombre}".',
-            tipo='nuevo_trueque',
-            link=reverse('home')
-        )
-        messages.success(request, 'Solicitud de trueque enviada.')
-        return redirect('home')
 
-    # RESPONDER trueque
-    if request.method == 'POST' and request.POST.get('action') == 'responder_trueque':
-        trueque = get_object_or_404(Trueque, id=request.POST.get('trueque_id'))
-        if trueque.receptor != user:
-            return HttpResponseForbidden("No tienes permiso.")
-        decision = request.POST.get('decision')
-        if decision == 'aceptar':
-            trueque.estado = 'aceptado'
-            trueque.save()
-            chat, created = Chat.objects.get_or_create(trueque=trueque)
-            chat.usuarios.set([trueque.solicitante, trueque.receptor])
-            chat_url = reverse('chat_detalle', args=[chat.id])
-            Notificacion.objects.create(
-                usuario=trueque.solicitante,
-                titulo='Trueque aceptado',
-                mensaje=f'{trueque.receptor.username} aceptó tu solicitud. Pulsa Ver chat.',
-                tipo='trueque_aceptado',
-                link=chat_url
-            )
-            Notificacion.objects.create(
-                usuario=trueque.receptor,
-                titulo='Trueque aceptado',
-                mensaje=f'Aceptaste la solicitud de {trueque.solicitante.username}. Pulsa Ver chat.',
-                tipo='trueque_aceptado',
-                link=chat_url
-            )
-            messages.success(request, 'Trueque aceptado. Chat creado.')
-        else:
-            trueque.estado = 'rechazado'
-            trueque.save()
-            Notificacion.objects.create(
-                usuario=trueque.solicitante,
-                titulo='Trueque rechazado',
-                mensaje=f'{trueque.receptor.username} rechazó tu solicitud por "{trueque.producto.nombre}".',
-                tipo='trueque_rechazado',
-                link=reverse('home')
-            )
-            messages.info(request, 'Trueque rechazado.')
-        return redirect('home')
+def _fragmento_productos(request):
+    def calcular():
+        productos, siguiente = _pagina_productos()
+        return render_to_string('_productos.html', {'productos': productos}, request=request), siguiente
+    return cache.cacheado(['productos'], _clave_fragmento(request, 'home:productos'), calcular)
+
+
+def _fragmento_pendientes(request):
+    user = request.user
 
+    def calcular():
+        trueques_pendientes = (Trueque.objects.filter(receptor=user, estado='pendiente')
+                               .select_related('solicitante__reputacion', 'producto').order_by('-fecha'))
+        return render_to_string('_trueques_pendientes.html',
+                                {'trueques_pendientes': trueques_pendientes}, request=request)
+    return cache.cacheado([cache.espacio_usuario(user.id)], _clave_fragmento(request, 'home:pendientes'), calcular)
+
+
+@login_required
+@idempotente
+def home_view(request):
+    user = request.user
+    notifs = Notificacion.objects.filter(usuario=user, visible=True).order_by('-creado')[:20]
+    trueques_aceptados = Trueque.objects.filter(estado='aceptado').filter(Q(solicitante=user) | Q(receptor=user)).order_by('-fecha')
+
+    # Acciones de los formularios sin JS; con JS van a los endpoints de cada una
+    if request.method == 'POST':
+        accion = request.POST.get('action')
+        if accion == 'crear_producto':
+            return _crear_producto(request)
+        if accion == 'editar_producto':
+            return _editar_producto(request, request.POST.get('producto_id'))
+        if accion == 'eliminar_producto':
+            return _eliminar_producto(request, request.POST.get('producto_id'))
+        if accion == 'ofrecer_trueque':
+            return _ofrecer(request, request.POST.get('producto_id'))
+        if accion == 'responder_trueque':
+            return _responder(request, request.POST.get('trueque_id'), request.POST.get('decision'))
+
+    productos_html, siguiente = _fragmento_productos(request)
     context = {
-        'productos': productos,
+        'productos_html': productos_html,
+        'siguiente_cursor': siguiente,
+        'pendientes_html': _fragmento_pendientes(request),
         'notificaciones': notifs,
-        'trueques_pendientes': trueques_pendientes,
         'trueques_aceptados': trueques_aceptados,
         'chats': Chat.objects.filter(usuarios=user).order_by('-creado'),  # <-- más recientes primero
+        'busqueda_longitud_minima': busqueda.LONGITUD_MINIMA,
     }
     return render(request, 'home.html', context)
 
 
+@login_required
+def api_productos(request):
+    # Páginas siguientes del feed para el scroll infinito del home.
+    try:
+        productos, siguiente = _pagina_productos(request.GET.get('cursor'))
+    except (ValueError, OverflowError):  # OverflowError: fecha fuera de rango
+        return JsonResponse({'error': 'Cursor inválido'}, status=400)
+    html = render_to_string('_productos.html', {'productos': productos}, request=request)
+    return JsonResponse({'html': html, 'siguiente': siguiente})
+
+
+# ---------- ACCIONES DEL HOME ----------
+# Cada acción responde JSON a fetch (Accept: application/json) con solo lo
+# que cambió, para que home.html parchee la página sin recargarla; un
+# formulario normal sigue recibiendo el mensaje y el redirect al home.
+def _quiere_json(request):
+    return 'application/json' in request.headers.get('Accept', '')
+
+
+def _hecho(request, mensaje, nivel=messages.SUCCESS, **datos):
+    if _quiere_json(request):
+        return JsonResponse({'ok': True, 'mensaje': mensaje, **datos})
+    messages.add_message(request, nivel, mensaje)
+    return redirect('home')
+
+
+def _fallo(request, mensaje, status=400):
+    if _quiere_json(request):
+        return JsonResponse({'ok': False, 'error': mensaje}, status=status)
+    if status == 403:
+        return HttpResponseForbidden(mensaje)
+    messages.error(request, mensaje)
+    return redirect('home')
+
+
+def _tarjeta(request, producto):
+    return render_to_string('_productos.html', {'productos': [producto]}, request=request)
+
+
+def _puede_modificar(user, producto):
+    # dueño o el superusuario admin3000
+    return producto.usuario_id == user.id or (user.is_superuser and user.username == "admin3000")
+
+
 # ---------- CRUD DE PRODUCTOS ----------
+def _crear_producto(request):
+    nombre = request.POST.get('nombre')
+    descripcion = request.POST.get('descripcion')
+    if not (nombre and descripcion):
+        return _fallo(request, 'Completa nombre y descripción.')
+    p = Producto.objects.create(usuario=request.user, nombre=nombre, descripcion=descripcion,
+                                imagen=request.FILES.get('imagen'))
+    return _hecho(request, 'Producto creado correctamente.', id=p.id, html=_tarjeta(request, p))
+
+
+def _editar_producto(request, producto_id):
+    producto = get_object_or_404(Producto.objects.select_related('usuario'), id=producto_id)
+    if not _puede_modificar(request.user, producto):
+        return _fallo(request, 'No tienes permiso para editar.', 403)
+    nombre = request.POST.get('nombre')
+    descripcion = request.POST.get('descripcion')
+    if not (nombre and descripcion):
+        return _fallo(request, 'Completa nombre y descripción.')
+    producto.nombre = nombre
+    producto.descripcion = descripcion
+    if 'imagen' in request.FILES:
+        producto.imagen = request.FILES['imagen']
+    producto.save()
+    return _hecho(request, 'Producto actualizado correctamente.', id=producto.id, html=_tarjeta(request, producto))
+
+
+def _eliminar_producto(request, producto_id):
+    producto = get_object_or_404(Producto, id=producto_id)
+    if not _puede_modificar(request.user, producto):
+        return _fallo(request, 'No tienes permiso para eliminar.', 403)
+    producto.delete()
+    return _hecho(request, 'Producto eliminado correctamente.', id=int(producto_id))
+
+
 @login_required
+@idempotente
 def crear_producto(request):
-    if request.method == 'POST':
-        nombre = request.POST.get('nombre')
-        descripcion = request.POST.get('descripcion')
-        imagen = request.FILES.get('imagen')
-        if nombre and descripcion:
-            Producto.objects.create(usuario=request.user, nombre=nombre, descripcion=descripcion, imagen=imagen)
-            messages.success(request, 'Producto creado correctamente.')
-    return redirect('home')
+    if request.method != 'POST':
+        return redirect('home')
+    return _crear_producto(request)
 
 
 @login_required
+@idempotente
 def editar_producto(request, producto_id):
-    producto = get_object_or_404(Producto, id=producto_id)
-    if producto.usuario != request.user:
-        return HttpResponseForbidden("No autorizado")
-    if request.method == 'POST':
-        producto.nombre = request.POST.get('nombre')
-        producto.descripcion = request.POST.get('descripcion')
-        if 'imagen' in request.FILES:
-            producto.imagen = request.FILES['imagen']
-        producto.save()
-        messages.success(request, 'Producto actualizado.')
-    return redirect('home')
+    if request.method != 'POST':
+        return redirect('home')
+    return _editar_producto(request, producto_id)
 
 
 @login_required
+@idempotente
 def eliminar_producto(request, producto_id):
-    producto = get_object_or_404(Producto, id=producto_id)
-    if producto.usuario != request.user:
-        return HttpResponseForbidden("No autorizado")
-    if request.method == 'POST':
-        producto.delete()
-        messages.success(request, 'Producto eliminado.')
-    return redirect('home')
+    if request.method != 'POST':
+        return redirect('home')
+    return _eliminar_producto(request, producto_id)
 
 
 # ---------- TRUEQUES ----------
+# Las transiciones viven en trueques.py; aquí solo se traducen a respuestas.
+def _ofrecer(request, producto_id):
+    producto = get_object_or_404(Producto, id=producto_id)
+    if producto.usuario_id == request.user.id:
+        return _fallo(request, 'No puedes ofrecer por tu propio producto.')
+    t, creado = trueques.ofrecer(request.user, producto)
+    if creado:
+        return _hecho(request, 'Solicitud de trueque enviada.', trueque_id=t.id, creado=True)
+    return _hecho(request, 'Ya tienes una solicitud pendiente por este producto.', messages.INFO,
+                  trueque_id=t.id, creado=False)
+
+
+def _responder(request, trueque_id, decision):
+    trueque = get_object_or_404(Trueque.objects.select_related('solicitante', 'receptor', 'producto'),
+                                id=trueque_id)
+    if trueque.receptor_id != request.user.id:
+        return _fallo(request, 'No tienes permiso.', 403)
+    try:
+        if decision == 'aceptar':
+            chat, _ = trueques.aceptar(trueque)
+            return _hecho(request, 'Trueque aceptado. Chat creado.', trueque_id=trueque.id,
+                          estado=trueque.estado, chat_url=reverse('chat_detalle', args=[chat.id]))
+        trueques.rechazar(trueque)
+        return _hecho(request, 'Trueque rechazado.', messages.INFO, trueque_id=trueque.id, estado=trueque.estado)
+    except trueques.TransicionInvalida as e:
+        return _fallo(request, str(e), 409)
+
+
 @login_required
+@idempotente
 def ofrecer_trueque(request, producto_id):
-    producto = get_object_or_404(Producto, id=producto_id)
-    if producto.usuario == request.user:
-        messages.error(request, 'No puedes ofrecer por tu propio producto.')
-        return redirect('home')
-    t = Trueque.objects.create(solicitante=request.user, receptor=producto.usuario, producto=producto)
-    Notificacion.objects.create(
-        usuario=producto.usuario,
-        titulo='Nueva solicitud de trueque',
-        mensaje=f'{request.user.username} ofreció un trueque por "{producto.nombre}".',
-        tipo='nuevo_trueque',
-        link=reverse('home')
-    )
-    messages.success(request, 'Solicitud de trueque enviada.')
-    return redirect('home')
+    return _ofrecer(request, producto_id)
 
 
 @login_required
+@idempotente
 def aceptar_trueque(request, trueque_id):
-    trueque = get_object_or_404(Trueque, id=trueque_id)
-    if trueque.receptor != request.user:
-        return HttpResponseForbidden("No tienes permiso")
-    trueque.estado = 'aceptado'
-    trueque.save()
-    chat, created = Chat.objects.get_or_create(trueque=trueque)
-    chat.usuarios.set([trueque.solicitante, trueque.receptor])
-    chat_url = reverse('chat_detalle', args=[chat.id])
-    Notificacion.objects.create(
-        usuario=trueque.solicitante,
-        titulo='Trueque aceptado',
-        mensaje=f'{trueque.receptor.username} aceptó tu solicitud. Pulsa Ver chat.',
-        tipo='trueque_aceptado',
-        link=chat_url
-    )
-    Notificacion.objects.create(
-        usuario=trueque.receptor,
-        titulo='Trueque aceptado',
-        mensaje=f'Aceptaste la solicitud de {trueque.solicitante.username}. Pulsa Ver chat.',
-        tipo='trueque_aceptado',
-        link=chat_url
-    )
-    messages.success(request, 'Trueque aceptado.')
-    return redirect('home')
+    return _responder(request, trueque_id, 'aceptar')
 
 
 @login_required
+@idempotente
 def rechazar_trueque(request, trueque_id):
-    trueque = get_object_or_404(Trueque, id=trueque_id)
-    if trueque.receptor != request.user:
-        return HttpResponseForbidden("No tienes permiso")
-    trueque.estado = 'rechazado'
-    trueque.save()
-    Notificacion.objects.create(
-        usuario=trueque.solicitante,
-        titulo='Trueque rechazado',
-        mensaje=f'{trueque.receptor.username} rechazó tu solicitud por "{trueque.producto.nombre}".',
-        tipo='trueque_rechazado',
-        link=reverse('home')
-    )
-    messages.info(request, 'Trueque rechazado.')
-    return redirect('home')
+    return _responder(request, trueque_id, 'rechazar')
+
+
+@login_required
+def api_sugerencias(request):
+    # intercambios directos o en ciclo (3-4 personas) en los que participa el usuario
+    try:
+        limite = max(1, min(int(request.GET.get('limit', 10)), 50))
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros inválidos'}, status=400)
+    datos = []
+    for pasos in emparejamiento.sugerencias(request.user.id, limite):
+        # cada participante es dueño en algún paso del ciclo
+        nombres = {x: ps[0].usuario.username for _, x, ps in pasos}
+        datos.append({
+            'tipo': 'directo' if len(pasos) == 2 else 'ciclo',
+            'participantes': len(pasos),
+            'pasos': [{
+                'usuario': nombres[u],
+                'recibe_de': nombres[x],
+                'productos': [{'id': p.id, 'nombre': p.nombre} for p in ps],
+            } for u, x, ps in pasos],
+        })
+    return JsonResponse({'intercambios': datos})
+
+
+def _reputacion(usuario):
+    # viene en el select_related; sin fila es que nadie lo calificó
+    rep = getattr(usuario, 'reputacion', None)
+    if rep is None or not rep.calificaciones:
+        return None
+    return {'puntaje': round(rep.puntaje, 1), 'calificaciones': rep.calificaciones}
+
 
 @login_required
 def buscar_productos(request):
     texto = request.GET.get("q", "")
-    productos = Producto.objects.filter(
-        Q(nombre__icontains=texto) |
-        Q(usuario__username__icontains=texto)
-    ).order_by("-id")[:100]
 
+    def calcular():
+        lista = []
+        for p in busqueda.buscar(texto, limite=100):
+            lista.append({
+                "id": p.id,
+                "nombre": p.nombre,
+                "descripcion": p.descripcion[:120] + ("..." if len(p.descripcion) > 120 else ""),
+                "usuario": p.usuario.username,
+                "usuario_id": p.usuario_id,
+                "reputacion": _reputacion(p.usuario),
+                "imagen": p.miniatura_tarjeta if p.imagen else static("img/logo.png"),
+                "variantes": {f: p.imagen_urls(f) for f in imagenes.formatos_disponibles()} if p.imagen else {},
+            })
+        return lista
+
+    # el resultado se comparte entre usuarios; es_dueno se calcula por request
+    consulta = ' '.join(busqueda.normalizar(texto).split())
     lista = []
-    for p in productos:
-        lista.append({
-            "id": p.id,
-            "nombre": p.nombre,
-            "descripcion": p.descripcion[:120] + ("..." if len(p.descripcion) > 120 else ""),
-            "usuario": p.usuario.username,
-            "imagen": p.imagen.url if p.imagen else "/static/img/logo.png",
-            "es_dueno": (request.user == p.usuario) or (request.user.username == "admin3000"),
-        })
+    for p in cache.cacheado(['productos'], f'busqueda:{consulta}', calcular):
+        p = dict(p)
+        p["es_dueno"] = (request.user.id == p.pop("usuario_id")) or (request.user.username == "admin3000")
+        lista.append(p)
 
     return JsonResponse({"productos": lista})
 
 # ---------- CHAT ----------
+MENSAJES_POR_PAGINA = 50
+MENSAJES_LIMITE_MAXIMO = 200
+
+
+def _consulta_mensajes(chat, since_id, before_id, limite):
+    # Recorre el índice (chat_id, id): con since_id trae solo lo nuevo,
+    # con before_id la página anterior y sin cursor los últimos mensajes.
+    # chat puede ser la instancia o su id.
+    qs = Mensaje.objects.filter(chat=chat).select_related('autor')
+    if since_id:
+        return qs.filter(id__gt=since_id).order_by('id')[:limite + 1]
+    if before_id:
+        qs = qs.filter(id__lt=before_id)
+    return qs.order_by('-id')[:limite + 1]
+
+
+def _recortar_pagina(msgs, since_id, limite):
+    hay_mas = len(msgs) > limite
+    msgs = msgs[:limite]
+    if not since_id:
+        msgs.reverse()
+    return msgs, hay_mas
+
+
+# Lo que ya no está en la tabla caliente se completa desde los bloques de
+# archivo.py: hacia atrás si la página quedó corta, hacia adelante si
+# since_id cae en lo archivado.
+def _pagina_mensajes(chat, since_id=0, before_id=0, limite=MENSAJES_POR_PAGINA):
+    msgs = list(_consulta_mensajes(chat, since_id, before_id, limite))
+    if archivo.puede_faltar(msgs, since_id, limite):
+        msgs = archivo.completar(getattr(chat, 'pk', chat), msgs, since_id, before_id, limite)
+    return _recortar_pagina(msgs, since_id, limite)
+
+
+async def _apagina_mensajes(chat, since_id=0, before_id=0, limite=MENSAJES_POR_PAGINA):
+    msgs = [m async for m in _consulta_mensajes(chat, since_id, before_id, limite)]
+    if archivo.puede_faltar(msgs, since_id, limite):
+        msgs = await sync_to_async(archivo.completar)(getattr(chat, 'pk', chat), msgs, since_id, before_id, limite)
+    return _recortar_pagina(msgs, since_id, limite)
+
+
+def _serializar_mensaje(m):
+    return {
+        'id': m.id,
+        'autor': m.autor.username,
+        'contenido': m.contenido,
+        'fecha': localtime(m.fecha).strftime('%d/%m/%Y %H:%M'),
+    }
+
+
 @login_required
 def chat_list_view(request):
-    chats = Chat.objects.filter(usuarios=request.user).order_by('-creado')  # más recientes primero
+    chats = bandeja.chats_de(request.user.id)  # actividad más reciente primero
     return render(request, 'chat.html', {'chats': chats})
 
 
 @login_required
 def chat_detalle(request, chat_id):
-    chat = get_object_or_404(Chat, id=chat_id)
-    if request.user not in chat.usuarios.all():
+    chat = get_object_or_404(Chat.objects.select_related('trueque__producto'), id=chat_id)
+    if not bandeja.es_participante(chat.id, request.user.id):
         return HttpResponseForbidden("No tienes acceso a este chat.")
-    mensajes = chat.mensajes.all().order_by('fecha')
+    mensajes, hay_mas = _pagina_mensajes(chat, limite=MENSAJES_POR_PAGINA)
+    if mensajes:
+        bandeja.marcar_leido(chat.id, request.user.id, mensajes[-1].id)
     form = MensajeForm()
     return render(request, 'chat.html', {
         'chat': chat,
         'mensajes': mensajes,
+        'hay_mas_mensajes': hay_mas,
         'form': form,
-        'chats': Chat.objects.filter(usuarios=request.user).order_by('-creado'),  # orden descendente
+        'chats': bandeja.chats_de(request.user.id),  # actividad más reciente primero
         'chat_seleccionado': chat
     })
 
 
-@login_required
+def _sin_acceso_al_chat(chat_id):
+    # solo en el camino de error: distingue chat inexistente de ajeno
+    if not Chat.objects.filter(id=chat_id).exists():
+        return JsonResponse({'ok': False, 'error': 'Chat no encontrado'}, status=404)
+    return JsonResponse({'ok': False, 'error': 'No autorizado'}, status=403)
+
+
+async def _asin_acceso_al_chat(chat_id):
+    if not await Chat.objects.filter(id=chat_id).aexists():
+        return JsonResponse({'ok': False, 'error': 'Chat no encontrado'}, status=404)
+    return JsonResponse({'ok': False, 'error': 'No autorizado'}, status=403)
+
+
+# Las APIs del chat y de notificaciones son async: servidas por
+# SwapPlace/asgi.py, una petición que espera (?wait=) no ocupa un hilo.
+CHAT_ESPERA_MAXIMA = 25
+
+
+def _espera(request, maximo):
+    try:
+        return min(max(float(request.GET.get('wait', 0)), 0), maximo)
+    except ValueError:
+        return 0
+
+
+@login_requerido_async
 @csrf_exempt
-def api_send_message(request, chat_id):
-    if request.method == 'POST':
-        try:
-            data = json.loads(request.body.decode('utf-8'))
-        except json.JSONDecodeError:
-            return JsonResponse({'ok': False, 'error': 'Formato JSON inválido'}, status=400)
-        texto = data.get('texto', '').strip()
-        if not texto:
-            return JsonResponse({'ok': False, 'error': 'Mensaje vacío'}, status=400)
-        chat = get_object_or_404(Chat, id=chat_id)
-        mensaje = Mensaje.objects.create(chat=chat, autor=request.user, contenido=texto)
-        return JsonResponse({
-            'ok': True,
-            'mensaje': {
-                'id': mensaje.id,
-                'autor': mensaje.autor.username,
-                'contenido': mensaje.contenido,
-                'fecha': localtime(mensaje.fecha).strftime('%d/%m/%Y %H:%M')
-            }
-        })
-    return JsonResponse({'ok': False, 'error': 'Método no permitido'}, status=405)
+async def api_send_message(request, chat_id):
+    if request.method != 'POST':
+        return JsonResponse({'ok': False, 'error': 'Método no permitido'}, status=405)
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+    except json.JSONDecodeError:
+        return JsonResponse({'ok': False, 'error': 'Formato JSON inválido'}, status=400)
+    texto = data.get('texto', '').strip()
+    if not texto:
+        return JsonResponse({'ok': False, 'error': 'Mensaje vacío'}, status=400)
+    user = await request.auser()
+    if not await bandeja.aes_participante(chat_id, user.id):
+        return await _asin_acceso_al_chat(chat_id)
+    # transacción: el mensaje y la bandeja se escriben juntos en un hilo
+    mensaje = await sync_to_async(bandeja.crear_mensaje)(chat_id, user, texto)
+    datos = _serializar_mensaje(mensaje)
+    tiempo_real.publicar(tiempo_real.canal_chat(chat_id), datos)
+    return JsonResponse({'ok': True, 'mensaje': datos})
+
+
+@login_requerido_async
+async def api_fetch_messages(request, chat_id):
+    # ?wait=<segundos> junto con since_id espera (long-poll) al próximo mensaje
+    user = await request.auser()
+    if not await bandeja.aes_participante(chat_id, user.id):
+        return await _asin_acceso_al_chat(chat_id)
+    try:
+        since_id = int(request.GET.get('since_id', 0))
+        before_id = int(request.GET.get('before_id', 0))
+        limite = int(request.GET.get('limit', MENSAJES_POR_PAGINA))
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros inválidos'}, status=400)
+    limite = max(1, min(limite, MENSAJES_LIMITE_MAXIMO))
+    espera = _espera(request, CHAT_ESPERA_MAXIMA)
+
+    msgs, hay_mas = await _apagina_mensajes(chat_id, since_id=since_id, before_id=before_id, limite=limite)
+    if espera and since_id and not msgs:
+        with tiempo_real.obtener_broker().suscribir(tiempo_real.canal_chat(chat_id)) as suscripcion:
+            # se vuelve a mirar ya suscritos: lo publicado entremedio no se pierde
+            msgs, hay_mas = await _apagina_mensajes(chat_id, since_id=since_id, limite=limite)
+            if not msgs and await suscripcion.esperar_async(espera):
+                msgs, hay_mas = await _apagina_mensajes(chat_id, since_id=since_id, limite=limite)
+    if since_id and msgs:
+        await sync_to_async(bandeja.marcar_leido)(chat_id, user.id, msgs[-1].id)
+    return JsonResponse({
+        'mensajes': [_serializar_mensaje(m) for m in msgs],
+        'hay_mas': hay_mas,
+    })
 
 
-@login_required
-def api_fetch_messages(request, chat_id):
-    chat = get_object_or_404(Chat, id=chat_id)
-    if request.user not in chat.usuarios.all():
+SSE_LATIDO_SEGUNDOS = 25
+
+
+async def _eventos_chat(suscripcion):
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            eventos = await suscripcion.esperar_async(SSE_LATIDO_SEGUNDOS)
+            if not eventos:
+                # comentario SSE para que proxies no corten la conexión
+                yield ': latido\n\n'
+                continue
+            for m in eventos:
+                yield f"id: {m['id']}\nevent: mensaje\ndata: {json.dumps(m)}\n\n"
+    finally:
+        suscripcion.cerrar()
+
+
+async def api_stream_chat(request, chat_id):
+    # Server-Sent Events: solo tiene sentido servido por SwapPlace/asgi.py.
+    # Bajo WSGI se responde 503 y el cliente vuelve al polling.
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'error': 'No autenticado'}, status=401)
+    if not hasattr(request, 'scope'):
+        return JsonResponse({'error': 'Streaming no disponible'}, status=503)
+    if not await bandeja.aes_participante(chat_id, user.id):
         return JsonResponse({'error': 'No autorizado'}, status=403)
-    msgs = chat.mensajes.all().order_by('fecha')
-    datos = [{
-        'id': m.id,
-        'autor': m.autor.username,
-        'contenido': m.contenido,
-        'fecha': m.fecha.strftime("%d/%m/%Y %H:%M")
-    } for m in msgs]
-    return JsonResponse({'mensajes': datos})
+    suscripcion = tiempo_real.obtener_broker().suscribir(tiempo_real.canal_chat(chat_id))
+    response = StreamingHttpResponse(_eventos_chat(suscripcion), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 # ---------- NOTIFICACIONES ----------
-@login_required
-def api_notificaciones(request):
-    user = request.user
-    notifs = Notificacion.objects.filter(usuario=user, visible=True).order_by('-creado')[:20]
+NOTIF_ESPERA_MAXIMA = 25
+
+
+@login_requerido_async
+async def api_notificaciones(request):
+    # ?since=<version> o If-None-Match evitan la consulta si nada cambió;
+    # con ?wait=<segundos> la petición espera (long-poll) a que llegue algo.
+    user = await request.auser()
+    since = request.GET.get('since')
+    if_none_match = request.headers.get('If-None-Match')
+    espera = _espera(request, NOTIF_ESPERA_MAXIMA)
+
+    def al_dia(v):
+        return since == str(v) or if_none_match == notificaciones.etag(user.id, v)
+
+    version = await notificaciones.aversion(user.id)
+    if espera and al_dia(version):
+        with tiempo_real.obtener_broker().suscribir(notificaciones.canal(user.id)) as suscripcion:
+            version = await notificaciones.aversion(user.id)
+            if al_dia(version):
+                await suscripcion.esperar_async(espera)
+                version = await notificaciones.aversion(user.id)
+
+    etag = notificaciones.etag(user.id, version)
+    if al_dia(version):
+        if if_none_match == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = JsonResponse({'version': version, 'sin_cambios': True})
+        response['ETag'] = etag
+        return response
+
+    notifs = Notificacion.objects.filter(usuario_id=user.id, visible=True).order_by('-creado')[:20]
     ahora = timezone.now()
     datos = []
-    for n in notifs:
+    async for n in notifs:
         edad = (ahora - n.creado).total_seconds()
         datos.append({
             'id': n.id,
@@ -377,30 +590,55 @@ def api_notificaciones(request):
             'creado_iso': n.creado.isoformat(),
             'edad_segundos': int(edad),
         })
-    return JsonResponse({'notificaciones': datos})
+    response = JsonResponse({
+        'notificaciones': datos,
+        'no_leidas': await notificaciones.ano_leidas(user.id),
+        'version': version,
+    })
+    response['ETag'] = etag
+    return response
 
 
 @login_required
 @require_POST
 def api_marcar_leida(request):
-    nid = request.POST.get('id')
     try:
-        n = Notificacion.objects.get(id=nid, usuario=request.user)
-        n.visible = False
-        n.save()
-        return JsonResponse({'ok': True})
-    except Notificacion.DoesNotExist:
+        nid = int(request.POST.get('id'))
+    except (TypeError, ValueError):
         return JsonResponse({'ok': False, 'error': 'No encontrada'}, status=404)
+    if not notificaciones.marcar_leidas(request.user.id, ids=[nid]):
+        # ya estaba leída (ok) o no es del usuario
+        if not Notificacion.objects.filter(id=nid, usuario=request.user).exists():
+            return JsonResponse({'ok': False, 'error': 'No encontrada'}, status=404)
+    return JsonResponse({'ok': True})
+
+
+@login_required
+@require_POST
+def api_marcar_todas(request):
+    # ?hasta_id=N marca solo hasta la última que el cliente alcanzó a ver
+    hasta_id = request.POST.get('hasta_id')
+    if hasta_id:
+        try:
+            hasta_id = int(hasta_id)
+        except ValueError:
+            return JsonResponse({'ok': False, 'error': 'hasta_id inválido'}, status=400)
+    else:
+        hasta_id = None
+    marcadas = notificaciones.marcar_leidas(request.user.id, hasta_id=hasta_id)
+    return JsonResponse({'ok': True, 'marcadas': marcadas, 'no_leidas': notificaciones.no_leidas(request.user.id)})
 
 
 # ---------- NUEVAS FUNCIONES: REPORTAR Y CALIFICAR ----------
 @login_required
 @require_POST
 def reportar_chat(request, chat_id):
-    chat = get_object_or_404(Chat, id=chat_id)
-    if request.user not in chat.usuarios.all():
-        return JsonResponse({'ok': False, 'error': 'No autorizado'}, status=403)
+    if not bandeja.es_participante(chat_id, request.user.id):
+        return _sin_acceso_al_chat(chat_id)
 
+    _, creado = reputacion.reportar(chat_id, request.user, request.POST.get('motivo', '').strip())
+    if not creado:
+        return JsonResponse({'ok': True, 'mensaje': 'Ya habías reportado esta conversación; la estamos revisando.'})
     mensaje_texto = (
         "El equipo de soporte de Swap Place estará revisando su conversación "
         "en busca de la razón del reporte. Gracias por avisar. "
@@ -413,9 +651,8 @@ def reportar_chat(request, chat_id):
 @login_required
 @require_POST
 def calificar_chat(request, chat_id):
-    chat = get_object_or_404(Chat, id=chat_id)
-    if request.user not in chat.usuarios.all():
-        return JsonResponse({'ok': False, 'error': 'No autorizado'}, status=403)
+    if not bandeja.es_participante(chat_id, request.user.id):
+        return _sin_acceso_al_chat(chat_id)
     rating = request.POST.get('rating')
     try:
         rating = int(rating)
@@ -424,4 +661,16 @@ def calificar_chat(request, chat_id):
     if rating < 1 or rating > 5:
         return JsonResponse({'ok': False, 'error': 'Fuera de rango'}, status=400)
 
-    return JsonResponse({'ok': True, 'mensaje': f'Calificación de {rating} estrellas registrada correctamente.'})
+    _, creada = reputacion.calificar(chat_id, request.user, rating)
+    accion = 'registrada' if creada else 'actualizada'
+    return JsonResponse({'ok': True, 'mensaje': f'Calificación de {rating} estrellas {accion} correctamente.'})
+
+
+# ---------- MÉTRICAS ----------
+@staff_member_required
+def api_metricas(request):
+    return JsonResponse({
+        'vistas': perfilado.resumen(),
+        'cache': cache.estadisticas(),
+        'limites': limites.estadisticas(),
+    })
@@ -3,6 +3,11 @@ ASGI config for SwapPlace project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The chat stream (``/api/chat/<id>/stream/``, Server-Sent Events) only works
+when the project is served through this entry point, e.g.
+``uvicorn SwapPlace.asgi:application``. Under WSGI the chat page falls back
+to polling.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
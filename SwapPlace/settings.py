@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,11 +42,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'SwapApp.perfilado.PerfiladoMiddleware',
+    'SwapApp.compresion.CompresionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'SwapApp.identidad.IdentidadCacheadaMiddleware',
+    'SwapApp.routers.ReplicasMiddleware',
+    'SwapApp.limites.LimitesMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -54,7 +60,7 @@ ROOT_URLCONF = 'SwapPlace.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'SwapApp.perfilado.DjangoTemplatesPerfilados',
         'DIRS': [TEMPLATE_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -63,6 +69,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'SwapApp.context_processors.notificaciones',
             ],
         },
     },
@@ -82,9 +89,26 @@ DATABASES = {
         'PASSWORD': '',
         'HOST': 'localhost',
         'PORT': '3306',
+        # conexiones persistentes: se reutilizan entre requests y se
+        # verifican antes de usarse si estuvieron inactivas
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Réplicas de lectura, p.ej. SWAPPLACE_DB_REPLICAS="10.0.0.2,10.0.0.3" (mismo
+# usuario y base que default). En local sirve otra base MySQL o un archivo
+# SQLite: SWAPPLACE_DB_REPLICAS="sqlite:/ruta/replica.sqlite3".
+for _i, _destino in enumerate(filter(None, os.environ.get('SWAPPLACE_DB_REPLICAS', '').split(',')), 1):
+    if _destino.startswith('sqlite:'):
+        _replica = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': _destino[len('sqlite:'):]}
+    else:
+        _replica = {**DATABASES['default'], 'HOST': _destino}
+    # en los tests la réplica es un espejo de default
+    DATABASES[f'replica{_i}'] = {**_replica, 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['SwapApp.routers.RouterReplicas']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -122,6 +146,8 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / "static"]
+# collectstatic deja aquí los archivos con huella y sus .gz/.br (ver SwapApp/estaticos.py)
+STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
@@ -133,3 +159,125 @@ LOGOUT_REDIRECT_URL = 'login'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Subidas direccionadas por contenido (ver SwapApp/media.py): nombres que
+# nunca cambian de contenido, servidos con caché inmutable. limpiar_media
+# borra los archivos que llevan GRACIA segundos sin ningún producto.
+STORAGES = {
+    'default': {'BACKEND': 'SwapApp.media.AlmacenPorContenido'},
+    'staticfiles': {'BACKEND': 'SwapApp.estaticos.AlmacenEstatico'},
+}
+SWAPPLACE_MEDIA = {
+    'GRACIA': 3600,
+}
+
+# Compresión gzip de HTML y JSON (los estáticos ya van precomprimidos)
+SWAPPLACE_COMPRESION = {
+    'MIN_BYTES': 1024,
+    'TIPOS': ('text/html', 'application/json'),
+}
+
+# Tiempo real (SSE del chat). El broker local solo sirve para un proceso;
+# con varios workers hay que apuntar a un broker compartido.
+SWAPPLACE_BROKER = 'SwapApp.tiempo_real.BrokerLocal'
+
+# Búsqueda de productos: 'auto' usa FULLTEXT en MySQL y el índice invertido
+# en cualquier otra base de datos (p.ej. SQLite en los tests).
+SWAPPLACE_BUSQUEDA = 'auto'
+
+# Pool de tareas en segundo plano (variantes de imagen, etc.).
+SWAPPLACE_TAREAS_WORKERS = 2
+SWAPPLACE_TAREAS_SINCRONAS = False
+
+# Caché de fragmentos del home, barra de chats y resultados de búsqueda.
+# Para compartirla entre procesos: 'SwapApp.cache.CacheDjango' con
+# OPCIONES {'alias': 'default'} y un backend compartido en CACHES.
+SWAPPLACE_CACHE = {
+    'BACKEND': 'SwapApp.cache.CacheLRU',
+    'OPCIONES': {'max_entradas': 1000, 'ttl': 300},
+}
+
+# Perfilado por request (Server-Timing + histogramas en /api/metricas/).
+# En producción: ACTIVO True con un MUESTREO bajo, p.ej. 0.05.
+SWAPPLACE_PERFILADO = {
+    'ACTIVO': DEBUG,
+    'MUESTREO': 1.0,
+    'CABECERA': True,
+}
+
+# True: las notificaciones se guardan en el pool de tareas tras el commit.
+SWAPPLACE_NOTIFICACIONES_DIFERIDAS = False
+
+# Sesiones: se leen de la caché y se escriben también en la base de datos.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Vistas de polling que resuelven al usuario desde la caché, sin leer la
+# tabla de usuarios. Con varios procesos CACHE debe ser un alias compartido.
+SWAPPLACE_IDENTIDAD = {
+    'CACHE': 'default',
+    'TTL': 300,
+    'VISTAS': [
+        'api_fetch_messages',
+        'api_send_message',
+        'api_stream_chat',
+        'api_notificaciones',
+        'api_marcar_leida',
+        'api_marcar_todas',
+    ],
+}
+
+# Vistas de solo lectura que leen de las réplicas (ver SwapApp/routers.py).
+# Tras escribir, la sesión lee del primario durante RETRASO_MAXIMO segundos.
+SWAPPLACE_REPLICAS = {
+    'ALIAS': [alias for alias in DATABASES if alias.startswith('replica')],
+    'VISTAS': ['home', 'api_productos', 'buscar_productos', 'api_fetch_messages', 'api_notificaciones'],
+    'RETRASO_MAXIMO': 2,
+    'SALUD_CADA': 5,
+    'CACHE': 'default',
+}
+
+# Respuestas guardadas para reintentos con la misma Idempotency-Key
+# (ver SwapApp/decoradores.py). Con varios procesos CACHE debe ser compartida.
+SWAPPLACE_IDEMPOTENCIA = {
+    'CACHE': 'default',
+    'TTL': 24 * 3600,
+    'ESPERA': 5,
+}
+
+# Límite de peticiones por usuario y vista (ver SwapApp/limites.py): RAFAGA
+# peticiones seguidas y luego POR_MINUTO. El almacén local cuenta por
+# proceso; para un límite global: 'SwapApp.limites.AlmacenCache' con
+# OPCIONES {'alias': ...} sobre una caché compartida.
+SWAPPLACE_LIMITES = {
+    'ACTIVO': True,
+    'BACKEND': 'SwapApp.limites.AlmacenLocal',
+    'OPCIONES': {'max_claves': 100_000},
+    'POLITICAS': {
+        'api_send_message': {'RAFAGA': 10, 'POR_MINUTO': 60},
+        'buscar_productos': {'RAFAGA': 20, 'POR_MINUTO': 120},
+        'ofrecer_trueque': {'RAFAGA': 10, 'POR_MINUTO': 30},
+    },
+}
+
+# Archivo de mensajes (ver SwapApp/archivo.py): archivar_mensajes comprime
+# por chat los mensajes de más de DIAS días, salvo los RETENER más nuevos.
+SWAPPLACE_ARCHIVO = {
+    'DIAS': 90,
+    'RETENER': 200,
+    'TAMANO_BLOQUE': 500,
+}
+
+# Puntaje bayesiano de reputación: PRIOR_PESO calificaciones ficticias de PRIOR_MEDIA
+SWAPPLACE_REPUTACION = {
+    'PRIOR_MEDIA': 3.5,
+    'PRIOR_PESO': 5,
+}
+
+# Sugerencias de intercambio (ver SwapApp/emparejamiento.py): ciclos de hasta
+# LARGO_MAXIMO usuarios; cada proceso rearma su grafo cada MAX_EDAD segundos.
+SWAPPLACE_EMPAREJAMIENTO = {
+    'LARGO_MAXIMO': 4,
+    'MAX_EDAD': 300,
+    'LIMITE': 20,
+    'CACHE': 'default',
+}
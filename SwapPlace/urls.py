@@ -1,12 +1,15 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
+
+from SwapApp import estaticos, media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('SwapApp.urls')),
+    # también fuera de DEBUG: caché inmutable y Range (detrás de un proxy,
+    # que este replique las mismas cabeceras si sirve /media/ directo)
+    path(settings.MEDIA_URL.lstrip('/') + '<path:ruta>', media.servir, name='media'),
+    # lo mismo para /static/: nombres con huella inmutables y variantes .br/.gz
+    path(settings.STATIC_URL.lstrip('/') + '<path:ruta>', estaticos.servir, name='estaticos'),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)